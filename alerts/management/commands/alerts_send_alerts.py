@@ -1,16 +1,115 @@
+from collections import defaultdict
 from dateutil import parser
 from datetime import datetime, timedelta
+import json
+
 from django.core.management.base import BaseCommand
-from django.utils.translation import ugettext_lazy as _, ungettext_lazy as _n, activate
+from django.utils.translation import ugettext_lazy as _, ungettext_lazy as _n
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.core.urlresolvers import reverse
 from django.template.loader import render_to_string
 from django.utils.translation import override
 
-from alerts.models import Alert
+from notifications.models import Notification
+
+from alerts.models import Alert, QueuedLoggedAction
+
+
+def get_action_objects(notifications):
+    """Return the action object of each notification, fetched in bulk
+
+    The result maps (content type ID, object ID) to the object; the
+    keys of objects that no longer exist are missing."""
+    content_type_id_to_object_ids = defaultdict(set)
+    for n in notifications:
+        content_type_id_to_object_ids[n.action_object_content_type_id].add(
+            n.action_object_object_id)
+    action_objects = {}
+    for content_type_id, object_ids in content_type_id_to_object_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        for pk, o in model._default_manager.in_bulk(list(object_ids)).items():
+            action_objects[(content_type_id, str(pk))] = o
+    return action_objects
+
+
+class DigestBuilder(object):
+    """Build the text of alert emails, sharing work between recipients
+
+    Each person's URL and each diff are only rendered once, however
+    many people are being sent them."""
+
+    def __init__(self):
+        protocol = 'http'
+        if getattr(settings, 'ACCOUNT_DEFAULT_HTTP_PROTOCOL', None) == 'https':
+            protocol = 'https'
+        self.base_url = '{0}://{1}'.format(
+            protocol, Site.objects.get_current().domain)
+        self.urls = {}
+        self.diffs = {}
+
+    def get_url(self, person):
+        if person.id not in self.urls:
+            self.urls[person.id] = self.base_url + reverse(
+                'person-view', kwargs={'person_id': person.id})
+        return self.urls[person.id]
+
+    def get_diff(self, changes):
+        key = json.dumps(changes, sort_keys=True)
+        if key not in self.diffs:
+            context = {'changes': dict(changes)}
+            context['changes']['timestamp'] = parser.parse(changes['timestamp'])
+            diff = render_to_string('alerts/pretty_diff.txt', context=context)
+            # remove extra blank lines
+            self.diffs[key] = "\n".join(
+                [ll.rstrip() for ll in diff.splitlines() if ll.strip()])
+        return self.diffs[key]
+
+    def build(self, events, action_objects):
+        """Return the text of an email about these notifications
+
+        'events' should be ordered by their action object."""
+        details = ""
+        current_object = None
+        no_change_count = 0
+        change_count = 0
+        for event in events:
+            action_object = action_objects[(
+                event.action_object_content_type_id,
+                event.action_object_object_id,
+            )]
+            if action_object != current_object:
+                if current_object is not None:
+                    details += "\n"
+                details += _('Changes to {0}\n').format(action_object)
+                details += "{0}\n".format(self.get_url(action_object))
+                current_object = action_object
+            if event.data and event.data['changes'] is not None:
+                details += "\n{0}\n".format(
+                    self.get_diff(event.data['changes']))
+                change_count += 1
+            else:
+                no_change_count += 1
+
+        if no_change_count > 0:
+            if change_count > 0:
+                desc = _n(
+                    "And %(no_change_count)d change we don't have details of",
+                    "And %(no_change_count)d changes we don't have details of",
+                    no_change_count
+                ) % {'no_change_count': no_change_count}
+            else:
+                desc = _n(
+                    "There has been %(no_change_count)d change we don't have details of",
+                    "There have been %(no_change_count)d changes we don't have details of",
+                    no_change_count
+                ) % {'no_change_count': no_change_count}
+
+            details += "\n{0}\n".format(desc)
+        return details
 
 
 class Command(BaseCommand):
@@ -27,8 +126,16 @@ class Command(BaseCommand):
             action='store_true',
             help='Send daily alerts'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='How many emails to send at a time'
+        )
 
     def handle(self, **options):
+        # Notify everyone watching the people changed since the last run:
+        QueuedLoggedAction.objects.process()
         with override(settings.LANGUAGE_CODE):
             if options['hourly']:
                 last_sent = datetime.utcnow() - timedelta(hours=1)
@@ -37,88 +144,71 @@ class Command(BaseCommand):
                 last_sent = datetime.utcnow() - timedelta(days=1)
                 frequency = 'daily'
 
-            alerts = Alert.objects.filter(
-                frequency=frequency,
-                last_sent__lt=last_sent
-            )
-
             """
             at the moment this means that if a user has multiple alerts set up
             they will get all of them in the same email, even if they have set
             up one alert to be daily and one to be hourly
             """
-            for alert in alerts:
-                events = alert.user.notifications.unread() \
-                    .order_by('action_object_content_type', 'action_object_object_id')
-
-                details = ""
-                current_object = ''
-                if events.count() > 0:
-                    no_change_count = 0
-                    change_count = 0
-                    for event in events:
-                        if event.action_object != current_object:
-                            if current_object != '':
-                                details += "\n"
-                            details += _('Changes to {0}\n').format(event.action_object)
-                            domain = Site.objects.get_current().domain
-                            path = reverse(
-                                'person-view',
-                                kwargs={'person_id': event.action_object.id}
-                            )
-                            protocol = 'http'
-                            if hasattr(settings, 'ACCOUNT_DEFAULT_HTTP_PROTOCOL') and \
-                                settings.ACCOUNT_DEFAULT_HTTP_PROTOCOL == 'https':
-                                protocol = 'https'
-                            details += "{0}://{1}{2}\n".format(
-                                protocol,
-                                domain,
-                                path
-                            )
-                            current_object = event.action_object
-                        if event.data:
-                            if event.data['changes'] is not None:
-                                timestamp = parser.parse(event.data['changes']['timestamp'])
-                                event.data['changes']['timestamp'] = timestamp
-                                diff = render_to_string('alerts/pretty_diff.txt', context=event.data)
-                                # remove extra blank lines
-                                diff = "\n".join([ll.rstrip() for ll in diff.splitlines() if ll.strip()])
-                                details += "\n{0}\n".format(diff)
-                                change_count += 1
-                            else:
-                                no_change_count += 1
-                        else:
-                            no_change_count += 1
-
-                    if no_change_count > 0:
-                        if change_count > 0:
-                            desc = _n(
-                                "And %(no_change_count)d change we don't have details of",
-                                "And %(no_change_count)d changes we don't have details of",
-                                no_change_count
-                            ) % {'no_change_count': no_change_count}
-                        else:
-                            desc = _n(
-                                "There has been %(no_change_count)d change we don't have details of",
-                                "There have been %(no_change_count)d changes we don't have details of",
-                                no_change_count
-                            ) % {'no_change_count': no_change_count}
-
-                        details += "\n{0}\n".format(desc)
-
-                    recipients = [alert.user.email]
-                    has_sent = send_mail(
-                        _("Recent activity on {0}").format(
-                            Site.objects.get_current().name
-                        ),
-                        details,
+            user_id_to_alert_ids = defaultdict(list)
+            for alert_id, user_id in Alert.objects.filter(
+                    frequency=frequency,
+                    last_sent__lt=last_sent
+            ).values_list('id', 'user_id'):
+                user_id_to_alert_ids[user_id].append(alert_id)
+
+            # Every user's unread notifications are fetched at once:
+            notifications = list(
+                Notification.objects.filter(
+                    recipient_id__in=list(user_id_to_alert_ids),
+                    unread=True,
+                ).select_related('recipient').order_by(
+                    'recipient', 'action_object_content_type',
+                    'action_object_object_id', '-timestamp'
+                )
+            )
+            action_objects = get_action_objects(notifications)
+            user_id_to_events = defaultdict(list)
+            for n in notifications:
+                user_id_to_events[n.recipient_id].append(n)
+
+            builder = DigestBuilder()
+            subject = _("Recent activity on {0}").format(
+                Site.objects.get_current().name
+            )
+            digests = []
+            for user_id, events in sorted(user_id_to_events.items()):
+                # Notifications about objects that have since been
+                # deleted are just marked as read:
+                events_to_send = [
+                    e for e in events if (
+                        e.action_object_content_type_id,
+                        e.action_object_object_id,
+                    ) in action_objects
+                ]
+                message = None
+                if events_to_send:
+                    message = EmailMessage(
+                        subject,
+                        builder.build(events_to_send, action_objects),
                         settings.DEFAULT_FROM_EMAIL,
-                        recipients,
-                        fail_silently=False,
+                        [events[0].recipient.email],
                     )
+                digests.append((user_id, events, message))
 
-                    if has_sent:
-                        alert.last_sent = datetime.utcnow()
-                        alert.save()
-
-                        events.mark_all_as_read()
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            try:
+                batch_size = options['batch_size']
+                for i in range(0, len(digests), batch_size):
+                    batch = digests[i:i + batch_size]
+                    connection.send_messages(
+                        [d[2] for d in batch if d[2] is not None])
+                    Alert.objects.filter(pk__in=[
+                        alert_id for d in batch
+                        for alert_id in user_id_to_alert_ids[d[0]]
+                    ]).update(last_sent=datetime.utcnow())
+                    Notification.objects.filter(pk__in=[
+                        event.id for d in batch for event in d[1]
+                    ]).update(unread=False)
+            finally:
+                connection.close()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0044_personsearchupdate'),
+        ('alerts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedLoggedAction',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('verb', models.CharField(max_length=100)),
+                ('queued', models.DateTimeField(auto_now_add=True)),
+                ('logged_action', models.ForeignKey(to='candidates.LoggedAction')),
+            ],
+        ),
+    ]
@@ -1,15 +1,17 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from collections import defaultdict
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
-from notifications.signals import notify
+from notifications.models import Notification
 
-from popolo.models import Membership
-from candidates.models import PostExtra, LoggedAction
+from compat import text_type
+from popolo.models import Area, Membership, Organization, Person
+from candidates.models import LoggedAction, PersonVersion
 
 
 class Alert(models.Model):
@@ -46,99 +48,170 @@ class Alert(models.Model):
     enabled = models.BooleanField(default=True)
 
 
-def send_person_signals(sender, instance, created, **kwargs):
-    """
-    This creates the notifications we use to send email alerts of
-    changes to people
-    """
-    if instance.action_type not in (
-        'person-update', 'person-create'
-    ):
-        return
+def get_changes(logged_actions):
+    """Return the diffs recorded for each logged action, by its ID
+
+    These come from the stored diffs of the version that each action
+    recorded (or the person's latest version, if it didn't record
+    one).  If a person has no versions this is None, which happens in
+    tests that don't bother creating them."""
+    person_ids = set(la.person_id for la in logged_actions)
+    latest_versions = {}
+    versions_by_id = {}
+    for person_version in PersonVersion.objects.filter(
+            person_id__in=person_ids).defer('data').order_by('id'):
+        latest_versions[person_version.person_id] = person_version
+        versions_by_id[
+            (person_version.person_id, person_version.version_id)
+        ] = person_version
+    changes = {}
+    for la in logged_actions:
+        person_version = versions_by_id.get(
+            (la.person_id, la.popit_person_new_version),
+            latest_versions.get(la.person_id)
+        )
+        if person_version is None:
+            changes[la.id] = None
+        elif person_version.diffs:
+            changes[la.id] = person_version.as_version_with_diffs()
+        else:
+            # Its diffs haven't been backfilled yet:
+            changes[la.id] = next(
+                version_diff
+                for version_diff in person_version.person.extra.version_diffs
+                if version_diff['version_id'] == person_version.version_id
+            )
+    return changes
 
-    person = instance.person
-    content_type = ContentType.objects.get_for_model(person)
-    verb = 'updated'
-    if created:
-        verb = 'created'
 
-    alerts = Alert.objects.filter(
-        target_content_type=content_type,
-        target_object_id=person.id
-    )
+def get_alerted_user_ids(model, object_ids):
+    """Return the IDs of users with alerts for each of these objects"""
+    object_id_to_user_ids = defaultdict(set)
+    for object_id, user_id in Alert.objects.filter(
+            target_content_type=ContentType.objects.get_for_model(model),
+            target_object_id__in=[text_type(i) for i in object_ids],
+    ).values_list('target_object_id', 'user_id'):
+        object_id_to_user_ids[int(object_id)].add(user_id)
+    return object_id_to_user_ids
 
-    users_alerted = set()
-
-    # This is here to make writing tests a bit easier as
-    # it means you don't need to create a versions object
-    # or add an extra if it's not required
-    try:
-        changes = person.extra.version_diffs[0]
-    except (IndexError, ObjectDoesNotExist):
-        changes = None
-
-    for alert in alerts:
-        if alert.user not in users_alerted:
-            users_alerted.add(alert.user)
-            notify.send(
-                instance.user,
-                action_object=person,
-                verb=verb,
-                recipient=alert.user,
-                changes=changes
-            )
 
+def get_person_watchers(person_ids):
+    """Return the IDs of users to alert about changes to each person
+
+    That's those with an alert for the person, or for the area of a
+    post or the party they're standing for in a current election."""
+    person_ids = set(person_ids)
+    person_id_to_user_ids = get_alerted_user_ids(Person, person_ids)
     # FIXME: this doesn't handle people being removed from an area
-    posts = PostExtra.objects.filter(
-        base__memberships__person=person,
-        elections__current=True
+    person_areas = set(
+        Membership.objects.filter(
+            person_id__in=person_ids,
+            post__extra__elections__current=True,
+            post__area__isnull=False,
+        ).values_list('person_id', 'post__area_id')
     )
-
-    for post in posts:
-        area = post.base.area
-        if area is not None:
-            content_type = ContentType.objects.get_for_model(area)
-            alerts = Alert.objects.filter(
-                target_content_type=content_type,
-                target_object_id=area.id
-            )
-
-            for alert in alerts:
-                if alert.user not in users_alerted:
-                    users_alerted.add(alert.user)
-                    notify.send(
-                        instance.user,
-                        action_object=person,
-                        verb=verb,
-                        recipient=alert.user,
-                        changes=changes
-                    )
-
+    area_id_to_user_ids = get_alerted_user_ids(
+        Area, set(area_id for _, area_id in person_areas))
+    for person_id, area_id in person_areas:
+        person_id_to_user_ids[person_id] |= area_id_to_user_ids[area_id]
     # TODO: not sure this is the correct way to do this
-    memberships = Membership.objects.filter(
-        person=person,
-        on_behalf_of__classification='Party',
-        extra__election__current=True
+    person_parties = set(
+        Membership.objects.filter(
+            person_id__in=person_ids,
+            on_behalf_of__classification='Party',
+            extra__election__current=True,
+        ).values_list('person_id', 'on_behalf_of_id')
     )
-
-    for membership in memberships:
-        party = membership.on_behalf_of
-        if party is not None:
-            content_type = ContentType.objects.get_for_model(party)
-            alerts = Alert.objects.filter(
-                target_content_type=content_type,
-                target_object_id=party.id
-            )
-
-            for alert in alerts:
-                if alert.user not in users_alerted:
-                    users_alerted.add(alert.user)
-                    notify.send(
-                        instance.user,
-                        action_object=person,
-                        verb=verb,
-                        recipient=alert.user,
-                        changes=changes
+    party_id_to_user_ids = get_alerted_user_ids(
+        Organization, set(party_id for _, party_id in person_parties))
+    for person_id, party_id in person_parties:
+        person_id_to_user_ids[person_id] |= party_id_to_user_ids[party_id]
+    return person_id_to_user_ids
+
+
+class QueuedLoggedActionQuerySet(models.QuerySet):
+
+    def process(self, batch_size=500):
+        """Create the notifications for queued logged actions, in batches
+
+        Each user watching the person changed (directly, or through
+        their area or party) gets one notification per logged action.
+        The queued rows are locked while they're processed, so two
+        processes don't notify people twice.  Returns the number of
+        notifications created."""
+        created = 0
+        person_content_type = ContentType.objects.get_for_model(Person)
+        user_content_type = ContentType.objects.get_for_model(User)
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    self.select_for_update().order_by('pk')
+                    .values_list('pk', 'logged_action_id', 'verb')[:batch_size]
+                )
+                if not rows:
+                    return created
+                logged_actions = list(
+                    LoggedAction.objects.filter(
+                        pk__in=[la_id for _, la_id, _ in rows],
+                        person__isnull=False,
+                        user__isnull=False,
                     )
+                )
+                id_to_logged_action = {la.id: la for la in logged_actions}
+                changes = get_changes(logged_actions)
+                person_id_to_user_ids = get_person_watchers(
+                    la.person_id for la in logged_actions)
+                notifications = []
+                for _, logged_action_id, verb in rows:
+                    la = id_to_logged_action.get(logged_action_id)
+                    if la is None:
+                        continue
+                    for user_id in sorted(person_id_to_user_ids[la.person_id]):
+                        notifications.append(Notification(
+                            recipient_id=user_id,
+                            actor_content_type=user_content_type,
+                            actor_object_id=la.user_id,
+                            verb=verb,
+                            action_object_content_type=person_content_type,
+                            action_object_object_id=la.person_id,
+                            timestamp=la.created,
+                            data={'changes': changes[la.id]},
+                        ))
+                Notification.objects.bulk_create(notifications)
+                self.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+                created += len(notifications)
+
+
+class QueuedLoggedAction(models.Model):
+    """A change to a person that watchers haven't been notified of yet
+
+    Saving a LoggedAction about a person just adds one of these, in
+    the same transaction, rather than working out who's watching the
+    person and notifying each of them during the edit.  The queue is
+    processed in batches by alerts_send_alerts before it sends any
+    email."""
+
+    logged_action = models.ForeignKey(LoggedAction)
+    verb = models.CharField(max_length=100)
+    queued = models.DateTimeField(auto_now_add=True)
+
+    objects = QueuedLoggedActionQuerySet.as_manager()
+
+
+def queue_person_alerts(sender, instance, created, **kwargs):
+    """
+    This queues the notifications we use to send email alerts of
+    changes to people
+    """
+    if kwargs.get('raw'):
+        return
+    if instance.action_type not in (
+        'person-update', 'person-create'
+    ):
+        return
+    QueuedLoggedAction.objects.create(
+        logged_action=instance,
+        verb='created' if created else 'updated',
+    )
 
-post_save.connect(send_person_signals, sender=LoggedAction)
+post_save.connect(queue_person_alerts, sender=LoggedAction)
@@ -21,7 +21,9 @@ from django.contrib.contenttypes.models import ContentType
 from candidates.models import LoggedAction
 from candidates.tests.auth import TestUserMixin
 
-from .models import Alert
+from notifications.models import Notification
+
+from .models import Alert, QueuedLoggedAction
 
 
 class AlertsTest(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest):
@@ -316,3 +318,54 @@ class AlertsTest(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest):
         self.assertTrue(re.search(r'There has been 1 change we don', msg.body))
 
         la.delete()
+
+    def test_notifications_queued_until_processed(self):
+        response = self.app.get(
+            '/person/2009/update',
+            user=self.user_who_can_lock,
+        )
+        form = response.forms['person-details']
+        form['constituency_2015'] = '65913'
+        form['source'] = "test_notifications_queued_until_processed"
+        form.submit()
+
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(QueuedLoggedAction.objects.count(), 1)
+
+        # self.user watches the person and the area, and
+        # self.user_who_can_merge watches the area:
+        self.assertEqual(QueuedLoggedAction.objects.process(), 2)
+        self.assertFalse(QueuedLoggedAction.objects.exists())
+        notifications = Notification.objects.order_by('recipient_id')
+        self.assertEqual(
+            [n.recipient for n in notifications],
+            sorted([self.user, self.user_who_can_merge], key=lambda u: u.id)
+        )
+        for notification in notifications:
+            self.assertEqual(notification.action_object, self.person)
+            self.assertEqual(
+                notification.data['changes']['information_source'],
+                'test_notifications_queued_until_processed'
+            )
+
+    def test_digests_sent_in_batches(self):
+        response = self.app.get(
+            '/person/2010/update',
+            user=self.user_who_can_lock,
+        )
+        form = response.forms['person-details']
+        form['constituency_2015'] = '65913'
+        form['source'] = "test_digests_sent_in_batches"
+        form.submit()
+
+        call_command('alerts_send_alerts', '--daily', '--batch-size=1')
+
+        self.assertEquals(len(mail.outbox), 2)
+        for msg in mail.outbox:
+            self.assertTrue(re.search(r'Changes to Angela Smith', msg.body))
+            self.assertTrue(re.search(r'test_digests_sent_in_batches', msg.body))
+        self.assertFalse(Notification.objects.filter(unread=True).exists())
+
+        # Nothing is sent again until there's another change:
+        call_command('alerts_send_alerts', '--daily')
+        self.assertEquals(len(mail.outbox), 2)
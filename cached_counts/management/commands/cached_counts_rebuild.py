@@ -0,0 +1,19 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cached_counts.models import ElectionCount, rebuild_counts
+
+
+class Command(BaseCommand):
+
+    help = "Recount the candidates in every election, post and party"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_counts()
+        if int(options['verbosity']) > 0:
+            print("Finished: recounted the candidates in {0} elections".format(
+                ElectionCount.objects.count()
+            ))
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('popolo', '0002_update_models_from_upstream'),
+        ('elections', '0013_optional_election_area_type'),
+        ('cached_counts', '0005_delete_cachedcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElectionCount',
+            fields=[
+                ('election', models.OneToOneField(related_name='candidate_count', primary_key=True, serialize=False, to='elections.Election')),
+                ('candidates', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PartyCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('candidates', models.IntegerField(default=0)),
+                ('election', models.ForeignKey(related_name='party_counts', to='elections.Election')),
+                ('party', models.ForeignKey(related_name='candidate_counts', to='popolo.Organization')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('candidates', models.IntegerField(default=0)),
+                ('election', models.ForeignKey(related_name='post_counts', to='elections.Election')),
+                ('post', models.ForeignKey(related_name='candidate_counts', to='popolo.Post')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='postcount',
+            unique_together=set([('election', 'post')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='partycount',
+            unique_together=set([('election', 'party')]),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def populate_candidate_counts(apps, schema_editor):
+    Election = apps.get_model('elections', 'election')
+    ElectionCount = apps.get_model('cached_counts', 'electioncount')
+    Membership = apps.get_model('popolo', 'membership')
+    PartyCount = apps.get_model('cached_counts', 'partycount')
+    PostCount = apps.get_model('cached_counts', 'postcount')
+    for election in Election.objects.all():
+        in_election = Membership.objects.filter(extra__election=election)
+        candidacies = in_election.filter(
+            role=election.candidate_membership_role)
+        ElectionCount.objects.create(
+            election=election,
+            candidates=candidacies.count(),
+        )
+        PostCount.objects.bulk_create([
+            PostCount(election=election, post_id=post_id, candidates=count)
+            for post_id, count in candidacies.filter(post__isnull=False)
+            .order_by().values_list('post_id').annotate(Count('pk'))
+        ])
+        PartyCount.objects.bulk_create([
+            PartyCount(election=election, party_id=party_id, candidates=count)
+            for party_id, count in in_election
+            .filter(on_behalf_of__isnull=False)
+            .order_by().values_list('on_behalf_of_id').annotate(Count('pk'))
+        ])
+
+
+def remove_candidate_counts(apps, schema_editor):
+    for model_name in ('electioncount', 'partycount', 'postcount'):
+        apps.get_model('cached_counts', model_name).objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0044_personsearchupdate'),
+        ('cached_counts', '0006_candidate_counts'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_candidate_counts,
+            remove_candidate_counts,
+        ),
+    ]
@@ -1,8 +1,144 @@
-# There a no models needed by this application any more.
+"""Counts of candidates in each election, and by post and by party
+
+The /numbers/ pages used to count the candidacies in an election with
+aggregate queries over every membership on each request; instead,
+those counts are kept in these tables.  The counts for an election,
+and for the posts and parties whose candidacies change, are recounted
+by signal handlers whenever a membership or its extra is saved or
+deleted, or you can recount everything with the cached_counts_rebuild
+command."""
 
 from __future__ import unicode_literals
 
-from django.db import connection
+from collections import defaultdict
+
+from django.db import connection, models, transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from candidates.models import MembershipExtra
+from elections.models import Election
+from popolo.models import Membership, Organization, Post
+
+
+class ElectionCount(models.Model):
+    election = models.OneToOneField(
+        Election, primary_key=True, related_name='candidate_count')
+    candidates = models.IntegerField(default=0)
+
+
+class PostCount(models.Model):
+    election = models.ForeignKey(Election, related_name='post_counts')
+    post = models.ForeignKey(Post, related_name='candidate_counts')
+    candidates = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ('election', 'post'),
+        ]
+
+
+class PartyCount(models.Model):
+    election = models.ForeignKey(Election, related_name='party_counts')
+    party = models.ForeignKey(Organization, related_name='candidate_counts')
+    candidates = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [
+            ('election', 'party'),
+        ]
+
+
+def replace_counts(model, field, election, memberships, membership_field,
+                   ids=None):
+    """Replace the rows of 'model' for an election with new counts
+
+    The memberships are counted grouped by 'membership_field', the
+    foreign key to the post or party that's 'field' on 'model'.  If
+    'ids' is given, only the counts for those posts or parties are
+    replaced."""
+    existing = model.objects.filter(election=election)
+    memberships = memberships.filter(**{membership_field + '__isnull': False})
+    if ids is not None:
+        ids = [i for i in ids if i is not None]
+        existing = existing.filter(**{field + '_id__in': ids})
+        memberships = memberships.filter(
+            **{membership_field + '_id__in': ids})
+    counts = memberships.order_by().values_list(membership_field + '_id') \
+        .annotate(Count('pk'))
+    existing.delete()
+    model.objects.bulk_create([
+        model(election=election, candidates=count, **{field + '_id': i})
+        for i, count in counts
+    ])
+
+
+def recount_election(election, post_ids=None, party_ids=None):
+    """Recount the candidates in an election
+
+    The total is always recounted; if 'post_ids' or 'party_ids' are
+    given, only the counts for those posts or parties are."""
+    in_election = Membership.objects.filter(extra__election=election)
+    candidacies = in_election.filter(
+        role=election.candidate_membership_role)
+    ElectionCount.objects.update_or_create(
+        election=election,
+        defaults={'candidates': candidacies.count()},
+    )
+    replace_counts(
+        PostCount, 'post', election, candidacies, 'post', post_ids)
+    # The party counts have always included every membership in the
+    # election on behalf of a party, whatever its role:
+    replace_counts(
+        PartyCount, 'party', election, in_election, 'on_behalf_of', party_ids)
+
+
+def update_counts(keys):
+    """Recount the candidates affected by changes to some memberships
+
+    'keys' is an iterable of (election_id, post_id, party_id) tuples,
+    from before and after each membership changed."""
+    election_to_post_ids = defaultdict(set)
+    election_to_party_ids = defaultdict(set)
+    for election_id, post_id, party_id in keys:
+        if election_id is None:
+            continue
+        election_to_post_ids[election_id].add(post_id)
+        election_to_party_ids[election_id].add(party_id)
+    if not election_to_post_ids:
+        return
+    with transaction.atomic():
+        # Locking each election means that concurrent changes to its
+        # candidacies are counted one after the other, each seeing the
+        # other once it has committed:
+        for election in Election.objects.select_for_update() \
+                .filter(pk__in=list(election_to_post_ids)).order_by('pk'):
+            recount_election(
+                election,
+                election_to_post_ids[election.id],
+                election_to_party_ids[election.id],
+            )
+
+
+def get_membership_keys(membership_ids):
+    return list(
+        Membership.objects.filter(pk__in=list(membership_ids))
+        .values_list('extra__election_id', 'post_id', 'on_behalf_of_id')
+    )
+
+
+def update_counts_for_memberships(membership_ids):
+    """Recount the candidates after memberships are created in bulk"""
+    update_counts(get_membership_keys(membership_ids))
+
+
+def rebuild_counts():
+    """Recount the candidates in every election from scratch"""
+    ElectionCount.objects.all().delete()
+    PostCount.objects.all().delete()
+    PartyCount.objects.all().delete()
+    for election in Election.objects.order_by('pk'):
+        recount_election(election)
 
 
 def get_attention_needed_posts(max_results=None, random=False):
@@ -12,19 +148,14 @@ def get_attention_needed_posts(max_results=None, random=False):
     # except it's not specific to a particular election and the
     # results are ordered with fewest candidates first:
     query = '''
-SELECT pe.slug, p.label, ee.name, ee.slug, count(m.id) as count
+SELECT pe.slug, p.label, ee.name, ee.slug, COALESCE(pc.candidates, 0) as count
   FROM popolo_post p
     INNER JOIN candidates_postextra pe ON pe.base_id = p.id
     INNER JOIN candidates_postextraelection cppee ON cppee.postextra_id = pe.id
     INNER JOIN elections_election ee ON cppee.election_id = ee.id
-    LEFT OUTER JOIN
-      (popolo_membership m
-        INNER JOIN candidates_membershipextra me
-        ON me.base_id = m.id)
-      ON m.role = ee.candidate_membership_role AND m.post_id = p.id AND
-         me.election_id = ee.id
+    LEFT OUTER JOIN cached_counts_postcount pc
+      ON pc.post_id = p.id AND pc.election_id = ee.id
     WHERE ee.current = TRUE
-  GROUP BY pe.slug, p.label, ee.slug, ee.name
   ORDER BY'''
     if random:
         query += ' count, random()'
@@ -44,3 +175,60 @@ SELECT pe.slug, p.label, ee.name, ee.slug, count(m.id) as count
         }
         for row in cursor.fetchall()
     ]
+
+
+# A membership's post, party or election can change, so the keys
+# it had before it's saved are recorded so that the counts it's
+# leaving are recounted as well as the ones it's joining:
+
+def record_old_membership_key(sender, instance, **kwargs):
+    instance._old_count_keys = get_membership_keys([instance.pk]) \
+        if instance.pk else []
+
+
+def update_counts_for_membership(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    update_counts(
+        getattr(instance, '_old_count_keys', []) +
+        get_membership_keys([instance.pk])
+    )
+
+
+def record_old_membership_extra_election(sender, instance, **kwargs):
+    instance._old_count_election_id = MembershipExtra.objects \
+        .filter(pk=instance.pk).values_list('election_id', flat=True) \
+        .first() if instance.pk else None
+
+
+def update_counts_for_membership_extra(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # If the membership is being deleted too, it still exists when its
+    # extra's post_delete signal is sent:
+    post_and_party = Membership.objects.filter(pk=instance.base_id) \
+        .values_list('post_id', 'on_behalf_of_id').first()
+    if post_and_party is None:
+        return
+    update_counts([
+        (election_id,) + post_and_party for election_id in (
+            getattr(instance, '_old_count_election_id', None),
+            instance.election_id,
+        )
+    ])
+
+
+def update_counts_for_election(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # Its candidate_membership_role may have changed:
+    with transaction.atomic():
+        recount_election(instance)
+
+
+pre_save.connect(record_old_membership_key, sender=Membership)
+post_save.connect(update_counts_for_membership, sender=Membership)
+pre_save.connect(record_old_membership_extra_election, sender=MembershipExtra)
+post_save.connect(update_counts_for_membership_extra, sender=MembershipExtra)
+post_delete.connect(update_counts_for_membership_extra, sender=MembershipExtra)
+post_save.connect(update_counts_for_election, sender=Election)
@@ -3,15 +3,25 @@
 from __future__ import unicode_literals
 
 import json
+import os
+from time import time
+from unittest import skipUnless
 
+from django.core.management import call_command
+from django.test import TestCase
 from django_webtest import WebTest
 
-from popolo.models import Person
+from popolo.models import Membership, Person
+
+from candidates.models import MembershipExtra
 
 from candidates.tests import factories
 from candidates.tests.settings import SettingsMixin
 from candidates.tests.uk_examples import UK2015ExamplesMixin
 
+from .models import ElectionCount, PartyCount, PostCount
+from .views import get_prior_elections_data
+
 class CachedCountTestCase(SettingsMixin, UK2015ExamplesMixin, WebTest):
     maxDiff = None
 
@@ -200,3 +210,150 @@ class CachedCountTestCase(SettingsMixin, UK2015ExamplesMixin, WebTest):
                  '<td>3</td>'),
             ]
         )
+
+    def get_post_count(self, post_extra, election=None):
+        return PostCount.objects.get(
+            election=election or self.election,
+            post=post_extra.base,
+        ).candidates
+
+    def get_party_count(self, party_extra, election=None):
+        return PartyCount.objects.get(
+            election=election or self.election,
+            party=party_extra.base,
+        ).candidates
+
+    def test_counts_updated_for_moved_candidacy(self):
+        membership = Membership.objects.get(
+            person_id=7015, extra__election=self.election)
+        membership.post = self.camberwell_post_extra.base
+        membership.on_behalf_of = self.sinn_fein_extra.base
+        membership.save()
+        self.assertEqual(self.get_post_count(self.dulwich_post_extra), 4)
+        self.assertEqual(self.get_post_count(self.camberwell_post_extra), 1)
+        self.assertEqual(self.get_party_count(self.green_party_extra), 3)
+        self.assertEqual(self.get_party_count(self.sinn_fein_extra), 4)
+        self.assertEqual(
+            ElectionCount.objects.get(election=self.election).candidates, 18)
+
+    def test_counts_updated_for_changed_election(self):
+        extra = Membership.objects.get(
+            person_id=7000, extra__election=self.election).extra
+        extra.election = self.earlier_election
+        extra.save()
+        self.assertEqual(
+            ElectionCount.objects.get(election=self.election).candidates, 17)
+        self.assertEqual(
+            ElectionCount.objects.get(
+                election=self.earlier_election).candidates, 3)
+        self.assertEqual(
+            self.get_post_count(
+                self.edinburgh_east_post_extra, self.earlier_election), 1)
+
+    def test_counts_updated_for_deleted_candidacy(self):
+        Membership.objects.get(
+            person_id=7000, extra__election=self.election).delete()
+        self.assertEqual(
+            ElectionCount.objects.get(election=self.election).candidates, 17)
+        self.assertEqual(
+            self.get_post_count(self.edinburgh_east_post_extra), 9)
+        self.assertEqual(self.get_party_count(self.labour_party_extra), 3)
+        response = self.app.get('/numbers/election/2015/posts')
+        self.assertIn('<td>9</td>', response.text)
+
+    def test_rebuild_command(self):
+        expected = sorted(
+            PostCount.objects.values_list('election', 'post', 'candidates'))
+        PostCount.objects.all().delete()
+        ElectionCount.objects.all().delete()
+        call_command('cached_counts_rebuild', verbosity=0)
+        self.assertEqual(
+            sorted(PostCount.objects.values_list(
+                'election', 'post', 'candidates')),
+            expected
+        )
+        self.assertEqual(
+            ElectionCount.objects.get(election=self.election).candidates, 18)
+
+
+@skipUnless(
+    os.environ.get('YNR_RUN_BENCHMARKS'),
+    'Set YNR_RUN_BENCHMARKS=1 to run benchmarks'
+)
+class PriorElectionsBenchmark(UK2015ExamplesMixin, TestCase):
+    """Time get_prior_elections_data with a national election's candidates
+
+    There are 4,000 candidates in the current election, 2,800 of whom
+    also stood in the earlier one (half of those for the same party).
+    Run this with something like:
+
+      YNR_RUN_BENCHMARKS=1 ./manage.py test cached_counts.tests:PriorElectionsBenchmark
+    """
+
+    current_candidates = 4000
+    prior_candidates = 2800
+
+    def setUp(self):
+        super(PriorElectionsBenchmark, self).setUp()
+        posts = [
+            self.edinburgh_east_post_extra.base,
+            self.edinburgh_north_post_extra.base,
+            self.dulwich_post_extra.base,
+            self.camberwell_post_extra.base,
+        ]
+        parties = [
+            self.labour_party_extra.base,
+            self.ld_party_extra.base,
+            self.green_party_extra.base,
+            self.conservative_party_extra.base,
+        ]
+        Person.objects.bulk_create([
+            Person(id=i, name='Candidate {0}'.format(i))
+            for i in range(1, self.current_candidates + 1)
+        ])
+        memberships = []
+        membership_elections = []
+        for i in range(1, self.current_candidates + 1):
+            party_index = i % len(parties)
+            memberships.append(Membership(
+                id=len(memberships) + 1,
+                person_id=i,
+                post=posts[i % len(posts)],
+                on_behalf_of=parties[party_index],
+                role='Candidate',
+            ))
+            membership_elections.append(self.election)
+            if i <= self.prior_candidates:
+                if i % 2:
+                    party_index = (party_index + 1) % len(parties)
+                memberships.append(Membership(
+                    id=len(memberships) + 1,
+                    person_id=i,
+                    post=posts[i % len(posts)],
+                    on_behalf_of=parties[party_index],
+                    role='Candidate',
+                ))
+                membership_elections.append(self.earlier_election)
+        Membership.objects.bulk_create(memberships)
+        MembershipExtra.objects.bulk_create([
+            MembershipExtra(base_id=membership.id, election=election)
+            for membership, election in zip(memberships, membership_elections)
+        ])
+
+    def test_get_prior_elections_data(self):
+        start = time()
+        result = get_prior_elections_data(
+            self.current_candidates,
+            self.election,
+            [(self.earlier_election, self.prior_candidates)],
+        )
+        elapsed = time() - start
+        print("\nget_prior_elections_data took {0:.3f} seconds".format(elapsed))
+        self.assertEqual(result, [{
+            'name': '2010 General Election',
+            'percentage': 100 * float(4000) / 2800,
+            'new_candidates': 1200,
+            'standing_again': 2800,
+            'standing_again_different_party': 1400,
+            'standing_again_same_party': 1400,
+        }])
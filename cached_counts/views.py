@@ -3,69 +3,71 @@ from __future__ import unicode_literals
 import json
 
 from django.db import connection
-from django.db.models import Count, F
 from django.http import HttpResponse
 
 from django.views.generic import TemplateView
 
-from candidates.models import MembershipExtra
 from elections.mixins import ElectionMixin
 from elections.models import Election
-from popolo.models import Membership, Person
 
-from .models import get_attention_needed_posts
-
-
-def get_prior_election_data(
-        total_current, current_election,
-        total_prior, prior_election
-):
-    # Find all those people who are standing in both elections:
-    persons_standing_again = list(Person.objects \
-        .filter(memberships__extra__election=current_election) \
-        .filter(memberships__extra__election=prior_election) \
-        .prefetch_related('memberships', 'memberships__extra')
+from .models import ElectionCount, get_attention_needed_posts
+
+
+def get_prior_elections_data(total_current, current_election, prior_elections):
+    """Compare the candidates in an election with those in earlier ones
+
+    'prior_elections' is a list of (election, total candidates) pairs;
+    this returns a dict for each of them with how many of the current
+    candidates are standing again, and whether for the same party.
+    The people standing in both elections are counted with one
+    grouped query for all the prior elections, rather than loading
+    them and their memberships."""
+    if not prior_elections:
+        return []
+    cursor = connection.cursor()
+    cursor.execute('''
+SELECT prior_me.election_id,
+       count(DISTINCT current_m.person_id),
+       count(DISTINCT CASE
+         WHEN current_m.on_behalf_of_id = prior_m.on_behalf_of_id
+           OR (current_m.on_behalf_of_id IS NULL AND
+               prior_m.on_behalf_of_id IS NULL)
+         THEN current_m.person_id END)
+  FROM popolo_membership current_m
+    INNER JOIN candidates_membershipextra current_me
+      ON current_me.base_id = current_m.id
+    INNER JOIN popolo_membership prior_m
+      ON prior_m.person_id = current_m.person_id
+    INNER JOIN candidates_membershipextra prior_me
+      ON prior_me.base_id = prior_m.id
+  WHERE current_me.election_id = %s AND prior_me.election_id IN ({0})
+  GROUP BY prior_me.election_id
+    '''.format(', '.join(['%s'] * len(prior_elections))),
+        [current_election.id] + [e.id for e, _ in prior_elections]
     )
-    # Now see how many are standing for the same party in both:
-    standing_again = len(persons_standing_again)
-    new_candidates = total_current - standing_again
-    standing_again_same_party = 0
-    for p in persons_standing_again:
-        current_party = None
-        prior_party = None
-        for m in p.memberships.all():
-            try:
-                extra = m.extra
-                if extra.election_id == current_election.id:
-                    current_party = m.on_behalf_of_id
-                elif extra.election_id == prior_election.id:
-                    prior_party = m.on_behalf_of_id
-            except MembershipExtra.DoesNotExist:
-                # We need this because some memberships may not have
-                # an extra.
-                pass
-        if current_party == prior_party:
-            standing_again_same_party += 1
-    standing_again_different_party = \
-        standing_again - standing_again_same_party
-    return {
-        'name': prior_election.name,
-        'percentage': 100 * float(total_current) / total_prior,
-        'new_candidates': new_candidates,
-        'standing_again': standing_again,
-        'standing_again_different_party': standing_again_different_party,
-        'standing_again_same_party': standing_again_same_party,
+    election_id_to_standing_again = {
+        row[0]: (row[1], row[2]) for row in cursor.fetchall()
     }
+    result = []
+    for prior_election, total_prior in prior_elections:
+        standing_again, standing_again_same_party = \
+            election_id_to_standing_again.get(prior_election.id, (0, 0))
+        result.append({
+            'name': prior_election.name,
+            'percentage': 100 * float(total_current) / total_prior,
+            'new_candidates': total_current - standing_again,
+            'standing_again': standing_again,
+            'standing_again_different_party':
+                standing_again - standing_again_same_party,
+            'standing_again_same_party': standing_again_same_party,
+        })
+    return result
 
 
 def get_counts():
-    election_id_to_candidates = {
-        d['extra__election']: d['count']
-        for d in Membership.objects \
-            .filter(role=F('extra__election__candidate_membership_role')) \
-            .values('extra__election') \
-            .annotate(count=Count('extra__election'))
-    }
+    election_id_to_candidates = dict(
+        ElectionCount.objects.values_list('election_id', 'candidates')
+    )
     grouped_elections = Election.group_and_order_elections()
     past_elections = [
         election_data['election']
@@ -86,14 +88,12 @@ def get_counts():
                     'total': total,
                 }
                 if era_data['current']:
-                    election_counts['prior_elections'] = [
-                        get_prior_election_data(
-                            total, e,
-                            election_id_to_candidates.get(pe.id, 0), pe
-                        )
-                        for pe in past_elections
-                        if pe.for_post_role == e.for_post_role
-                    ]
+                    election_counts['prior_elections'] = \
+                        get_prior_elections_data(total, e, [
+                            (pe, election_id_to_candidates.get(pe.id, 0))
+                            for pe in past_elections
+                            if pe.for_post_role == e.for_post_role
+                        ])
                 election_data.update(election_counts)
                 del election_data['election']
     return grouped_elections
@@ -123,16 +123,12 @@ class PartyCountsView(ElectionMixin, TemplateView):
         context = super(PartyCountsView, self).get_context_data(**kwargs)
         cursor = connection.cursor()
         cursor.execute('''
-SELECT oe.slug, o.name, count(m.id) AS count
+SELECT oe.slug, o.name, COALESCE(pc.candidates, 0) AS count
   FROM popolo_organization o
     INNER JOIN candidates_organizationextra oe ON o.id = oe.base_id
-    LEFT OUTER JOIN
-      (popolo_membership m
-        INNER JOIN candidates_membershipextra me ON me.base_id = m.id
-        INNER JOIN elections_election ee ON me.election_id = ee.id AND ee.id = %s)
-      ON o.id = m.on_behalf_of_id
+    LEFT OUTER JOIN cached_counts_partycount pc
+      ON pc.party_id = o.id AND pc.election_id = %s
   WHERE o.classification = 'Party'
-  GROUP BY oe.slug, o.name
   ORDER BY count DESC, o.name;
         ''', [self.election_data.id])
         context['party_counts'] = [
@@ -154,18 +150,13 @@ class ConstituencyCountsView(ElectionMixin, TemplateView):
         context = super(ConstituencyCountsView, self).get_context_data(**kwargs)
         cursor = connection.cursor()
         cursor.execute('''
-SELECT pe.slug, p.label, count(m.id) as count
+SELECT pe.slug, p.label, COALESCE(pc.candidates, 0) as count
   FROM popolo_post p
     INNER JOIN candidates_postextra pe ON pe.base_id = p.id
     INNER JOIN candidates_postextraelection cppee ON cppee.postextra_id = pe.id
     INNER JOIN elections_election ee ON cppee.election_id = ee.id AND ee.id = %s
-    LEFT OUTER JOIN
-      (popolo_membership m
-        INNER JOIN candidates_membershipextra me
-        ON me.base_id = m.id)
-      ON m.role = ee.candidate_membership_role AND m.post_id = p.id AND
-         me.election_id = ee.id
-  GROUP BY pe.slug, p.label
+    LEFT OUTER JOIN cached_counts_postcount pc
+      ON pc.post_id = p.id AND pc.election_id = ee.id
   ORDER BY count DESC;
         ''', [self.election_data.id])
         context['post_counts'] = [
@@ -0,0 +1,195 @@
+"""Cached API representations of people
+
+Serializing a person for the API means fetching all their
+memberships, images, contact details and so on, and reversing URLs
+for each of them, so the serialized data for each person is cached.
+
+Rather than deleting a person's cached data when they're edited
+(which would happen before the edit's transaction is committed, so
+a request in the meantime could cache the old data again), the cache
+key for each person includes when they were last saved and the ID of
+the last LoggedAction about them, which are looked up along with the
+people being returned.  Every view that edits a person's data logs an
+action, so the key changes as soon as the edit is committed.
+
+Their identifiers, contact details, other names, links, sources,
+images, candidacies and extra field values can be changed without
+touching the person or logging an action (e.g. by management commands
+or in the admin), so saving or deleting one of those replaces a
+version token for the person, which is also part of the key.  As with
+the candidate lists of posts, that's replaced again once the request
+has finished (see candidates.post_cache).
+
+Other things that appear in a person's data (like the names of
+parties, posts and elections, or the extra fields defined for the
+site) replace a version token that's part of every key instead."""
+
+from __future__ import unicode_literals
+
+import hashlib
+from uuid import uuid4
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+
+from elections.models import Election
+from images.models import Image
+from popolo.models import (
+    ContactDetail, Identifier, Link, Membership, Organization, OtherName,
+    Person, Post, Source
+)
+
+from .models import (
+    ExtraField, LoggedAction, OrganizationExtra, PersonExtra,
+    PersonExtraFieldValue, PostExtra
+)
+from .post_cache import get_cache_version, replace_versions
+
+PERSON_JSON_CACHE_SECONDS = 24 * 60 * 60
+
+ALL_PEOPLE_VERSION_KEY = 'person-json-version'
+
+
+def get_person_json_version_key(person_id):
+    return 'person-json-version:{0}'.format(person_id)
+
+
+def get_person_json_versions(person_ids):
+    """Return a dict mapping each person's ID to their version token"""
+    keys = {
+        person_id: get_person_json_version_key(person_id)
+        for person_id in person_ids
+    }
+    versions = cache.get_many(list(keys.values()))
+    missing_keys = [key for key in keys.values() if key not in versions]
+    if missing_keys:
+        for key in missing_keys:
+            cache.add(key, uuid4().hex, None)
+        # Use whichever versions were stored first, if another process
+        # got in before us:
+        versions.update(cache.get_many(missing_keys))
+    return {
+        person_id: versions.get(key, '') for person_id, key in keys.items()
+    }
+
+
+def get_person_json_cache_keys(people, base_url):
+    """Return a dict mapping the ID of each person to their cache key
+
+    'people' should have their 'updated_at' fields loaded.  The key
+    includes a hash of base_url (e.g. the scheme, host and API version)
+    since the data includes URLs.  If the cache isn't storing anything,
+    this returns an empty dict."""
+    all_people_version = get_cache_version(ALL_PEOPLE_VERSION_KEY)
+    if all_people_version is None:
+        return {}
+    person_ids = [person.id for person in people]
+    last_logged_action_ids = dict(
+        LoggedAction.objects.filter(person_id__in=person_ids)
+        .order_by()
+        .values('person_id')
+        .annotate(last_id=Max('id'))
+        .values_list('person_id', 'last_id')
+    )
+    person_versions = get_person_json_versions(person_ids)
+    base_url_hash = hashlib.md5(base_url.encode('utf-8')).hexdigest()
+    return {
+        person.id: 'person-json:{version}:{base_url_hash}:{person_id}:{person_version}:{updated_at}:{last_logged_action_id}'.format(
+            version=all_people_version,
+            base_url_hash=base_url_hash,
+            person_id=person.id,
+            person_version=person_versions[person.id],
+            updated_at=person.updated_at.isoformat(),
+            last_logged_action_id=last_logged_action_ids.get(person.id, ''),
+        )
+        for person in people
+    }
+
+
+def get_serialized_people(people, base_url, serialize):
+    """Return the serialized data for each of 'people', in order
+
+    'serialize' is called with a list of the IDs of people whose data
+    isn't in the cache, and should return a list of their serialized
+    data (which must include their 'id')."""
+    keys = get_person_json_cache_keys(people, base_url)
+    cached = cache.get_many(list(keys.values())) if keys else {}
+    missing_ids = [
+        person.id for person in people if keys.get(person.id) not in cached
+    ]
+    person_id_to_data = {
+        person.id: cached[keys[person.id]]
+        for person in people if person.id not in missing_ids
+    }
+    if missing_ids:
+        new_data = {data['id']: data for data in serialize(missing_ids)}
+        person_id_to_data.update(new_data)
+        if keys:
+            cache.set_many(
+                {keys[person_id]: data for person_id, data in new_data.items()},
+                PERSON_JSON_CACHE_SECONDS
+            )
+    # Skip anyone who was deleted since the page of people was found:
+    return [
+        person_id_to_data[person.id] for person in people
+        if person.id in person_id_to_data
+    ]
+
+
+def invalidate_person_json(person_ids):
+    """Stop using the cached data of these people"""
+    replace_versions(
+        get_person_json_version_key(person_id)
+        for person_id in person_ids
+        if person_id is not None
+    )
+
+
+def invalidate_all_person_json():
+    cache.set(ALL_PEOPLE_VERSION_KEY, uuid4().hex, None)
+
+
+# People's cached API data includes the names and slugs of the
+# parties, posts and elections of their memberships, and the extra
+# fields defined for the site, none of which are edited with a
+# LoggedAction for each person affected:
+
+def invalidate_person_api_cache(sender, instance, **kwargs):
+    invalidate_all_person_json()
+
+
+# Parts of a person's cached API data can also be changed without
+# updating the person or logging an action:
+
+def invalidate_person_api_cache_for_generic(sender, instance, **kwargs):
+    if instance.content_type_id == \
+            ContentType.objects.get_for_model(Person).id:
+        invalidate_person_json([instance.object_id])
+
+
+def invalidate_person_api_cache_for_image(sender, instance, **kwargs):
+    person_extra = instance.content_object
+    if isinstance(person_extra, PersonExtra):
+        invalidate_person_json([person_extra.base_id])
+
+
+def invalidate_person_api_cache_for_person_fk(sender, instance, **kwargs):
+    invalidate_person_json([instance.person_id])
+
+
+for sender in (
+        Organization, OrganizationExtra, Post, PostExtra, Election, ExtraField
+):
+    post_save.connect(invalidate_person_api_cache, sender=sender)
+post_delete.connect(invalidate_person_api_cache, sender=ExtraField)
+for sender in (ContactDetail, Identifier, Link, OtherName, Source):
+    post_save.connect(invalidate_person_api_cache_for_generic, sender=sender)
+    post_delete.connect(invalidate_person_api_cache_for_generic, sender=sender)
+post_save.connect(invalidate_person_api_cache_for_image, sender=Image)
+post_delete.connect(invalidate_person_api_cache_for_image, sender=Image)
+for sender in (Membership, PersonExtraFieldValue):
+    post_save.connect(invalidate_person_api_cache_for_person_fk, sender=sender)
+    post_delete.connect(
+        invalidate_person_api_cache_for_person_fk, sender=sender)
@@ -0,0 +1,389 @@
+"""Import large numbers of candidates with batched queries
+
+The per-country import commands used to create each person, party
+and candidacy with get_or_create and update_or_create, and record a
+version for each person one at a time, which takes hours for a
+national election with tens of thousands of candidates.  Instead,
+those commands can feed each candidacy to a BulkCandidacyImporter,
+which looks up the elections, posts and parties once at the start,
+and then creates people, candidacies, versions and LoggedActions
+with bulk_create every batch_size candidacies."""
+
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.utils import timezone
+
+from cached_counts.models import update_counts, update_counts_for_memberships
+from elections.models import Election
+from popolo.models import Identifier, Membership, Organization, Person
+
+from .models import (
+    CandidacyListing, LoggedAction, MembershipExtra, OrganizationExtra,
+    PersonExtra, PersonSearchDocument, PersonVersion, PostExtra
+)
+from .last_changed import mark_posts_changed
+from .models.versions import get_people_as_version_data
+from .precomputed_csv import (
+    precomputed_csv_enabled, update_election_csv, update_post_csv
+)
+from .views.version_data import get_change_metadata
+
+
+BATCH_SIZE = 1000
+
+# The fields of Person that can be set from imported data:
+PERSON_FIELDS = (
+    'name', 'family_name', 'given_name', 'gender', 'birth_date',
+    'honorific_prefix', 'honorific_suffix', 'email',
+)
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def reserve_ids(model, count):
+    """Return 'count' unused primary keys for 'model', or None
+
+    Django doesn't set the primary keys of objects created with
+    bulk_create on this version, so to be able to refer to new rows
+    straight away, we take IDs from the table's sequence first.  This
+    is only possible with PostgreSQL; on other databases this returns
+    None, and the objects have to be saved one at a time."""
+    if connection.vendor != 'postgresql' or count == 0:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) '
+            'FROM generate_series(1, %s)',
+            [model._meta.db_table, model._meta.pk.column, count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_with_ids(model, objects):
+    """Create the objects in the database, setting their primary keys"""
+    ids = reserve_ids(model, len(objects))
+    if ids is None:
+        for o in objects:
+            o.save()
+        return
+    for o, pk in zip(objects, ids):
+        o.pk = pk
+    model.objects.bulk_create(objects)
+
+
+def update_search_index(person_ids):
+    """Update the search index for people created or changed in bulk
+
+    bulk_create doesn't send post_save, so the signal handlers that
+    usually keep the index up to date don't see these people."""
+    PersonSearchDocument.objects.update_for_people(person_ids)
+
+
+class BulkCandidacyImporter(object):
+    """Create or update people and their candidacies in batches
+
+    Each candidacy is added with add_candidacy; people are matched to
+    existing ones by an identifier with the given scheme (and that
+    identifier is added to people who are created), and parties by
+    their slug, which are created if they don't exist.  Call finish()
+    after adding the last candidacy.
+
+    Since bulk_create doesn't send signals, this updates the
+    candidacy listings, candidate counts and search index itself, and
+    if precomputed CSV files are enabled, regenerates those for each
+    post and election affected when finish() is called."""
+
+    def __init__(self, source, user=None, party_set=None,
+                 batch_size=BATCH_SIZE, progress_callback=None):
+        self.source = source
+        self.user = user
+        self.party_set = party_set
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.person_content_type = ContentType.objects.get_for_model(Person)
+        self.elections = {e.slug: e for e in Election.objects.all()}
+        self.post_slug_to_id = dict(
+            PostExtra.objects.values_list('slug', 'base_id'))
+        self.party_slug_to_id = dict(
+            OrganizationExtra.objects.values_list('slug', 'base_id'))
+        self.parties_in_party_set = set()
+        if party_set is not None:
+            self.parties_in_party_set = set(
+                party_set.parties.values_list('pk', flat=True))
+        # These are filled in for each identifier scheme as needed:
+        self.identifier_to_person_id = {}
+        self.candidacies = []
+        self.imported = 0
+        self.election_post_ids = set()
+        self.unstamped_logged_action_ids = []
+
+    def add_candidacy(self, election_slug, post_slug, party_slug,
+                      party_name, identifier_scheme, identifier,
+                      party_list_position=None, **person_fields):
+        """Add a candidacy to be imported
+
+        The keyword arguments can be any of PERSON_FIELDS, and are
+        set on the person, who must have at least a name."""
+        unknown_fields = set(person_fields) - set(PERSON_FIELDS)
+        if unknown_fields:
+            raise BulkImportError("Unknown person fields: {0}".format(
+                ', '.join(sorted(unknown_fields))))
+        if election_slug not in self.elections:
+            raise BulkImportError(
+                "Unknown election: {0}".format(election_slug))
+        if post_slug not in self.post_slug_to_id:
+            raise BulkImportError("Unknown post: {0}".format(post_slug))
+        self.candidacies.append({
+            'election': self.elections[election_slug],
+            'post_id': self.post_slug_to_id[post_slug],
+            'party_slug': party_slug,
+            'party_name': party_name,
+            'person_key': (identifier_scheme, identifier),
+            'party_list_position': party_list_position,
+            'person_fields': person_fields,
+        })
+        if len(self.candidacies) >= self.batch_size:
+            self.flush()
+
+    def finish(self):
+        self.flush()
+        self.stamp_logged_actions()
+        if precomputed_csv_enabled():
+            elections = set()
+            for election, post_id in self.election_post_ids:
+                update_post_csv(
+                    election, PostExtra.objects.get(base_id=post_id))
+                elections.add(election)
+            for election in elections:
+                update_election_csv(election)
+
+    def flush(self):
+        if not self.candidacies:
+            return
+        candidacies, self.candidacies = self.candidacies, []
+        in_outer_transaction = connection.in_atomic_block
+        with transaction.atomic():
+            self.import_candidacies(candidacies)
+            if not in_outer_transaction:
+                self.stamp_logged_actions()
+        self.imported += len(candidacies)
+        if self.progress_callback:
+            self.progress_callback(self.imported)
+
+    def stamp_logged_actions(self):
+        """Set the creation time of the logged actions to now
+
+        The changes feed in the API lists logged actions in order of
+        creation time, so that should be as close as possible to when
+        they're committed.  Each batch's actions are stamped at the end
+        of its transaction, unless the importer is used inside a longer
+        one (e.g. around a whole import command), in which case they're
+        all stamped by finish()."""
+        ids = self.unstamped_logged_action_ids
+        now = timezone.now()
+        for i in range(0, len(ids), self.batch_size):
+            LoggedAction.objects.filter(pk__in=ids[i:i + self.batch_size]) \
+                .update(created=now, updated=now)
+        self.unstamped_logged_action_ids = []
+
+    def import_candidacies(self, candidacies):
+        party_ids = self.get_party_ids(candidacies)
+        person_ids, new_person_ids = self.get_person_ids(candidacies)
+        membership_ids = self.update_memberships(
+            candidacies, party_ids, person_ids)
+        CandidacyListing.objects.update_for_memberships(membership_ids)
+        update_counts_for_memberships(membership_ids)
+        self.record_versions(set(person_ids.values()), new_person_ids)
+        mark_posts_changed(set(c['post_id'] for c in candidacies))
+        update_search_index(set(person_ids.values()))
+        for c in candidacies:
+            self.election_post_ids.add((c['election'], c['post_id']))
+
+    def get_party_ids(self, candidacies):
+        """Return a dict mapping party slug to ID, creating any new parties"""
+        for c in candidacies:
+            if c['party_slug'] in self.party_slug_to_id:
+                continue
+            party = Organization.objects.create(
+                name=c['party_name'],
+                classification='Party',
+            )
+            OrganizationExtra.objects.create(base=party, slug=c['party_slug'])
+            self.party_slug_to_id[c['party_slug']] = party.id
+        party_ids = {
+            c['party_slug']: self.party_slug_to_id[c['party_slug']]
+            for c in candidacies
+        }
+        if self.party_set is not None:
+            missing = set(party_ids.values()) - self.parties_in_party_set
+            if missing:
+                self.party_set.parties.add(*missing)
+                self.parties_in_party_set.update(missing)
+        return party_ids
+
+    def load_identifiers(self, scheme):
+        if scheme in self.identifier_to_person_id:
+            return
+        self.identifier_to_person_id[scheme] = dict(
+            Identifier.objects.filter(
+                content_type=self.person_content_type,
+                scheme=scheme,
+            ).values_list('identifier', 'object_id')
+        )
+
+    def get_person_ids(self, candidacies):
+        """Create or update the people, returning a map of person key to ID
+
+        The second element of the returned tuple is the set of IDs of
+        the new people."""
+        person_key_to_fields = {}
+        for c in candidacies:
+            person_key_to_fields.setdefault(
+                c['person_key'], {}).update(c['person_fields'])
+        person_ids = {}
+        new_person_keys = []
+        for key in person_key_to_fields:
+            scheme, identifier = key
+            self.load_identifiers(scheme)
+            person_id = self.identifier_to_person_id[scheme].get(identifier)
+            if person_id is None:
+                new_person_keys.append(key)
+            else:
+                person_ids[key] = person_id
+        self.update_people(
+            {person_ids[k]: person_key_to_fields[k] for k in person_ids})
+        new_people = [
+            Person(**person_key_to_fields[k]) for k in new_person_keys
+        ]
+        for person in new_people:
+            # This is what django-popolo's pre_save handler would do:
+            if person.birth_date:
+                person.start_date = person.birth_date
+        create_with_ids(Person, new_people)
+        Identifier.objects.bulk_create([
+            Identifier(
+                content_type=self.person_content_type,
+                object_id=person.id,
+                scheme=scheme,
+                identifier=identifier,
+            )
+            for (scheme, identifier), person in zip(new_person_keys, new_people)
+        ])
+        PersonExtra.objects.bulk_create([
+            PersonExtra(base_id=person.id) for person in new_people
+        ])
+        for (scheme, identifier), person in zip(new_person_keys, new_people):
+            self.identifier_to_person_id[scheme][identifier] = person.id
+            person_ids[(scheme, identifier)] = person.id
+        return person_ids, set(person.id for person in new_people)
+
+    def update_people(self, person_id_to_fields):
+        people = Person.objects.in_bulk(list(person_id_to_fields.keys()))
+        for person_id, fields in person_id_to_fields.items():
+            person = people[person_id]
+            changed = False
+            for field_name, value in fields.items():
+                if getattr(person, field_name) != value:
+                    setattr(person, field_name, value)
+                    changed = True
+            # Only people whose details have changed need saving:
+            if changed:
+                person.save()
+        existing_person_extras = set(
+            PersonExtra.objects.filter(base_id__in=list(people.keys()))
+            .values_list('base_id', flat=True)
+        )
+        PersonExtra.objects.bulk_create([
+            PersonExtra(base_id=person_id) for person_id in people
+            if person_id not in existing_person_extras
+        ])
+
+    def update_memberships(self, candidacies, party_ids, person_ids):
+        """Create or update the candidacies, returning their membership IDs"""
+        key_to_candidacy = {}
+        for c in candidacies:
+            key = (
+                person_ids[c['person_key']],
+                c['post_id'],
+                party_ids[c['party_slug']],
+                c['election'].candidate_membership_role,
+            )
+            key_to_candidacy[key] = c
+        key_to_membership_id = {}
+        for row in Membership.objects.filter(
+                person_id__in=set(k[0] for k in key_to_candidacy),
+                role__in=set(k[3] for k in key_to_candidacy),
+        ).values_list('person_id', 'post_id', 'on_behalf_of_id', 'role', 'id'):
+            if row[:4] in key_to_candidacy:
+                key_to_membership_id[row[:4]] = row[4]
+        new_keys = [k for k in key_to_candidacy if k not in key_to_membership_id]
+        new_memberships = [
+            Membership(
+                person_id=person_id,
+                post_id=post_id,
+                on_behalf_of_id=party_id,
+                role=role,
+            )
+            for person_id, post_id, party_id, role in new_keys
+        ]
+        create_with_ids(Membership, new_memberships)
+        for key, membership in zip(new_keys, new_memberships):
+            key_to_membership_id[key] = membership.id
+        existing_extras = dict(
+            MembershipExtra.objects.filter(
+                base_id__in=list(key_to_membership_id.values())
+            ).values_list('base_id', 'election_id')
+        )
+        new_extras = []
+        # The counts for any election a candidacy is moved from need
+        # updating too:
+        old_count_keys = []
+        for key, membership_id in key_to_membership_id.items():
+            c = key_to_candidacy[key]
+            if membership_id in existing_extras:
+                old_count_keys.append(
+                    (existing_extras[membership_id], key[1], key[2]))
+                MembershipExtra.objects.filter(base_id=membership_id).update(
+                    election=c['election'],
+                    elected=None,
+                    party_list_position=c['party_list_position'],
+                )
+            else:
+                new_extras.append(MembershipExtra(
+                    base_id=membership_id,
+                    election=c['election'],
+                    elected=None,
+                    party_list_position=c['party_list_position'],
+                ))
+        MembershipExtra.objects.bulk_create(new_extras)
+        update_counts(old_count_keys)
+        return list(key_to_membership_id.values())
+
+    def record_versions(self, person_ids, new_person_ids):
+        person_id_to_data = get_people_as_version_data(person_ids)
+        person_id_to_version = {}
+        logged_actions = []
+        for person_id, data in person_id_to_data.items():
+            change_metadata = get_change_metadata(None, self.source)
+            if self.user is not None:
+                change_metadata['username'] = self.user.username
+            change_metadata['data'] = data
+            person_id_to_version[person_id] = change_metadata
+            if person_id in new_person_ids:
+                action_type = 'person-create'
+            else:
+                action_type = 'person-update'
+            logged_actions.append(LoggedAction(
+                user=self.user,
+                person_id=person_id,
+                action_type=action_type,
+                popit_person_new_version=change_metadata['version_id'],
+                source=self.source,
+            ))
+        PersonVersion.objects.bulk_create_new_versions(person_id_to_version)
+        create_with_ids(LoggedAction, logged_actions)
+        self.unstamped_logged_action_ids.extend(la.id for la in logged_actions)
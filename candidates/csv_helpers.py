@@ -1,8 +1,21 @@
 from __future__ import unicode_literals
 
+import heapq
+from os import chmod, rename
+from os.path import dirname
+
+from six.moves import cPickle as pickle
+from tempfile import NamedTemporaryFile
+
 from compat import BufferDictWriter
 from .models import CSV_ROW_FIELDS
 
+# The number of rows SortedCSVFile keeps in memory before writing
+# them out as a sorted run to a temporary file:
+SORT_RUN_SIZE = 10000
+# How many rows to format before writing them out to the output file:
+WRITE_BUFFER_ROWS = 1000
+
 
 def _candidate_sort_by_name_key(row):
     return (
@@ -25,10 +38,13 @@ def _candidate_sort_by_post_key(row):
     )
 
 
-def list_to_csv(candidates_list, group_by_post=False):
+def get_csv_fields():
     from .election_specific import EXTRA_CSV_ROW_FIELDS
-    csv_fields = CSV_ROW_FIELDS + EXTRA_CSV_ROW_FIELDS
-    writer = BufferDictWriter(fieldnames=csv_fields)
+    return CSV_ROW_FIELDS + EXTRA_CSV_ROW_FIELDS
+
+
+def list_to_csv(candidates_list, group_by_post=False):
+    writer = BufferDictWriter(fieldnames=get_csv_fields())
     writer.writeheader()
     if group_by_post:
         sorted_rows = sorted(candidates_list, key=_candidate_sort_by_post_key)
@@ -37,3 +53,90 @@ def list_to_csv(candidates_list, group_by_post=False):
     for row in sorted_rows:
         writer.writerow(row)
     return writer.output
+
+
+def read_sorted_run(run_filename):
+    with open(run_filename, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class SortedCSVFile(object):
+    """Build a CSV file of candidates from rows added in any order
+
+    The output is the same as list_to_csv would produce, but rather
+    than keeping every row in memory, sorted runs of at most run_size
+    rows are written to temporary files in temp_dir and then merged
+    when the output file is written.
+
+    The position of each row is given by a sequence key so that rows
+    with equal sort keys come out in the order they were added, just as
+    with list_to_csv. If rows are added from several processes, pass a
+    different sequence_prefix to each one, in the order their rows
+    should appear, and then combine their runs with add_runs."""
+
+    def __init__(self, output_filename, group_by_post, temp_dir,
+                 run_size=SORT_RUN_SIZE, sequence_prefix=0):
+        self.output_filename = output_filename
+        self.group_by_post = group_by_post
+        self.temp_dir = temp_dir
+        self.run_size = run_size
+        self.sequence_prefix = sequence_prefix
+        if group_by_post:
+            self.sort_key = _candidate_sort_by_post_key
+        else:
+            self.sort_key = _candidate_sort_by_name_key
+        self.rows = []
+        self.run_filenames = []
+        self.rows_added = 0
+
+    def add(self, row):
+        sequence = (self.sequence_prefix, self.rows_added)
+        self.rows.append((self.sort_key(row), sequence, row))
+        self.rows_added += 1
+        if len(self.rows) >= self.run_size:
+            self.write_run()
+
+    def add_runs(self, run_filenames):
+        self.run_filenames.extend(run_filenames)
+
+    def write_run(self):
+        if not self.rows:
+            return
+        self.rows.sort()
+        with NamedTemporaryFile(
+                delete=False, dir=self.temp_dir, suffix='.run'
+        ) as f:
+            for item in self.rows:
+                pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+        self.run_filenames.append(f.name)
+        self.rows = []
+
+    def write(self):
+        """Merge the sorted rows and atomically write the CSV file"""
+        self.rows.sort()
+        runs = [read_sorted_run(fn) for fn in self.run_filenames]
+        runs.append(iter(self.rows))
+        writer = BufferDictWriter(fieldnames=get_csv_fields())
+        writer.writeheader()
+        # Write to a temporary file and atomically rename into place:
+        ntf = NamedTemporaryFile(
+            delete=False,
+            dir=dirname(self.output_filename)
+        )
+        with ntf:
+            for i, (sort_key, sequence, row) in enumerate(heapq.merge(*runs)):
+                writer.writerow(row)
+                if i % WRITE_BUFFER_ROWS == 0:
+                    self._flush(writer, ntf)
+            self._flush(writer, ntf)
+        chmod(ntf.name, 0o644)
+        rename(ntf.name, self.output_filename)
+
+    def _flush(self, writer, output_file):
+        output_file.write(writer.output.encode('utf-8'))
+        writer.f.seek(0)
+        writer.f.truncate()
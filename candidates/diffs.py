@@ -139,56 +139,95 @@ def explain_standing_in_and_party_memberships(operation, attribute, election, le
                 ))
             operation[key] = _(' and ').join(clauses)
 
-def get_version_diff(from_data, to_data):
-    """Calculate the diff (a mangled JSON patch) between from_data and to_data"""
+def get_standing_in_and_party_memberships_match(operation):
+    """Return the attribute, election and leaf that a path refers to
+
+    These are all None unless the operation's path is in standing_in
+    or party_memberships, which we present in a human-readable form."""
+    m = re.search(
+        r'(standing_in|party_memberships)(?:/([^/]+))?(?:/(\w+))?',
+        operation['path'],
+    )
+    return m.groups() if m else (None, None, None)
+
+def is_empty_when_explained(value, attribute, election):
+    """Would this value be empty after explain_standing_in_and_party_memberships?"""
+    if attribute and election:
+        # Then the value is always replaced by a sentence:
+        return False
+    return not value
+
+def get_version_diff_operations(from_data, to_data):
+    """Calculate the JSON patch operations to get from from_data to to_data
+
+    This is the expensive part of working out a diff, and doesn't
+    depend on the language or the current state of the elections, so
+    the result is suitable for storing.  Use
+    explain_version_diff_operations to turn it into the human readable
+    form that get_version_diff returns."""
 
     basic_patch = jsonpatch.make_patch(from_data, to_data)
     result = []
     for operation in sorted(basic_patch, key=lambda o: (o['op'], o['path'])):
-        op = operation['op']
-        ignore = False
-        # We deal with standing_in and party_memberships slightly
-        # differently so they can be presented in human-readable form,
-        # so match those cases first:
-        m = re.search(
-            r'(standing_in|party_memberships)(?:/([^/]+))?(?:/(\w+))?',
-            operation['path'],
-        )
-        if op in ('replace', 'remove'):
+        attribute, election, leaf = \
+            get_standing_in_and_party_memberships_match(operation)
+        if operation['op'] in ('replace', 'remove'):
             operation['previous_value'] = \
                 jsonpointer.resolve_pointer(
                     from_data,
                     operation['path'],
                     default=None
                 )
+        if operation['op'] == 'replace':
+            if is_empty_when_explained(
+                    operation['previous_value'], attribute, election
+            ) and not is_empty_when_explained(
+                    operation['value'], attribute, election
+            ):
+                operation['op'] = 'add'
+        result.append(operation)
+        # The operations generated by jsonpatch are incremental, so we
+        # need to apply each before going on to parse the next:
+        from_data = jsonpatch.apply_patch(from_data, [operation])
+    return result
+
+def explain_version_diff_operations(operations):
+    """Turn JSON patch operations into a mangled, human readable version
+
+    The operations passed in are left unchanged."""
 
-        attribute, election, leaf = m.groups() if m else (None, None, None)
+    result = []
+    for operation in operations:
+        operation = operation.copy()
+        op = operation['op']
+        ignore = False
+        attribute, election, leaf = \
+            get_standing_in_and_party_memberships_match(operation)
         if attribute:
             explain_standing_in_and_party_memberships(operation, attribute, election, leaf)
-        if op in ('replace', 'remove'):
-            if op == 'replace' and not operation['previous_value']:
-                if operation['value']:
-                    operation['op'] = 'add'
-                else:
-                    # Ignore replacing no data with no data:
-                    ignore = True
+        if op == 'replace' and not operation['previous_value']:
+            # Replacing no data with some data will already have
+            # become an 'add', so this is replacing no data with no
+            # data, which we ignore:
+            ignore = True
         elif op == 'add':
             # It's important that we don't skip the case where a
             # standing_in value is being set to None, because that's
             # saying 'we *know* they're not standing then'
             if (not operation['value']) and (attribute != 'standing_in'):
                 ignore = True
-        operation['path'] = re.sub(r'^/', '', operation['path'])
+        operation['path'] = operation['path'].lstrip('/')
         if not ignore:
             result.append(operation)
-        # The operations generated by jsonpatch are incremental, so we
-        # need to apply each before going on to parse the next:
-        operation['path'] = '/' + operation['path']
-        from_data = jsonpatch.apply_patch(from_data, [operation])
-    for operation in result:
-        operation['path'] = operation['path'].lstrip('/')
     return result
 
+def get_version_diff(from_data, to_data):
+    """Calculate the diff (a mangled JSON patch) between from_data and to_data"""
+
+    return explain_version_diff_operations(
+        get_version_diff_operations(from_data, to_data)
+    )
+
 def clean_version_data(data):
     data = data.copy()
     for election_slug, standing_in in data.get('standing_in', {}).items():
@@ -210,32 +249,70 @@ def get_parents_version_data(parents, id_to_version):
     # If there are no parents, then compare to an empty dictionary
     return [(None, {})]
 
+def get_parent_diff_operations(data, parents_with_data):
+    """Work out the JSON patch operations from each parent to data
+
+    'parents_with_data' is a list of (parent_version_id, parent_data)
+    tuples, as returned by get_parents_version_data.  The result is
+    what's stored in PersonVersion.diffs."""
+
+    data = clean_version_data(data)
+    return [
+        {
+            'parent_version_id': parent_version_id,
+            'operations': get_version_diff_operations(
+                clean_version_data(parent_data), data
+            ),
+        }
+        for parent_version_id, parent_data in parents_with_data
+    ]
+
+def get_versions_parent_diff_operations(versions):
+    """Return a dict mapping each version ID to its parent diff operations"""
+
+    id_to_parent_ids = get_versions_parent_map(versions)
+    id_to_version = {v['version_id']: v for v in versions}
+    return {
+        v['version_id']: get_parent_diff_operations(
+            v['data'],
+            get_parents_version_data(
+                id_to_parent_ids[v['version_id']], id_to_version)
+        )
+        for v in versions
+    }
+
+def explain_parent_diffs(version, parent_diff_operations):
+    """Return a copy of version with human readable diffs against its parents
+
+    'parent_diff_operations' is in the form that
+    get_parent_diff_operations returns."""
+
+    version_with_diffs = version.copy()
+    version_with_diffs['data'] = clean_version_data(version['data'])
+    version_with_diffs['parent_version_ids'] = [
+        parent_diff['parent_version_id']
+        for parent_diff in parent_diff_operations
+        if parent_diff['parent_version_id'] is not None
+    ]
+    version_with_diffs['diffs'] = [
+        {
+            'parent_version_id': parent_diff['parent_version_id'],
+            'parent_diff': explain_version_diff_operations(
+                parent_diff['operations']
+            ),
+        }
+        for parent_diff in parent_diff_operations
+    ]
+    return version_with_diffs
+
 def get_version_diffs(versions):
     """Add a diff to each of an array of version dicts
 
     The first version is the most recent; the last is the original
     version."""
 
-    id_to_parent_ids = get_versions_parent_map(versions)
-    id_to_version = {v['version_id']: v for v in versions}
-    result = []
-    for v in versions:
-        version_id = v['version_id']
-        v['parent_version_ids'] = id_to_parent_ids[version_id]
-        version_with_diffs = v.copy()
-        version_with_diffs['data'] = clean_version_data(
-            version_with_diffs['data'])
-        version_with_diffs['parent_version_ids'] = id_to_parent_ids[version_id]
-        version_with_diffs['diffs'] = [
-            {
-                'parent_version_id': parent_with_data[0],
-                'parent_diff': get_version_diff(
-                    clean_version_data(parent_with_data[1]),
-                    version_with_diffs['data']
-                )
-            } for parent_with_data in
-            get_parents_version_data(
-                id_to_parent_ids[version_id], id_to_version)
-        ]
-        result.append(version_with_diffs)
-    return result
+    id_to_parent_diff_operations = get_versions_parent_diff_operations(versions)
+    return [
+        explain_parent_diffs(v, id_to_parent_diff_operations[v['version_id']])
+        for v in versions
+    ]
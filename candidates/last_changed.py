@@ -0,0 +1,153 @@
+"""When people and posts were last changed, for conditional GETs
+
+PersonExtra and PostExtra each have a 'last_changed' timestamp, which
+is updated whenever they're saved, a version of the person is
+recorded, or a LoggedAction about them (or about a person standing
+for the post) is processed, once its edit has been committed (see
+LoggedActionUpdate).  Their pages and their API endpoints send
+ETag and Last-Modified headers based on it, so that clients that
+already have the current version get a 304 Not Modified response
+without the page being rendered or the data serialized.
+
+Those pages also include the names of parties, posts and elections,
+the site's settings and so on, which are edited without a LoggedAction
+for each person or post affected, so when any of those change a
+timestamp for the whole site is updated in the cache instead.  If the
+cache isn't storing anything, no validators are sent at all."""
+
+from __future__ import unicode_literals
+
+from calendar import timegm
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone, translation
+
+from elections.models import Election
+from popolo.models import Organization, Post
+
+from .models import (
+    ExtraField, OrganizationExtra, PersonExtra, PostExtra, SiteSettings
+)
+
+SITE_DATA_LAST_CHANGED_KEY = 'site-data-last-changed'
+
+
+def mark_people_changed(person_ids, when=None):
+    PersonExtra.objects.filter(base_id__in=list(person_ids)) \
+        .update(last_changed=when or timezone.now())
+
+
+def mark_posts_changed(post_ids, when=None):
+    PostExtra.objects.filter(base_id__in=list(post_ids)) \
+        .update(last_changed=when or timezone.now())
+
+
+def mark_changed_by_logged_actions(logged_actions):
+    """Mark the people and posts these actions affect as changed now
+
+    This is done once the changes have been committed, rather than
+    when the actions were logged (which is before the views change
+    anything), so that a page fetched in between isn't taken to be
+    up to date."""
+    from .precomputed_csv import get_affected_posts
+    now = timezone.now()
+    person_ids = set()
+    post_slugs = set()
+    for logged_action in logged_actions:
+        if logged_action.person_id:
+            person_ids.add(logged_action.person_id)
+        post_slugs.update(
+            post_slug for election_slug, post_slug
+            in get_affected_posts(logged_action)
+        )
+    if person_ids:
+        mark_people_changed(person_ids, now)
+    if post_slugs:
+        PostExtra.objects.filter(slug__in=post_slugs) \
+            .update(last_changed=now)
+
+
+def mark_site_data_changed():
+    cache.set(SITE_DATA_LAST_CHANGED_KEY, timezone.now(), None)
+
+
+def record_site_data_change(sender, instance, **kwargs):
+    mark_site_data_changed()
+
+
+def get_site_data_last_changed():
+    """Return when anything shown for every person or post last changed
+
+    If the cache has lost track of that, it's assumed to be now.  If
+    the cache isn't storing anything, this returns None."""
+    last_changed = cache.get(SITE_DATA_LAST_CHANGED_KEY)
+    if last_changed is None:
+        cache.add(SITE_DATA_LAST_CHANGED_KEY, timezone.now(), None)
+        last_changed = cache.get(SITE_DATA_LAST_CHANGED_KEY)
+    return last_changed
+
+
+def combine_last_changed(last_changed):
+    """Return the later of 'last_changed' and the site data's timestamp
+
+    This is None if either of them is unknown."""
+    site_data_last_changed = get_site_data_last_changed()
+    if last_changed is None or site_data_last_changed is None:
+        return None
+    return max(last_changed, site_data_last_changed)
+
+
+def get_person_last_changed(person_id):
+    return combine_last_changed(
+        PersonExtra.objects.filter(base_id=person_id)
+        .values_list('last_changed', flat=True).first()
+    )
+
+
+def get_post_last_changed(post_slug):
+    return combine_last_changed(
+        PostExtra.objects.filter(slug=post_slug)
+        .values_list('last_changed', flat=True).first()
+    )
+
+
+def get_all_people_last_changed():
+    return combine_last_changed(
+        PersonExtra.objects.aggregate(Max('last_changed'))['last_changed__max']
+    )
+
+
+def get_all_posts_last_changed():
+    return combine_last_changed(
+        PostExtra.objects.aggregate(Max('last_changed'))['last_changed__max']
+    )
+
+
+def make_etag(last_changed, *variant):
+    """Return an ETag for a representation of something last changed then
+
+    'variant' should distinguish the different representations that
+    can be returned at the same URL (e.g. the language of a page, or
+    the format of an API response).  The timestamp is included to the
+    microsecond, since Last-Modified is only precise to the second."""
+    if last_changed is None:
+        return None
+    microseconds = timegm(last_changed.utctimetuple()) * 1000000 + \
+        last_changed.microsecond
+    return '-'.join(
+        [str(part) for part in variant] + ['{0:x}'.format(microseconds)]
+    )
+
+
+def make_language_etag(last_changed):
+    return make_etag(last_changed, translation.get_language())
+
+
+for sender in (
+        Organization, OrganizationExtra, Post, PostExtra, Election,
+        ExtraField, SiteSettings
+):
+    post_save.connect(record_site_data_change, sender=sender)
+post_delete.connect(record_site_data_change, sender=ExtraField)
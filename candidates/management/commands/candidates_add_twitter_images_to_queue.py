@@ -1,23 +1,34 @@
 from __future__ import print_function, unicode_literals
 
-from django.core.files.temp import NamedTemporaryFile
-from django.core.files import File
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import threading
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.six.moves.urllib_parse import urlsplit
 from django.utils.translation import ugettext as _
 
-from candidates.models import MultipleTwitterIdentifiers
+from candidates.models import (
+    MultipleTwitterIdentifiers, get_twitter_identifiers
+)
 from moderation_queue.models import QueuedImage, CopyrightOptions
-from popolo.models import Person
+from popolo.models import ContactDetail, Identifier, Person
 
 import requests
+from requests.exceptions import RequestException
 
-from ..images import get_image_extension
+from ..images import get_image_extension_from_file
 from ..twitter import TwitterAPIData
 
 
 VERBOSE = False
 
+# How many seconds to wait for an image host to respond:
+DOWNLOAD_TIMEOUT = 30
+
 
 def verbose(*args, **kwargs):
     if VERBOSE:
@@ -28,32 +39,120 @@ class Command(BaseCommand):
 
     help = "Add Twitter avatars for candidates without images to the moderation queue"
 
-    def add_twitter_image_to_queue(self, person, image_url, user_id):
-        if person.queuedimage_set.exists():
-            # Don't add an image to the queue if there is one already
-            # in the queue. It doesn't matter if that queued image has
-            # been moderated or not, or whether it's been rejected or
-            # not. At the moment we just want to be really careful not
-            # to make people check the same Twitter avatar twice.
-            verbose(_("  That person already had an image in the queue, so skipping."))
-            return
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='How many images to download at once (default 8)'
+        )
+        parser.add_argument(
+            '--per-host',
+            type=int,
+            default=4,
+            help='How many images to download at once from any one host '
+            '(default 4)'
+        )
 
-        verbose(_("  Adding that person's Twitter avatar to the moderation queue"))
-        # Add a new queued image
-        image_url = image_url.replace('_normal.', '.')
-        img_temp = NamedTemporaryFile(delete=True)
-        r = requests.get(image_url)
+    def get_session(self):
+        # Each download thread keeps its own session, so that
+        # connections to the image hosts are reused:
+        session = getattr(self.thread_data, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self.thread_data.session = session
+        return session
+
+    def get_host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        with self.host_semaphores_lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = \
+                    threading.BoundedSemaphore(self.per_host)
+            return self.host_semaphores[host]
+
+    def download(self, image_url):
+        """Return the response for image_url, or None if that failed"""
+        with self.get_host_semaphore(image_url):
+            try:
+                return self.get_session().get(
+                    image_url, timeout=DOWNLOAD_TIMEOUT)
+            except RequestException as e:
+                print(u"WARNING: Failed to download {url}: {error}".format(
+                    url=image_url, error=e))
+                return None
+
+    def get_people_to_consider(self):
+        """Yield (person ID, name, Twitter user ID) for each candidate
+
+        Everyone with a Twitter user ID or screen name is considered, in
+        name order; the user ID is None if they have several Twitter
+        user IDs or screen names, after warning about that."""
+        person_content_type = ContentType.objects.get_for_model(Person)
+        person_id_to_user_ids = defaultdict(list)
+        for person_id, user_id in Identifier.objects.filter(
+                content_type=person_content_type, scheme='twitter'
+        ).values_list('object_id', 'identifier'):
+            person_id_to_user_ids[person_id].append(user_id)
+        person_id_to_screen_names = defaultdict(list)
+        for person_id, screen_name in ContactDetail.objects.filter(
+                content_type=person_content_type, contact_type='twitter'
+        ).values_list('object_id', 'value'):
+            person_id_to_screen_names[person_id].append(screen_name)
+        people = Person.objects.filter(
+            pk__in=set(person_id_to_user_ids) | set(person_id_to_screen_names)
+        ).order_by('name', 'pk').values_list('pk', 'name')
+        for person_id, name in people:
+            try:
+                user_id, screen_name = get_twitter_identifiers(
+                    name,
+                    person_id,
+                    person_id_to_user_ids[person_id],
+                    person_id_to_screen_names[person_id],
+                )
+            except MultipleTwitterIdentifiers as e:
+                print(u"WARNING: {message}, skipping".format(message=e))
+                continue
+            yield person_id, name, user_id
+
+    def get_images_to_download(self):
+        """Return a list of (person ID, avatar URL, Twitter user ID)"""
+        # Don't add an image to the queue if there is one already in
+        # the queue. It doesn't matter if that queued image has been
+        # moderated or not, or whether it's been rejected or not. At
+        # the moment we just want to be really careful not to make
+        # people check the same Twitter avatar twice.
+        person_ids_with_queued_images = set(
+            QueuedImage.objects.values_list('person_id', flat=True).distinct()
+        )
+        user_id_to_photo_url = self.twitter_data.user_id_to_photo_url
+        to_download = []
+        for person_id, name, user_id in self.get_people_to_consider():
+            if not (user_id and user_id in user_id_to_photo_url):
+                continue
+            msg = "Considering adding a photo for {person} with Twitter " \
+                  "user ID: {user_id}"
+            verbose(_(msg).format(person=name, user_id=user_id))
+            if person_id in person_ids_with_queued_images:
+                verbose(_("  That person already had an image in the queue, so skipping."))
+                continue
+            verbose(_("  Adding that person's Twitter avatar to the moderation queue"))
+            image_url = user_id_to_photo_url[user_id].replace('_normal.', '.')
+            to_download.append((person_id, image_url, user_id))
+        return to_download
+
+    def add_twitter_image_to_queue(self, person_id, image_url, user_id, r):
+        if r is None:
+            # The download failed, which has already been reported
+            return
         if r.status_code != 200:
             msg = _("  Ignoring an image URL with non-200 status code "
                     "({status_code}): {url}")
             verbose(msg.format(status_code=r.status_code, url=image_url))
             return
-        img_temp.write(r.content)
-        img_temp.flush()
-
         # Trying to get the image extension checks that this really is
         # an image:
-        if get_image_extension(img_temp.name) is None:
+        if get_image_extension_from_file(BytesIO(r.content), image_url) is None:
             msg = _("  The image at {url} wasn't of a known type")
             verbose(msg.format(url=image_url))
             return
@@ -65,33 +164,39 @@ class Command(BaseCommand):
             decision=QueuedImage.UNDECIDED,
             why_allowed=CopyrightOptions.PROFILE_PHOTO,
             justification_for_use=justification_for_use,
-            person=person
+            person_id=person_id
         )
+        qi.image.save(image_url, ContentFile(r.content), save=False)
         qi.save()
-        qi.image.save(image_url, File(img_temp))
-        qi.save()
-
-    def handle_person(self, person):
-        try:
-            user_id, screen_name = person.extra.twitter_identifiers
-        except MultipleTwitterIdentifiers as e:
-            print(u"WARNING: {message}, skipping".format(message=e))
-            return
-        if user_id and user_id in self.twitter_data.user_id_to_photo_url:
-            msg = "Considering adding a photo for {person} with Twitter " \
-                  "user ID: {user_id}"
-            verbose(_(msg).format(person=person, user_id=user_id))
-            self.add_twitter_image_to_queue(
-                person, self.twitter_data.user_id_to_photo_url[user_id],
-                user_id)
 
     def handle(self, *args, **options):
         global VERBOSE
         VERBOSE = int(options['verbosity']) > 1
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['per_host'] < 1:
+            raise CommandError("--per-host must be at least 1")
+        self.per_host = options['per_host']
+        self.thread_data = threading.local()
+        self.host_semaphores = {}
+        self.host_semaphores_lock = threading.Lock()
         self.twitter_data = TwitterAPIData()
         self.twitter_data.update_from_api()
         # Now go through every person in the database and see if we
         # should add their Twitter avatar to the image moderation
         # queue:
-        for person in Person.objects.select_related('extra').order_by('name'):
-            self.handle_person(person)
+        to_download = self.get_images_to_download()
+        # The avatars are downloaded a chunk at a time, so that only a
+        # few of them are held in memory at once:
+        chunk_size = 4 * options['workers']
+        executor = ThreadPoolExecutor(max_workers=options['workers'])
+        try:
+            for i in range(0, len(to_download), chunk_size):
+                chunk = to_download[i:i + chunk_size]
+                responses = executor.map(
+                    self.download, [t[1] for t in chunk])
+                for (person_id, image_url, user_id), r in zip(chunk, responses):
+                    self.add_twitter_image_to_queue(
+                        person_id, image_url, user_id, r)
+        finally:
+            executor.shutdown()
@@ -0,0 +1,37 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from candidates.models import PersonExtra, PersonVersion
+from candidates.models.versions import move_legacy_versions_to_table
+
+
+class Command(BaseCommand):
+
+    help = "Move any remaining JSON version histories into PersonVersion rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='How many people to convert in each transaction'
+        )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+
+        def report_progress(converted):
+            if verbosity > 1:
+                print("Moved the versions of {0} people".format(converted))
+
+        converted = move_legacy_versions_to_table(
+            PersonExtra,
+            PersonVersion,
+            batch_size=options['batch_size'],
+            progress_callback=report_progress,
+        )
+        if verbosity > 0:
+            print("Finished: moved the versions of {0} people".format(
+                converted
+            ))
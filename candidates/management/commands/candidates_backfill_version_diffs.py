@@ -0,0 +1,67 @@
+from __future__ import print_function, unicode_literals
+
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from candidates.diffs import get_versions_parent_diff_operations
+from candidates.models import PersonVersion
+from candidates.models.versions import InconsistentVersionHistory
+
+
+class Command(BaseCommand):
+
+    help = "Work out and store the diffs of versions that don't have them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='How many people to update in each transaction'
+        )
+
+    def update_person(self, person_id):
+        person_versions = list(PersonVersion.objects.filter(person_id=person_id))
+        try:
+            id_to_parent_diff_operations = get_versions_parent_diff_operations(
+                [pv.as_version() for pv in person_versions]
+            )
+        except InconsistentVersionHistory as e:
+            print("Skipping person with ID {0}: {1}".format(person_id, e))
+            return
+        for person_version in person_versions:
+            if person_version.diffs:
+                continue
+            PersonVersion.objects.filter(pk=person_version.pk).update(
+                diffs=json.dumps(
+                    id_to_parent_diff_operations[person_version.version_id]
+                )
+            )
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        updated = 0
+        last_person_id = 0
+        while True:
+            person_ids = list(
+                PersonVersion.objects
+                .filter(diffs='', person_id__gt=last_person_id)
+                .order_by('person_id')
+                .values_list('person_id', flat=True)
+                .distinct()[:options['batch_size']]
+            )
+            if not person_ids:
+                break
+            with transaction.atomic():
+                for person_id in person_ids:
+                    self.update_person(person_id)
+            updated += len(person_ids)
+            last_person_id = person_ids[-1]
+            if verbosity > 1:
+                print("Stored the version diffs of {0} people".format(updated))
+        if verbosity > 0:
+            print("Finished: stored the version diffs of {0} people".format(
+                updated
+            ))
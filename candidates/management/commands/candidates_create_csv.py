@@ -1,49 +1,155 @@
 from __future__ import unicode_literals
 
-from collections import defaultdict
-from os import chmod, rename
-from os.path import dirname
-from tempfile import NamedTemporaryFile
+from multiprocessing import Pool
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db import reset_queries
+from django.db import connections, reset_queries
+from django.db.models import Max, Min
 
-from candidates.csv_helpers import list_to_csv
+from usersettings.shortcuts import get_current_usersettings
+
+from candidates.csv_helpers import SortedCSVFile
 from candidates.models import PersonExtra
 from candidates.models.fields import get_complex_popolo_fields
+from candidates.utils import keyset_iterator
 from elections.models import Election
 
 
 FETCH_AT_A_TIME = 1000
 
 
-def queryset_iterator(qs, complex_popolo_fields):
+def queryset_iterator(qs, complex_popolo_fields, chunk_size=FETCH_AT_A_TIME):
     # To save building up a huge list of queries when DEBUG = True,
     # call reset_queries:
     reset_queries()
-    start_index = 0
-    while True:
-        chunk_qs = qs.order_by('pk')[start_index:start_index + FETCH_AT_A_TIME]
-        empty = True
-        for person_extra in chunk_qs.joins_for_csv_output():
-            empty = False
-            person_extra.complex_popolo_fields = complex_popolo_fields
-            yield person_extra
-        if empty:
-            return
-        start_index += FETCH_AT_A_TIME
-
-
-def safely_write(output_filename, people, group_by_post):
-    csv = list_to_csv(people, group_by_post)
-    # Write to a temporary file and atomically rename into place:
-    ntf = NamedTemporaryFile(
-        delete=False,
-        dir=dirname(output_filename)
+    for person_extra in keyset_iterator(
+            qs.joins_for_csv_output(), chunk_size, distinct=True
+    ):
+        person_extra.complex_popolo_fields = complex_popolo_fields
+        yield person_extra
+
+
+def get_output_filenames(output_prefix, election):
+    if election is None:
+        return {
+            False: output_prefix + '-all.csv',
+            True: output_prefix + '-elected-all.csv',
+        }
+    return {
+        False: output_prefix + '-' + election.slug + '.csv',
+        True: output_prefix + '-elected-' + election.slug + '.csv',
+    }
+
+
+class CSVExport(object):
+    """Route the CSV rows of each person to every file they belong in
+
+    There is a CSV file of all candidates and one of elected candidates
+    for each election, and the same pair for all elections together
+    (unless only_election is given). Every person only needs to be
+    fetched once to add their rows to all of these files."""
+
+    def __init__(self, output_prefix, elections, only_election, base_url,
+                 temp_dir, chunk_size=FETCH_AT_A_TIME, sequence_prefix=0):
+        self.base_url = base_url
+        self.chunk_size = chunk_size
+        self.only_election = only_election
+        self.files = {}
+        for election in elections:
+            if only_election and election != only_election:
+                continue
+            self.add_files(
+                output_prefix, election, temp_dir, sequence_prefix)
+        if not only_election:
+            self.add_files(output_prefix, None, temp_dir, sequence_prefix)
+
+    def add_files(self, output_prefix, election, temp_dir, sequence_prefix):
+        election_slug = election.slug if election else None
+        group_by_post = election is not None
+        for elected, output_filename in get_output_filenames(
+                output_prefix, election
+        ).items():
+            self.files[(election_slug, elected)] = SortedCSVFile(
+                output_filename,
+                group_by_post,
+                temp_dir,
+                sequence_prefix=sequence_prefix,
+            )
+
+    def get_people(self):
+        qs = PersonExtra.objects.all()
+        if self.only_election:
+            qs = qs.filter(
+                base__memberships__extra__election=self.only_election,
+                base__memberships__role=self.only_election.candidate_membership_role,
+            )
+        return qs
+
+    def add_person(self, person_extra, user_settings=None):
+        for election, all_elections_row, election_row in \
+                person_extra.as_dicts_for_csv_files(
+                    self.base_url, user_settings):
+            if self.only_election and election != self.only_election:
+                continue
+            elected = election_row['elected'] == 'True'
+            self.add_row(election.slug, elected, election_row)
+            if not self.only_election:
+                self.add_row(None, elected, all_elections_row)
+
+    def add_row(self, election_slug, elected, row):
+        self.files[(election_slug, False)].add(row)
+        if elected:
+            self.files[(election_slug, True)].add(row)
+
+    def add_people(self, qs, complex_popolo_fields):
+        user_settings = get_current_usersettings()
+        for person_extra in queryset_iterator(
+                qs, complex_popolo_fields, self.chunk_size
+        ):
+            self.add_person(person_extra, user_settings)
+
+    def write_runs(self):
+        """Write out all rows to sorted runs and return their filenames"""
+        result = {}
+        for key, sorted_csv_file in self.files.items():
+            sorted_csv_file.write_run()
+            result[key] = sorted_csv_file.run_filenames
+        return result
+
+    def add_runs(self, runs):
+        for key, run_filenames in runs.items():
+            self.files[key].add_runs(run_filenames)
+
+    def write(self):
+        for sorted_csv_file in self.files.values():
+            sorted_csv_file.write()
+
+
+def export_pk_range(kwargs):
+    """Create sorted runs for the people in one range of primary keys
+
+    This is run in a worker process when the --workers option is used."""
+    pk_range = kwargs.pop('pk_range')
+    export = CSVExport(**kwargs)
+    qs = export.get_people().filter(
+        pk__gte=pk_range[0], pk__lt=pk_range[1]
     )
-    ntf.write(csv.encode('utf-8'))
-    chmod(ntf.name, 0o644)
-    rename(ntf.name, output_filename)
+    export.add_people(qs, get_complex_popolo_fields())
+    return export.write_runs()
+
+
+def split_pk_range(qs, number_of_ranges):
+    pk_limits = qs.aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+    if pk_limits['min_pk'] is None:
+        return []
+    min_pk, max_pk = pk_limits['min_pk'], pk_limits['max_pk'] + 1
+    step = max(1, (max_pk - min_pk + number_of_ranges - 1) // number_of_ranges)
+    return [
+        (start, min(start + step, max_pk))
+        for start in range(min_pk, max_pk, step)
+    ]
 
 
 class Command(BaseCommand):
@@ -64,68 +170,77 @@ class Command(BaseCommand):
             metavar='ELECTION-SLUG',
             help='Only output CSV for the election with this slug'
         )
-
-    def get_people(self, election, qs):
-        all_people = []
-        elected_people = []
-        for person_extra in queryset_iterator(
-                qs, self.complex_popolo_fields
-        ):
-            for d in person_extra.as_list_of_dicts(
-                election,
-                base_url=self.options['site_base_url']
-            ):
-                all_people.append(d)
-                if d['elected'] == 'True':
-                    elected_people.append(d)
-        return all_people, elected_people
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='The number of processes to fetch people with (default 1)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=FETCH_AT_A_TIME,
+            help='How many people to fetch in each query (default {0})'.format(
+                FETCH_AT_A_TIME
+            )
+        )
 
     def handle(self, **options):
+        only_election = None
         if options['election']:
             try:
-                all_elections = [Election.objects.get(slug=options['election'])]
+                only_election = Election.objects.get(slug=options['election'])
             except Election.DoesNotExist:
                 message = "Couldn't find an election with slug {election_slug}"
                 raise CommandError(message.format(election_slug=options['election']))
-        else:
-            all_elections = list(Election.objects.all()) + [None]
-
-        self.options = options
-        self.complex_popolo_fields = get_complex_popolo_fields()
-
-        for election in all_elections:
-            if election is None:
-                # Get information for every candidate in every
-                # election.
-                qs = PersonExtra.objects.all()
-                all_people, elected_people = self.get_people(election, qs)
-                output_filenames = {
-                    'all': options['OUTPUT-PREFIX'] + '-all.csv',
-                    'elected': options['OUTPUT-PREFIX'] + '-elected-all.csv'
-                }
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        temp_dir = mkdtemp(prefix='candidates-csv-')
+        try:
+            export_kwargs = {
+                'output_prefix': options['OUTPUT-PREFIX'],
+                'elections': list(Election.objects.all()),
+                'only_election': only_election,
+                'base_url': options['site_base_url'],
+                'temp_dir': temp_dir,
+                'chunk_size': options['chunk_size'],
+            }
+            export = CSVExport(**export_kwargs)
+            if options['workers'] == 1:
+                export.add_people(
+                    export.get_people(), get_complex_popolo_fields()
+                )
             else:
-                # Only get the candidates standing in that particular
-                # election
-                role = election.candidate_membership_role
-                qs = PersonExtra.objects.filter(
-                    base__memberships__extra__election=election,
-                    base__memberships__role=role,
+                self.add_people_in_parallel(
+                    export, export_kwargs, options['workers']
                 )
-                all_people, elected_people = self.get_people(election, qs)
-                output_filenames = {
-                    'all': options['OUTPUT-PREFIX'] + \
-                        '-' + election.slug + '.csv',
-                    'elected': options['OUTPUT-PREFIX'] +
-                        '-elected-' + election.slug + '.csv',
-                }
-            group_by_post = election is not None
-            safely_write(
-                output_filenames['all'],
-                all_people,
-                group_by_post,
-            )
-            safely_write(
-                output_filenames['elected'],
-                elected_people,
-                group_by_post,
+            export.write()
+        finally:
+            rmtree(temp_dir)
+
+    def add_people_in_parallel(self, export, export_kwargs, workers):
+        pk_ranges = split_pk_range(export.get_people(), workers)
+        # The worker processes mustn't share the parent's database
+        # connection, so close it before they're forked:
+        connections.close_all()
+        pool = Pool(workers)
+        try:
+            all_runs = pool.map(
+                export_pk_range,
+                [
+                    dict(
+                        export_kwargs,
+                        pk_range=pk_range,
+                        sequence_prefix=i
+                    )
+                    for i, pk_range in enumerate(pk_ranges)
+                ]
             )
+        finally:
+            pool.close()
+            pool.join()
+        for runs in all_runs:
+            export.add_runs(runs)
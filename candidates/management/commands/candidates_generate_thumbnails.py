@@ -0,0 +1,77 @@
+from __future__ import division, print_function, unicode_literals
+
+from multiprocessing import Pool
+from time import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.six.moves import map
+
+from compat import text_type
+from images.models import Image
+
+from candidates.thumbnails import generate_thumbnails
+
+
+def generate_thumbnails_for_file(image_name):
+    """Make the thumbnails of one image file, returning any error
+
+    This is run in a worker process when the --workers option is used."""
+    try:
+        generate_thumbnails(image_name)
+    except Exception as e:
+        return image_name, text_type(e)
+    return image_name, None
+
+
+class Command(BaseCommand):
+
+    help = "Make the thumbnails of every image that templates and the API use"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='The number of processes to make thumbnails with (default 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        verbosity = int(options['verbosity'])
+        # Images with the same file only need their thumbnails made once:
+        image_names = sorted(
+            set(Image.objects.exclude(image='').values_list('image', flat=True))
+        )
+        start = time()
+        pool = None
+        if options['workers'] > 1:
+            # The worker processes mustn't share the parent's database
+            # connection, so close it before they're forked:
+            connections.close_all()
+            pool = Pool(options['workers'])
+            results = pool.imap_unordered(
+                generate_thumbnails_for_file, image_names, chunksize=4)
+        else:
+            results = map(generate_thumbnails_for_file, image_names)
+        try:
+            for image_name, error in results:
+                if error is not None:
+                    print("Failed to make thumbnails of {0}: {1}".format(
+                        image_name, error))
+                elif verbosity > 1:
+                    print("Made thumbnails of {0}".format(image_name))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if verbosity > 0:
+            elapsed = time() - start
+            print(
+                "Made thumbnails of {0} images in {1:.1f} seconds "
+                "({2:.1f} images per second)".format(
+                    len(image_names), elapsed,
+                    len(image_names) / max(elapsed, 0.001)
+                )
+            )
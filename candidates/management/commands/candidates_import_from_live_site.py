@@ -1,13 +1,18 @@
 from __future__ import print_function, unicode_literals
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import errno
 import hashlib
 import json
+import math
+import os
 from os import makedirs
 from os.path import dirname, exists, join
 import re
 import shutil
+import threading
 
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
@@ -20,7 +25,10 @@ from django.utils.six.moves.urllib_parse import urlsplit, urlunsplit
 
 import requests
 
+from cached_counts.models import update_counts_for_memberships
 from candidates import models
+from candidates.bulk_import import update_search_index
+from candidates.models.versions import build_person_versions
 from elections import models as emodels
 from popolo import models as pmodels
 from images.models import Image
@@ -29,6 +37,30 @@ from ..images import get_image_extension
 
 CACHE_DIRECTORY = join(dirname(__file__), '.download-cache')
 
+# The stages of the import, in order; each is named after the API
+# endpoint it reads from.  The data from the last three is imported
+# (and the progress recorded in the checkpoint file) a page at a
+# time, so an interrupted import can carry on from the last page
+# that was imported.  The others are each imported in a single
+# transaction.
+STAGES = (
+    'extra_fields',
+    'simple_fields',
+    'complex_fields',
+    'area_types',
+    'party_sets',
+    'organizations',
+    'areas',
+    'elections',
+    'posts',
+    'post_elections',
+    'persons',
+    'memberships',
+    'images',
+)
+
+PAGED_STAGES = ('persons', 'memberships', 'images')
+
 # n.b. There is some repeated code between here and
 # candidates/migrations/0009_migrate_to_django_popolo.py, but we want
 # to keep the code in the migration frozen, and factoring it out would
@@ -60,18 +92,100 @@ def show_data_on_error(variable_name, data):
         raise
 
 
+class Checkpoint(object):
+    """Records which stages and pages of an import have been committed
+
+    This is kept in a JSON file, which is replaced (rather than
+    rewritten in place) each time it's saved, so it's never left
+    half-written if the import is killed."""
+
+    def __init__(self, filename, site_url):
+        self.filename = filename
+        self.data = {
+            'site_url': site_url,
+            'completed_stages': [],
+            'last_page': {},
+        }
+
+    def load(self):
+        if not exists(self.filename):
+            msg = "There's no checkpoint file {0} to resume the import from"
+            raise CommandError(msg.format(self.filename))
+        with open(self.filename) as f:
+            data = json.load(f)
+        if data['site_url'] != self.data['site_url']:
+            msg = "The checkpoint file {0} is for a different site ({1})"
+            raise CommandError(msg.format(self.filename, data['site_url']))
+        self.data = data
+
+    def save(self):
+        directory = dirname(self.filename)
+        if directory:
+            try:
+                makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.data, f)
+        os.rename(tmp_filename, self.filename)
+
+    def remove(self):
+        if exists(self.filename):
+            os.remove(self.filename)
+
+    def is_completed(self, stage):
+        return stage in self.data['completed_stages']
+
+    def stage_completed(self, stage):
+        self.data['completed_stages'].append(stage)
+        self.data['last_page'].pop(stage, None)
+        self.save()
+
+    def get_last_page(self, stage):
+        return self.data['last_page'].get(stage, 0)
+
+    def page_completed(self, stage, page):
+        self.data['last_page'][stage] = page
+        self.save()
+
+
 class Command(BaseCommand):
     help = 'Import all data from a live YNR site'
 
     def __init__(self, *args, **kwargs):
         super(Command, self).__init__(*args, **kwargs)
         self.image_storage = FileSystemStorage()
+        self.thread_data = threading.local()
 
     def add_arguments(self, parser):
         parser.add_argument(
             'SITE-URL',
             help='Base URL for the live site'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='How many API pages or images to download at once (default 4)'
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=200,
+            help='How many results to request in each page from the API'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Carry on with an import that was interrupted'
+        )
+        parser.add_argument(
+            '--checkpoint-file',
+            help='The file to record the progress of the import in '
+            '(by default this is in the download cache directory)'
+        )
 
     def check_database_is_empty(self):
         non_empty_models = []
@@ -103,20 +217,71 @@ class Command(BaseCommand):
         models.SimplePopoloField.objects.all().delete()
         models.ComplexPopoloField.objects.all().delete()
 
-    def get_api_results(self, endpoint):
-        page = 1
-        while True:
-            url = '{base_url}{endpoint}/?format=json&page={page}&page_size=200'.format(
-                base_url=self.base_api_url, endpoint=endpoint, page=page
-            )
-            self.stdout.write("Fetching " + url)
-            r = requests.get(url)
-            data = r.json()
-            for result in data['results']:
-                yield(result)
-            if not data['next']:
+    def get_session(self):
+        # Each download thread keeps its own session, so that
+        # connections to the site are reused:
+        session = getattr(self.thread_data, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self.thread_data.session = session
+        return session
+
+    def get_api_page(self, endpoint, page):
+        url = '{base_url}{endpoint}/?format=json&page={page}&page_size={page_size}'.format(
+            base_url=self.base_api_url, endpoint=endpoint, page=page,
+            page_size=self.page_size
+        )
+        self.stdout.write("Fetching " + url)
+        r = self.get_session().get(url)
+        if page > 1 and r.status_code == 404:
+            # We've asked for the page after the last one:
+            return None
+        r.raise_for_status()
+        return r.json()
+
+    def get_api_pages(self, endpoint, first_page=1):
+        """Yield each page number and its results from an API endpoint
+
+        Once the first page has told us how many results there are,
+        the remaining pages are fetched 'workers' at a time, but still
+        yielded in order."""
+        data = self.get_api_page(endpoint, first_page)
+        if data is None:
+            return
+        yield first_page, data['results']
+        if not data['next']:
+            return
+        last_page = int(math.ceil(data['count'] / float(self.page_size)))
+        pending = deque()
+        next_page = first_page + 1
+        while pending or next_page <= last_page:
+            # Don't get too far ahead of the pages being imported:
+            while next_page <= last_page and len(pending) < 2 * self.workers:
+                pending.append((next_page, self.executor.submit(
+                    self.get_api_page, endpoint, next_page
+                )))
+                next_page += 1
+            page, future = pending.popleft()
+            data = future.result()
+            if data is None:
                 break
-            page += 1
+            yield page, data['results']
+
+    def get_api_results(self, endpoint):
+        for page, results in self.get_api_pages(endpoint):
+            for result in results:
+                yield result
+
+    def mirror_pages(self, stage, import_page):
+        """Import each page of a stage that hasn't been imported yet
+
+        Each page's results are imported in a transaction, and the
+        page is recorded in the checkpoint once that's committed."""
+        first_page = self.checkpoint.get_last_page(stage) + 1
+        for page, results in self.get_api_pages(stage, first_page):
+            with transaction.atomic():
+                import_page(results)
+            self.checkpoint.page_completed(stage, page)
 
     def add_related(self, o, model_class, related_data_list):
         for related_data in related_data_list:
@@ -134,42 +299,61 @@ class Command(BaseCommand):
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise
-        filename = join(CACHE_DIRECTORY, hashlib.md5(url).hexdigest())
+        filename = join(
+            CACHE_DIRECTORY, hashlib.md5(url.encode('utf-8')).hexdigest()
+        )
         if exists(filename):
             return filename
         else:
-            print("\nDownloading {0} ...".format(url))
-            with open(filename, 'wb') as f:
-                r = requests.get(url, stream=True)
+            print("Downloading {0} ...".format(url))
+            # Download to a temporary file first, so that an
+            # interrupted download isn't mistaken for a cached file:
+            tmp_filename = '{0}.{1}.tmp'.format(
+                filename, threading.current_thread().ident
+            )
+            with open(tmp_filename, 'wb') as f:
+                r = self.get_session().get(url, stream=True)
                 r.raise_for_status()
                 r.raw.decode_content = True
                 shutil.copyfileobj(r.raw, f)
-            print("done")
+            os.rename(tmp_filename, filename)
         return filename
 
-    def mirror_from_api(self):
+    def mirror_extra_fields(self):
         for extra_field in self.get_api_results('extra_fields'):
             with show_data_on_error('extra_field', extra_field):
                 del extra_field['url']
                 models.ExtraField.objects.create(**extra_field)
+
+    def mirror_simple_fields(self):
         for simple_field in self.get_api_results('simple_fields'):
             with show_data_on_error('simple_field', simple_field):
                 simple_field.pop('url', None)
                 models.SimplePopoloField.objects.create(**simple_field)
+
+    def mirror_complex_fields(self):
         for complex_field in self.get_api_results('complex_fields'):
             with show_data_on_error('complex_field', complex_field):
                 complex_field.pop('url', None)
                 models.ComplexPopoloField.objects.create(**complex_field)
+
+    def mirror_area_types(self):
         for area_type_data in self.get_api_results('area_types'):
             with show_data_on_error('area_type_data', area_type_data):
                 del area_type_data['url']
                 emodels.AreaType.objects.create(**area_type_data)
-        party_sets_by_slug = {}
+
+    def mirror_party_sets(self):
         for party_set_data in self.get_api_results('party_sets'):
             with show_data_on_error('party_set_data', party_set_data):
                 del party_set_data['url']
-                party_set = models.PartySet.objects.create(**party_set_data)
-                party_sets_by_slug[party_set.slug] = party_set
+                models.PartySet.objects.create(**party_set_data)
+
+    def mirror_organizations(self):
+        party_sets_by_slug = {
+            party_set.slug: party_set
+            for party_set in models.PartySet.objects.all()
+        }
         organization_to_parent = {}
         for organization_data in self.get_api_results('organizations'):
             with show_data_on_error('organization_data', organization_data):
@@ -213,6 +397,8 @@ class Command(BaseCommand):
             parent = pmodels.Organization.objects.get(extra__slug=parent_slug)
             child.parent = parent
             child.save()
+
+    def mirror_areas(self):
         area_to_parent = {}
         for area_data in self.get_api_results('areas'):
             with show_data_on_error('area_data', area_data):
@@ -223,7 +409,7 @@ class Command(BaseCommand):
                     name=area_data['name'],
                 )
                 self.add_related(
-                    o, pmodels.Identifier, area_data['other_identifiers']
+                    a, pmodels.Identifier, area_data['other_identifiers']
                 )
                 ae = models.AreaExtra(base=a)
                 if area_data['type']:
@@ -252,6 +438,8 @@ class Command(BaseCommand):
             parent = pmodels.Area.objects.get(id=parent_id)
             child.parent = parent
             child.save()
+
+    def mirror_elections(self):
         for election_data in self.get_api_results('elections'):
             with show_data_on_error('election_data', election_data):
                 kwargs = {
@@ -283,6 +471,8 @@ class Command(BaseCommand):
                     e.area_types.add(
                         emodels.AreaType.objects.get(pk=area_type_data['id'])
                     )
+
+    def mirror_posts(self):
         for post_data in self.get_api_results('posts'):
             with show_data_on_error('post_data', post_data):
                 p = pmodels.Post(
@@ -314,6 +504,8 @@ class Command(BaseCommand):
                         postextra=pe,
                         election=election
                     )
+
+    def mirror_post_elections(self):
         for post_election_data in self.get_api_results('post_elections'):
             with show_data_on_error('post_election_data', post_election_data):
                 pe_election = models.PostExtraElection.objects.get(
@@ -322,153 +514,288 @@ class Command(BaseCommand):
                 )
                 pe_election.winner_count = post_election_data['winner_count']
                 pe_election.save()
+
+    def mirror_persons(self):
+        person_content_type = ContentType.objects.get_for_model(pmodels.Person)
         extra_fields = {
             ef.key: ef for ef in models.ExtraField.objects.all()
         }
-        for person_data in self.get_api_results('persons'):
-            with show_data_on_error('person_data', person_data):
-                kwargs = {
-                    k: person_data[k] for k in
-                    (
-                        'id',
-                        'name',
-                        'honorific_prefix',
-                        'honorific_suffix',
-                        'sort_name',
-                        'email',
-                        'gender',
-                        'birth_date',
-                        'death_date',
-                    )
-                }
-                p = pmodels.Person.objects.create(**kwargs)
-                self.add_related(
-                    p, pmodels.Identifier, person_data['identifiers']
-                )
-                self.add_related(
-                    p, pmodels.ContactDetail, person_data['contact_details']
-                )
-                self.add_related(
-                    p, pmodels.OtherName, person_data['other_names']
-                )
-                self.add_related(
-                    p, pmodels.Link, person_data['links']
-                )
-                kwargs = {
-                    'base': p,
-                    'versions': json.dumps(person_data['versions'])
-                }
-                pe = models.PersonExtra.objects.create(**kwargs)
-                # Look for any data in ExtraFields
-                for extra_field_data in person_data['extra_fields']:
-                    p.extra_field_values.create(
-                        field=extra_fields[extra_field_data['key']],
-                        value=extra_field_data['value'],
+        def import_page(results):
+            # If the page was partly imported before, it will have
+            # been rolled back, but in case the live site has changed
+            # since, skip anyone who's already been imported:
+            existing_ids = set(pmodels.Person.objects.filter(
+                pk__in=[person_data['id'] for person_data in results]
+            ).values_list('pk', flat=True))
+            people = []
+            related = {
+                pmodels.Identifier: [],
+                pmodels.ContactDetail: [],
+                pmodels.OtherName: [],
+                pmodels.Link: [],
+            }
+            person_versions = []
+            extra_field_values = []
+            for person_data in results:
+                if person_data['id'] in existing_ids:
+                    continue
+                with show_data_on_error('person_data', person_data):
+                    kwargs = {
+                        k: person_data[k] for k in
+                        (
+                            'id',
+                            'name',
+                            'honorific_prefix',
+                            'honorific_suffix',
+                            'sort_name',
+                            'email',
+                            'gender',
+                            'birth_date',
+                            'death_date',
+                        )
+                    }
+                    # bulk_create doesn't send pre_save, so set these
+                    # as django-popolo's handler would:
+                    kwargs['start_date'] = kwargs['birth_date']
+                    kwargs['end_date'] = kwargs['death_date']
+                    p = pmodels.Person(**kwargs)
+                    people.append(p)
+                    for model_class, key in (
+                            (pmodels.Identifier, 'identifiers'),
+                            (pmodels.ContactDetail, 'contact_details'),
+                            (pmodels.OtherName, 'other_names'),
+                            (pmodels.Link, 'links'),
+                    ):
+                        related[model_class] += [
+                            model_class(
+                                content_type=person_content_type,
+                                object_id=p.id,
+                                **related_data
+                            )
+                            for related_data in person_data[key]
+                        ]
+                    person_versions += build_person_versions(
+                        p, person_data['versions']
                     )
+                    # Look for any data in ExtraFields
+                    extra_field_values += [
+                        models.PersonExtraFieldValue(
+                            person=p,
+                            field=extra_fields[extra_field_data['key']],
+                            value=extra_field_data['value'],
+                        )
+                        for extra_field_data in person_data['extra_fields']
+                    ]
+            pmodels.Person.objects.bulk_create(people)
+            models.PersonExtra.objects.bulk_create([
+                models.PersonExtra(base=p) for p in people
+            ])
+            for model_class, objects in related.items():
+                model_class.objects.bulk_create(objects)
+            models.PersonVersion.objects.bulk_create(person_versions)
+            models.PersonExtraFieldValue.objects.bulk_create(
+                extra_field_values
+            )
+            update_search_index([p.id for p in people])
 
-        for m_data in self.get_api_results('memberships'):
-            with show_data_on_error('m_data', m_data):
-                kwargs = {
-                    k: m_data[k] for k in
-                    ('label', 'role', 'start_date', 'end_date')
-                }
-                kwargs['person'] = pmodels.Person.objects.get(
-                    pk=m_data['person']['id']
-                )
-                if m_data.get('on_behalf_of'):
-                    kwargs['on_behalf_of'] = pmodels.Organization.objects.get(
-                        extra__slug=m_data['on_behalf_of']['id']
-                    )
-                if m_data.get('organization'):
-                    kwargs['organization'] = pmodels.Organization.objects.get(
-                        extra__slug=m_data['organization']['id']
-                    )
-                if m_data.get('post'):
-                    kwargs['post'] = pmodels.Post.objects.get(
-                        extra__slug=m_data['post']['id']
-                    )
-                m = pmodels.Membership.objects.create(**kwargs)
-                kwargs = {
-                    'base': m,
-                    'elected': m_data['elected'],
-                    'party_list_position': m_data['party_list_position'],
-                }
-                if m_data.get('election'):
-                    kwargs['election'] = emodels.Election.objects.get(
-                        slug=m_data['election']['id']
-                    )
-                models.MembershipExtra.objects.create(**kwargs)
-        for image_data in self.get_api_results('images'):
-            with show_data_on_error('image_data', image_data):
-                endpoint, object_id = re.search(
-                    r'api/v0.9/(\w+)/([^/]*)/',
-                    image_data['content_object']
-                ).groups()
-                if endpoint == 'organizations':
-                    django_object = models.OrganizationExtra.objects.get(
-                        slug=object_id
-                    )
-                elif endpoint == 'persons':
-                    django_object = models.PersonExtra.objects.get(
-                        base__id=object_id
-                    )
-                else:
-                    msg = "Image referring to unhandled endpoint {0}"
-                    raise Exception(msg.format(endpoint))
-                suggested_filename = re.search(
-                    r'/([^/]+)$',
-                    image_data['image_url']
-                ).group(1)
-                full_url = self.base_url + image_data['image_url']
-                image_filename = self.get_url_cached(full_url)
-                extension = get_image_extension(image_filename)
-                if not extension:
+        self.mirror_pages('persons', import_page)
+
+    def mirror_memberships(self):
+        organization_slug_to_id = dict(
+            models.OrganizationExtra.objects.values_list('slug', 'base_id')
+        )
+        post_slug_to_id = dict(
+            models.PostExtra.objects.values_list('slug', 'base_id')
+        )
+        election_slug_to_id = dict(
+            emodels.Election.objects.values_list('slug', 'id')
+        )
+        def import_page(results):
+            existing_ids = set(pmodels.Membership.objects.filter(
+                pk__in=[m_data['id'] for m_data in results]
+            ).values_list('pk', flat=True))
+            memberships = []
+            membership_extras = []
+            for m_data in results:
+                if m_data['id'] in existing_ids:
                     continue
-                models.ImageExtra.objects.update_or_create_from_file(
-                    image_filename,
-                    join('images', suggested_filename),
-                    md5sum=image_data['md5sum'] or '',
-                    defaults = {
-                        'uploading_user': self.get_user_from_username(
-                            image_data['uploading_user']
-                        ),
-                        'copyright': image_data['copyright'] or '',
-                        'notes': image_data['notes'] or '',
-                        'user_copyright': image_data['user_copyright'] or '',
-                        'user_notes': image_data['user_notes'] or '',
-                        'base__source': image_data['source'] or '',
-                        'base__is_primary': image_data['is_primary'],
-                        'base__object_id': django_object.id,
-                        'base__content_type_id':
-                        ContentType.objects.get_for_model(django_object).id
+                with show_data_on_error('m_data', m_data):
+                    kwargs = {
+                        k: m_data[k] for k in
+                        ('id', 'label', 'role', 'start_date', 'end_date')
                     }
-                )
+                    kwargs['person_id'] = m_data['person']['id']
+                    if m_data.get('on_behalf_of'):
+                        kwargs['on_behalf_of_id'] = \
+                            organization_slug_to_id[m_data['on_behalf_of']['id']]
+                    if m_data.get('organization'):
+                        kwargs['organization_id'] = \
+                            organization_slug_to_id[m_data['organization']['id']]
+                    if m_data.get('post'):
+                        kwargs['post_id'] = \
+                            post_slug_to_id[m_data['post']['id']]
+                    memberships.append(pmodels.Membership(**kwargs))
+                    kwargs = {
+                        'base_id': m_data['id'],
+                        'elected': m_data['elected'],
+                        'party_list_position': m_data['party_list_position'],
+                    }
+                    if m_data.get('election'):
+                        kwargs['election_id'] = \
+                            election_slug_to_id[m_data['election']['id']]
+                    membership_extras.append(models.MembershipExtra(**kwargs))
+            pmodels.Membership.objects.bulk_create(memberships)
+            models.MembershipExtra.objects.bulk_create(membership_extras)
+            models.CandidacyListing.objects.update_for_memberships(
+                [m.id for m in memberships]
+            )
+            update_counts_for_memberships([m.id for m in memberships])
+            # People can be found by the names of their parties, which
+            # weren't known when they were imported:
+            update_search_index(set(m.person_id for m in memberships))
+
+        self.mirror_pages('memberships', import_page)
+
+    def mirror_images(self):
+        content_types = {
+            'organizations': ContentType.objects.get_for_model(
+                models.OrganizationExtra
+            ),
+            'persons': ContentType.objects.get_for_model(models.PersonExtra),
+        }
+        def import_page(results):
+            endpoints_and_ids = []
+            for image_data in results:
+                with show_data_on_error('image_data', image_data):
+                    endpoint, object_id = re.search(
+                        r'api/v0.9/(\w+)/([^/]*)/',
+                        image_data['content_object']
+                    ).groups()
+                    if endpoint not in content_types:
+                        msg = "Image referring to unhandled endpoint {0}"
+                        raise Exception(msg.format(endpoint))
+                    endpoints_and_ids.append((endpoint, object_id))
+            organization_slug_to_id = dict(
+                models.OrganizationExtra.objects.filter(slug__in=[
+                    object_id for endpoint, object_id in endpoints_and_ids
+                    if endpoint == 'organizations'
+                ]).values_list('slug', 'id')
+            )
+            person_id_to_id = dict(
+                models.PersonExtra.objects.filter(base_id__in=[
+                    object_id for endpoint, object_id in endpoints_and_ids
+                    if endpoint == 'persons'
+                ]).values_list('base_id', 'id')
+            )
+            # Download all the images on this page at once:
+            image_filenames = self.executor.map(
+                self.get_url_cached,
+                [self.base_url + image_data['image_url']
+                 for image_data in results]
+            )
+            for image_data, (endpoint, object_id), image_filename in zip(
+                    results, endpoints_and_ids, image_filenames
+            ):
+                with show_data_on_error('image_data', image_data):
+                    if endpoint == 'organizations':
+                        django_object_id = organization_slug_to_id[object_id]
+                    else:
+                        django_object_id = person_id_to_id[int(object_id)]
+                    suggested_filename = re.search(
+                        r'/([^/]+)$',
+                        image_data['image_url']
+                    ).group(1)
+                    extension = get_image_extension(image_filename)
+                    if not extension:
+                        continue
+                    models.ImageExtra.objects.update_or_create_from_file(
+                        image_filename,
+                        join('images', suggested_filename),
+                        md5sum=image_data['md5sum'] or '',
+                        defaults = {
+                            'uploading_user': self.get_user_from_username(
+                                image_data['uploading_user']
+                            ),
+                            'copyright': image_data['copyright'] or '',
+                            'notes': image_data['notes'] or '',
+                            'user_copyright': image_data['user_copyright'] or '',
+                            'user_notes': image_data['user_notes'] or '',
+                            'base__source': image_data['source'] or '',
+                            'base__is_primary': image_data['is_primary'],
+                            'base__object_id': django_object_id,
+                            'base__content_type_id': content_types[endpoint].id,
+                        }
+                    )
+
+        self.mirror_pages('images', import_page)
+
+    @staticmethod
+    def sequence_reset_models():
+        # These are the models whose objects are created with the
+        # primary keys from the live site:
+        return [
+            emodels.AreaType, models.PartySet, pmodels.Area,
+            emodels.Election, Image, models.ExtraField,
+            models.SimplePopoloField, models.ComplexPopoloField,
+            pmodels.Person, pmodels.Membership,
+        ]
+
+    def reset_sequences(self):
         reset_sql_list = connection.ops.sequence_reset_sql(
-            no_style(), [
-                emodels.AreaType, models.PartySet, pmodels.Area,
-                emodels.Election, Image, models.ExtraField,
-                models.SimplePopoloField, models.ComplexPopoloField,
-                pmodels.Person,
-            ]
+            no_style(), self.sequence_reset_models()
         )
         if reset_sql_list:
             cursor = connection.cursor()
             for reset_sql in reset_sql_list:
                 cursor.execute(reset_sql)
 
+    def mirror_from_api(self):
+        for stage in STAGES:
+            if self.checkpoint.is_completed(stage):
+                print("Skipping {0}, which was already imported".format(stage))
+                continue
+            mirror_stage = getattr(self, 'mirror_' + stage)
+            if stage in PAGED_STAGES:
+                mirror_stage()
+            else:
+                with transaction.atomic():
+                    mirror_stage()
+            self.checkpoint.stage_completed(stage)
+        self.reset_sequences()
+
     def handle(self, **options):
-        with transaction.atomic():
-            split_url = urlsplit(options['SITE-URL'])
-            if (split_url.path not in ('', '/') \
-                or split_url.query
-                or split_url.fragment):
-                raise CommandError('You must only supply the base URL of the site')
-            # Then form the base API URL:
-            new_url_parts = list(split_url)
-            new_url_parts[2] = ''
-            self.base_url = urlunsplit(new_url_parts)
-            new_url_parts[2] = '/api/v0.9/'
-            self.base_api_url = urlunsplit(new_url_parts)
-            self.check_database_is_empty()
-            self.remove_field_objects()
+        split_url = urlsplit(options['SITE-URL'])
+        if (split_url.path not in ('', '/') \
+            or split_url.query
+            or split_url.fragment):
+            raise CommandError('You must only supply the base URL of the site')
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        self.workers = options['workers']
+        self.page_size = options['page_size']
+        # Then form the base API URL:
+        new_url_parts = list(split_url)
+        new_url_parts[2] = ''
+        self.base_url = urlunsplit(new_url_parts)
+        new_url_parts[2] = '/api/v0.9/'
+        self.base_api_url = urlunsplit(new_url_parts)
+        checkpoint_filename = options['checkpoint_file'] or join(
+            CACHE_DIRECTORY,
+            'checkpoint-{0}.json'.format(
+                hashlib.md5(self.base_url.encode('utf-8')).hexdigest()
+            )
+        )
+        self.checkpoint = Checkpoint(checkpoint_filename, self.base_url)
+        if options['resume']:
+            self.checkpoint.load()
+        else:
+            with transaction.atomic():
+                self.check_database_is_empty()
+                self.remove_field_objects()
+            self.checkpoint.save()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
             self.mirror_from_api()
+        finally:
+            self.executor.shutdown()
+        self.checkpoint.remove()
@@ -0,0 +1,37 @@
+from __future__ import print_function, unicode_literals
+
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from candidates.models import LoggedActionUpdate
+
+
+class Command(BaseCommand):
+
+    help = "Regenerate what depends on queued logged actions (e.g. CSV files)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='How many queued logged actions to process at a time'
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running, checking the queue every SECONDS'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = LoggedActionUpdate.objects.process(
+                batch_size=options['batch_size']
+            )
+            if processed and int(options['verbosity']) > 0:
+                print("Processed {0} logged actions".format(processed))
+            if not options['watch']:
+                break
+            sleep(options['watch'])
@@ -0,0 +1,19 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from candidates.models import CandidacyListing
+
+
+class Command(BaseCommand):
+
+    help = "Recreate the denormalized listing of every candidacy"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            CandidacyListing.objects.rebuild()
+        if int(options['verbosity']) > 0:
+            print("Finished: there are now {0} candidacy listings".format(
+                CandidacyListing.objects.count()
+            ))
@@ -0,0 +1,19 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from candidates.models import PersonSearchDocument
+
+
+class Command(BaseCommand):
+
+    help = "Recreate the search index of every person's names and parties"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            PersonSearchDocument.objects.rebuild()
+        if int(options['verbosity']) > 0:
+            print("Finished: {0} people are now in the search index".format(
+                PersonSearchDocument.objects.count()
+            ))
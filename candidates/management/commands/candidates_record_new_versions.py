@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from candidates.models import PersonExtra
+from candidates.utils import keyset_iterator
 
 
 class Command(BaseCommand):
@@ -32,7 +33,9 @@ class Command(BaseCommand):
         else:
             source = 'New version recorded from the command-line'
         with transaction.atomic():
-            for person_extra in PersonExtra.objects.filter(**kwargs):
+            for person_extra in keyset_iterator(
+                    PersonExtra.objects.filter(**kwargs).select_related('base')
+            ):
                 print("Recording the current version of {name} ({id})".format(
                     name=person_extra.base.name, id=person_extra.base.id
                 ).encode('utf-8'))
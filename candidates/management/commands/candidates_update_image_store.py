@@ -0,0 +1,60 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from candidates.models import ContentAddressedStorage, StoredImage
+from candidates.utils import keyset_iterator
+from images.models import Image
+from moderation_queue.models import QueuedImage
+
+
+class Command(BaseCommand):
+
+    help = "Delete unused files from the image store, optionally adding " \
+        "images saved before it existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--add-existing',
+            action='store_true',
+            help='Move the files of images and queued images that are '
+            'not in the image store into it (this changes their URLs)'
+        )
+
+    def add_existing(self, verbosity):
+        storage = ContentAddressedStorage()
+        stored_names = set(StoredImage.objects.values_list('name', flat=True))
+        old_names = set()
+        for model in (Image, QueuedImage):
+            for o in keyset_iterator(model.objects.all()):
+                name = o.image.name
+                if not name or name in stored_names:
+                    continue
+                if not storage.exists(name):
+                    print("WARNING: the file {0} for {1} {2} is missing".format(
+                        name, model.__name__, o.id))
+                    continue
+                with storage.open(name) as f:
+                    stored_image = StoredImage.objects.store(f, name)
+                model.objects.filter(pk=o.pk).update(image=stored_image.name)
+                stored_names.add(stored_image.name)
+                old_names.add(name)
+                if verbosity > 1:
+                    print("Moved {0} to {1}".format(name, stored_image.name))
+        # Only delete the old files once nothing refers to them:
+        for name in old_names:
+            if not (Image.objects.filter(image=name).exists() or
+                    QueuedImage.objects.filter(image=name).exists()):
+                storage.delete(name)
+        return len(old_names)
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        if options['add_existing']:
+            added = self.add_existing(verbosity)
+            if verbosity > 0:
+                print("Added {0} files to the image store".format(added))
+        deleted = StoredImage.objects.delete_unreferenced()
+        if verbosity > 0:
+            print("Deleted {0} unused files from the image store".format(
+                deleted))
@@ -0,0 +1,49 @@
+from __future__ import print_function, unicode_literals
+
+from time import sleep
+
+from django.core.management.base import BaseCommand
+
+from candidates.models import PersonSearchUpdate
+
+
+class Command(BaseCommand):
+
+    help = "Update the search index for people queued to be updated"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='How many queued updates to process at a time'
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running, checking the queue every SECONDS'
+        )
+        parser.add_argument(
+            '--lag',
+            action='store_true',
+            help='Just print how many seconds the oldest queued '
+                'update has been waiting (e.g. for monitoring)'
+        )
+
+    def handle(self, *args, **options):
+        if options['lag']:
+            print(int(PersonSearchUpdate.objects.get_lag().total_seconds()))
+            return
+        while True:
+            lag = PersonSearchUpdate.objects.get_lag()
+            updated = PersonSearchUpdate.objects.process(
+                batch_size=options['batch_size']
+            )
+            if updated and int(options['verbosity']) > 0:
+                print("Updated {0} people, queued up to {1} seconds ago".format(
+                    updated, int(lag.total_seconds())
+                ))
+            if not options['watch']:
+                break
+            sleep(options['watch'])
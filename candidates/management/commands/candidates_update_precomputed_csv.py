@@ -0,0 +1,39 @@
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from candidates.models import PostExtra
+from candidates.precomputed_csv import update_election_csv, update_post_csv
+from elections.models import Election
+
+
+class Command(BaseCommand):
+
+    help = "Regenerate the stored CSV files for each post and election"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--election',
+            metavar='ELECTION-SLUG',
+            help='Only regenerate the CSV files for this election'
+        )
+
+    def handle(self, *args, **options):
+        elections = Election.objects.all()
+        if options['election']:
+            elections = elections.filter(slug=options['election'])
+            if not elections.exists():
+                message = "Couldn't find an election with slug {election_slug}"
+                raise CommandError(
+                    message.format(election_slug=options['election']))
+        verbosity = int(options['verbosity'])
+        for election in elections:
+            post_extras = PostExtra.objects.filter(elections=election) \
+                .select_related('base')
+            for post_extra in post_extras:
+                update_post_csv(election, post_extra)
+            update_election_csv(election)
+            if verbosity > 1:
+                print("Regenerated the CSV files for {0}".format(
+                    election.slug
+                ))
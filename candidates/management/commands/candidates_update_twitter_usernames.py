@@ -9,6 +9,7 @@ from django.core.management.base import BaseCommand
 from django.utils.translation import ugettext as _
 
 from candidates.models import MultipleTwitterIdentifiers
+from candidates.utils import keyset_iterator
 from popolo.models import Person
 
 from ..twitter import TwitterAPIData
@@ -155,14 +156,18 @@ class Command(BaseCommand):
         # Now go through every person in the database and check their
         # Twitter details. This can take a long time, so use one
         # transaction per person.
-        for person_id in Person.objects.order_by('name').values_list('pk', flat=True):
+        for person_stub in keyset_iterator(
+                Person.objects.only('id', 'name'), order_by='name'
+        ):
             with transaction.atomic():
                 # n.b. even though it's inefficient query-wise, we get
                 # each person from the database based on their ID
                 # within the transaction because the loop we're in
                 # takes a long time, other otherwise we might end up
                 # with out of date information (e.g. this has happened
-                # with the person.extra.versions field, with confusing
+                # with the person's versions, with confusing
                 # results...)
-                person = Person.objects.select_related('extra').get(pk=person_id)
+                person = Person.objects.select_related('extra').get(
+                    pk=person_stub.pk
+                )
                 self.handle_person(person)
@@ -1,13 +1,15 @@
 from __future__ import unicode_literals
 
-import hashlib
+from django.core.files import File
 
 from PIL import Image as PillowImage
 
+from candidates.models.image_store import get_md5sum
+
 
 def get_file_md5sum(filename):
     with open(filename, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+        return get_md5sum(File(f))
 
 
 PILLOW_FORMAT_EXTENSIONS = {
@@ -21,13 +23,19 @@ PILLOW_FORMAT_EXTENSIONS = {
 
 def get_image_extension(image_filename):
     with open(image_filename, 'rb') as f:
-        try:
-            pillow_image = PillowImage.open(f)
-        except IOError as e:
-            if 'cannot identify image file' in e.args[0]:
-                print("Ignoring a non-image file {0}".format(
-                    image_filename
-                ))
-                return None
-            raise
-        return PILLOW_FORMAT_EXTENSIONS[pillow_image.format]
+        return get_image_extension_from_file(f, image_filename)
+
+
+def get_image_extension_from_file(f, description):
+    """Return the extension for the image in file object f, or None
+
+    'description' (e.g. a filename or URL) is used to report a file
+    that isn't an image."""
+    try:
+        pillow_image = PillowImage.open(f)
+    except IOError as e:
+        if 'cannot identify image file' in e.args[0]:
+            print("Ignoring a non-image file {0}".format(description))
+            return None
+        raise
+    return PILLOW_FORMAT_EXTENSIONS[pillow_image.format]
@@ -18,10 +18,16 @@ from django.utils.translation import ugettext as _
 from usersettings.shortcuts import get_current_usersettings
 from django.utils.cache import add_never_cache_headers
 
+from candidates.models import LoggedActionUpdate, PersonSearchUpdate
 from candidates.models.auth import (
     NameChangeDisallowedException,
     ChangeToLockedConstituencyDisallowedException
 )
+from candidates.models.db import pop_logged_actions_queued_in_thread
+from candidates.models.person_search import pop_queued_in_thread
+from candidates.post_cache import (
+    invalidate_post_caches_again, pop_keys_invalidated_in_thread
+)
 
 
 class DisallowedUpdateMiddleware(object):
@@ -114,3 +120,59 @@ class LogoutDisabledUsersMiddleware(object):
            request.user.is_authenticated() and \
            not request.user.is_active:
             logout(request)
+
+
+class PersonSearchUpdateMiddleware(object):
+    """Update the search index for the people edited in this request
+
+    Edits only queue people to have their search documents updated;
+    this updates those queued by this request in one batch once the
+    view has returned, and so after its transactions have committed.
+    Updates queued elsewhere (e.g. by management commands) are left
+    for the candidates_update_person_search_index command."""
+
+    def process_request(self, request):
+        pop_queued_in_thread()
+
+    def process_response(self, request, response):
+        person_ids = pop_queued_in_thread()
+        if person_ids:
+            PersonSearchUpdate.objects.process(person_ids)
+        return response
+
+
+class LoggedActionUpdateMiddleware(object):
+    """Regenerate what depends on the actions logged in this request
+
+    Like PersonSearchUpdateMiddleware, this runs once the view has
+    returned, so the changes that were logged have been committed by
+    then.  Actions logged elsewhere are left for the
+    candidates_process_logged_actions command."""
+
+    def process_request(self, request):
+        pop_logged_actions_queued_in_thread()
+
+    def process_response(self, request, response):
+        logged_action_ids = pop_logged_actions_queued_in_thread()
+        if logged_action_ids:
+            LoggedActionUpdate.objects.process(logged_action_ids)
+        return response
+
+
+class PostCacheMiddleware(object):
+    """Invalidate the cached candidate lists changed in this request again
+
+    (This also applies to the cached API data of people, which uses
+    version tokens in the same way.)
+
+    The posts' versions are first replaced while the changes are being
+    made; this replaces them once more after the view has returned and
+    its transactions have committed, so that a list cached from before
+    the commit under the first replacement isn't used."""
+
+    def process_request(self, request):
+        pop_keys_invalidated_in_thread()
+
+    def process_response(self, request, response):
+        invalidate_post_caches_again()
+        return response
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('popolo', '0002_update_models_from_upstream'),
+        ('candidates', '0035_merge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonVersion',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('version_id', models.CharField(max_length=32, db_index=True)),
+                ('timestamp', models.DateTimeField()),
+                ('metadata', models.TextField()),
+                ('data', models.TextField()),
+                ('person', models.ForeignKey(related_name='person_versions', to='popolo.Person')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='personversion',
+            index_together=set([('person', 'timestamp')]),
+        ),
+        # Keep the existing column (and its data) under a new field
+        # name, so that the data migration can move it:
+        migrations.RenameField(
+            model_name='personextra',
+            old_name='versions',
+            new_name='legacy_versions',
+        ),
+        migrations.AlterField(
+            model_name='personextra',
+            name='legacy_versions',
+            field=models.TextField(db_column='versions', blank=True),
+        ),
+    ]
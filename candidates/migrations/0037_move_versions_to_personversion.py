@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from dateutil import parser
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# This is a frozen copy of move_legacy_versions_to_table (in
+# candidates/models/versions.py) as it was when this migration was
+# written, so that later changes to that don't change the migration.
+
+def parse_version_timestamp(timestamp):
+    result = parser.parse(timestamp)
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result, timezone.utc)
+    return result
+
+
+def versions_to_table(apps, schema_editor):
+    PersonExtra = apps.get_model('candidates', 'personextra')
+    PersonVersion = apps.get_model('candidates', 'personversion')
+    batch_size = 100
+    last_pk = 0
+    while True:
+        batch = list(
+            PersonExtra.objects
+            .filter(pk__gt=last_pk)
+            .exclude(legacy_versions='')
+            .order_by('pk')
+            .values_list('pk', 'base_id', 'legacy_versions')[:batch_size]
+        )
+        if not batch:
+            return
+        for person_extra_id, person_id, legacy_versions in batch:
+            # The JSON array has the most recent version first, but
+            # PersonVersion rows are ordered most recently created
+            # first, so insert the oldest version first:
+            new_person_versions = []
+            for version in reversed(json.loads(legacy_versions)):
+                metadata = {k: v for k, v in version.items() if k != 'data'}
+                new_person_versions.append(PersonVersion(
+                    person_id=person_id,
+                    version_id=version['version_id'],
+                    timestamp=parse_version_timestamp(version['timestamp']),
+                    metadata=json.dumps(metadata),
+                    data=json.dumps(version.get('data', {})),
+                ))
+            PersonVersion.objects.bulk_create(new_person_versions)
+        PersonExtra.objects \
+            .filter(pk__in=[row[0] for row in batch]) \
+            .update(legacy_versions='')
+        last_pk = batch[-1][0]
+
+
+def table_to_versions(apps, schema_editor):
+    PersonExtra = apps.get_model('candidates', 'personextra')
+    PersonVersion = apps.get_model('candidates', 'personversion')
+    for person_extra in PersonExtra.objects.only('id', 'base_id').iterator():
+        versions = []
+        for person_version in PersonVersion.objects \
+                .filter(person_id=person_extra.base_id).order_by('-id'):
+            version = json.loads(person_version.metadata)
+            version['data'] = json.loads(person_version.data)
+            versions.append(version)
+        PersonExtra.objects.filter(pk=person_extra.pk) \
+            .update(legacy_versions=json.dumps(versions))
+    PersonVersion.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0036_personversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            versions_to_table,
+            table_to_versions,
+        ),
+    ]
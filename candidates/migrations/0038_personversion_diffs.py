@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0037_move_versions_to_personversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='personversion',
+            name='diffs',
+            field=models.TextField(blank=True),
+        ),
+    ]
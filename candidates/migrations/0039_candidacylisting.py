@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('popolo', '0002_update_models_from_upstream'),
+        ('elections', '0013_optional_election_area_type'),
+        ('candidates', '0038_personversion_diffs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidacyListing',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('role', models.CharField(max_length=512, blank=True)),
+                ('person_name', models.CharField(max_length=512)),
+                ('person_gender', models.CharField(max_length=128, blank=True)),
+                ('person_image', models.CharField(max_length=512, blank=True)),
+                ('not_standing', models.TextField(default='[]')),
+                ('party_slug', models.CharField(max_length=256, blank=True)),
+                ('party_name', models.CharField(max_length=512)),
+                ('party_list_position', models.IntegerField(null=True)),
+                ('elected', models.NullBooleanField()),
+                ('election', models.ForeignKey(related_name='candidacy_listings', to='elections.Election')),
+                ('membership', models.OneToOneField(related_name='candidacy_listing', to='popolo.Membership')),
+                ('party', models.ForeignKey(related_name='candidacy_listings', to='popolo.Organization')),
+                ('person', models.ForeignKey(related_name='candidacy_listings', to='popolo.Person')),
+                ('post', models.ForeignKey(related_name='candidacy_listings', to='popolo.Post')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='candidacylisting',
+            index_together=set([('election', 'party'), ('post', 'election')]),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import json
+
+from django.db import migrations
+
+
+def populate_candidacy_listings(apps, schema_editor):
+    CandidacyListing = apps.get_model('candidates', 'candidacylisting')
+    ContentType = apps.get_model('contenttypes', 'contenttype')
+    Image = apps.get_model('images', 'image')
+    Membership = apps.get_model('popolo', 'membership')
+    PersonExtra = apps.get_model('candidates', 'personextra')
+    person_extra_to_person_id = dict(
+        PersonExtra.objects.values_list('id', 'base_id')
+    )
+    person_id_to_image = {}
+    person_extra_content_type = ContentType.objects.filter(
+        app_label='candidates', model='personextra'
+    ).first()
+    if person_extra_content_type:
+        for object_id, image in Image.objects.filter(
+                content_type=person_extra_content_type,
+                is_primary=True,
+        ).values_list('object_id', 'image'):
+            person_id = person_extra_to_person_id.get(object_id)
+            if person_id:
+                person_id_to_image[person_id] = image
+    person_id_to_not_standing = defaultdict(list)
+    for person_id, election_slug in PersonExtra.objects \
+            .filter(not_standing__isnull=False) \
+            .values_list('base_id', 'not_standing__slug'):
+        person_id_to_not_standing[person_id].append(election_slug)
+    listings = []
+    for membership in Membership.objects.filter(
+            extra__election__isnull=False,
+            post__isnull=False,
+            on_behalf_of__isnull=False,
+    ).select_related('extra', 'person', 'on_behalf_of__extra'):
+        listings.append(CandidacyListing(
+            membership=membership,
+            election_id=membership.extra.election_id,
+            post_id=membership.post_id,
+            role=membership.role,
+            person_id=membership.person_id,
+            person_name=membership.person.name,
+            person_gender=membership.person.gender,
+            person_image=person_id_to_image.get(membership.person_id, ''),
+            not_standing=json.dumps(sorted(
+                person_id_to_not_standing[membership.person_id]
+            )),
+            party_id=membership.on_behalf_of_id,
+            party_slug=membership.on_behalf_of.extra.slug,
+            party_name=membership.on_behalf_of.name,
+            party_list_position=membership.extra.party_list_position,
+            elected=membership.extra.elected,
+        ))
+    CandidacyListing.objects.bulk_create(listings, batch_size=1000)
+
+
+def remove_candidacy_listings(apps, schema_editor):
+    CandidacyListing = apps.get_model('candidates', 'candidacylisting')
+    CandidacyListing.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('images', '0001_initial'),
+        ('candidates', '0039_candidacylisting'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            populate_candidacy_listings,
+            remove_candidacy_listings,
+        ),
+    ]
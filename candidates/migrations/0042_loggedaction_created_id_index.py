@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0041_last_changed'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='loggedaction',
+            index_together=set([('created', 'id')]),
+        ),
+    ]
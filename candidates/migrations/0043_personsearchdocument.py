@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('popolo', '0002_update_models_from_upstream'),
+        ('candidates', '0042_loggedaction_created_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonSearchDocument',
+            fields=[
+                ('person', models.OneToOneField(related_name='search_document', primary_key=True, serialize=False, to='popolo.Person')),
+                ('name', models.CharField(max_length=512)),
+                ('name_words', models.TextField()),
+                ('party_words', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PersonSearchTrigram',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('trigram', models.CharField(max_length=3)),
+                ('document', models.ForeignKey(related_name='trigrams', to='candidates.PersonSearchDocument')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='personsearchtrigram',
+            index_together=set([('trigram', 'document')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0043_personsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonSearchUpdate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('person_id', models.IntegerField(db_index=True)),
+                ('queued', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0045_storedimage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoggedActionUpdate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('queued', models.DateTimeField(auto_now_add=True)),
+                ('logged_action', models.ForeignKey(to='candidates.LoggedAction')),
+            ],
+        ),
+    ]
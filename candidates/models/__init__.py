@@ -10,6 +10,7 @@ from .merge import merge_popit_people
 
 from .popolo_extra import AreaExtra
 from .popolo_extra import MultipleTwitterIdentifiers
+from .popolo_extra import get_twitter_identifiers
 from .popolo_extra import VersionNotFound
 from .popolo_extra import PersonExtra
 from .popolo_extra import OrganizationExtra
@@ -27,7 +28,19 @@ from .fields import PersonExtraFieldValue
 from .fields import SimplePopoloField
 from .fields import ComplexPopoloField
 
+from .versions import PersonVersion
+
+from .candidacy_listing import CandidacyListing
+
+from .image_store import ContentAddressedStorage
+from .image_store import StoredImage
+
+from .person_search import PersonSearchDocument
+from .person_search import PersonSearchTrigram
+from .person_search import PersonSearchUpdate
+
 from .db import LoggedAction
+from .db import LoggedActionUpdate
 from .db import PersonRedirect
 from .db import UserTermsAgreement
 
@@ -41,3 +54,10 @@ from .auth import EDIT_SETTINGS_GROUP_NAME
 
 from .sitesettings import SiteSettings
 from .sitesettings import get_site_setting
+
+# The signal handlers that keep the cached API data of people and
+# the site data's last changed time up to date are kept with the code
+# that uses them, but need to be connected whenever the models are
+# loaded:
+from .. import api_cache  # noqa
+from .. import last_changed  # noqa
@@ -0,0 +1,359 @@
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from elections.models import Election
+from images.models import Image
+from popolo.models import Membership, Organization, Person, Post
+
+from ..post_cache import invalidate_all_post_caches, invalidate_post_caches
+from .popolo_extra import (
+    MembershipExtra, OrganizationExtra, PersonExtra, PostExtra,
+    PostExtraElection
+)
+from .sitesettings import SiteSettings
+
+
+class ListedPerson(object):
+    """The parts of a person that the candidate list templates use
+
+    This is built from a CandidacyListing, so that rendering a list of
+    candidates doesn't need any more queries; it has the same
+    attributes as a Person for that purpose (including
+    extra.primary_image)."""
+
+    def __init__(self, candidacy_listing):
+        self.id = candidacy_listing.person_id
+        self.pk = candidacy_listing.person_id
+        self.name = candidacy_listing.person_name
+        self.gender = candidacy_listing.person_gender
+        self.image = candidacy_listing.person_image
+        self.extra = self
+
+    def primary_image(self):
+        return self.image or None
+
+    def __eq__(self, other):
+        return isinstance(other, ListedPerson) and self.id == other.id
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def get_primary_image_name(person_extra):
+    for image in person_extra.images.all():
+        if image.is_primary:
+            return image.image.name
+    return ''
+
+
+def get_not_standing_json(person_extra):
+    return json.dumps(sorted(
+        person_extra.not_standing.values_list('slug', flat=True)
+    ))
+
+
+class CandidacyListingQuerySet(models.QuerySet):
+
+    def invalidate_post_caches(self):
+        invalidate_post_caches(self.values_list('post_id', flat=True))
+
+    def update_for_membership(self, membership, membership_extra=None):
+        """Create, update or remove the listing for a membership"""
+        if membership_extra is None:
+            try:
+                membership_extra = membership.extra
+            except ObjectDoesNotExist:
+                pass
+        if membership_extra is None or membership_extra.election_id is None \
+                or membership.post_id is None \
+                or membership.on_behalf_of_id is None:
+            existing = self.filter(membership=membership)
+            existing.invalidate_post_caches()
+            existing.delete()
+            return
+        # If the candidacy has moved, the post it's moved from needs
+        # its cached candidate list updating too:
+        self.filter(membership=membership).invalidate_post_caches()
+        person = Person.objects.select_related('extra').get(
+            pk=membership.person_id)
+        party = Organization.objects.select_related('extra').get(
+            pk=membership.on_behalf_of_id)
+        self.update_or_create(
+            membership=membership,
+            defaults={
+                'election_id': membership_extra.election_id,
+                'post_id': membership.post_id,
+                'role': membership.role,
+                'person': person,
+                'person_name': person.name,
+                'person_gender': person.gender,
+                'person_image': get_primary_image_name(person.extra),
+                'not_standing': get_not_standing_json(person.extra),
+                'party': party,
+                'party_slug': party.extra.slug,
+                'party_name': party.name,
+                'party_list_position': membership_extra.party_list_position,
+                'elected': membership_extra.elected,
+            }
+        )
+        invalidate_post_caches([membership.post_id])
+
+    def update_for_person(self, person):
+        listings = self.filter(person=person)
+        listings.invalidate_post_caches()
+        listings.update(
+            person_name=person.name,
+            person_gender=person.gender,
+        )
+
+    def update_person_extra(self, person_extra):
+        listings = self.filter(person_id=person_extra.base_id)
+        listings.invalidate_post_caches()
+        listings.update(
+            person_image=get_primary_image_name(person_extra),
+            not_standing=get_not_standing_json(person_extra),
+        )
+
+    def update_for_party(self, party):
+        listings = self.filter(party=party)
+        listings.invalidate_post_caches()
+        listings.update(party_name=party.name)
+
+    def update_for_memberships(self, membership_ids):
+        """Create, update or remove the listings for many memberships
+
+        This gives the same result as calling update_for_membership
+        for each of them, but in a fixed number of queries."""
+        membership_ids = list(membership_ids)
+        memberships = list(
+            Membership.objects.filter(
+                pk__in=membership_ids,
+                extra__election__isnull=False,
+                post__isnull=False,
+                on_behalf_of__isnull=False,
+            ).select_related('extra', 'person', 'on_behalf_of__extra')
+        )
+        person_ids = set(m.person_id for m in memberships)
+        person_extra_id_to_person_id = dict(
+            PersonExtra.objects.filter(base_id__in=person_ids)
+            .values_list('id', 'base_id')
+        )
+        person_id_to_image = {}
+        for object_id, image in Image.objects.filter(
+                content_type=ContentType.objects.get_for_model(PersonExtra),
+                object_id__in=list(person_extra_id_to_person_id.keys()),
+                is_primary=True,
+        ).order_by('pk').values_list('object_id', 'image'):
+            person_id_to_image.setdefault(
+                person_extra_id_to_person_id[object_id], image)
+        person_id_to_not_standing = defaultdict(list)
+        for person_id, election_slug in \
+                PersonExtra.not_standing.through.objects.filter(
+                    personextra__base_id__in=person_ids
+                ).values_list('personextra__base_id', 'election__slug'):
+            person_id_to_not_standing[person_id].append(election_slug)
+        existing = self.filter(membership_id__in=membership_ids)
+        existing.invalidate_post_caches()
+        existing.delete()
+        self.bulk_create([
+            CandidacyListing(
+                membership=membership,
+                election_id=membership.extra.election_id,
+                post_id=membership.post_id,
+                role=membership.role,
+                person_id=membership.person_id,
+                person_name=membership.person.name,
+                person_gender=membership.person.gender,
+                person_image=person_id_to_image.get(membership.person_id, ''),
+                not_standing=json.dumps(sorted(
+                    person_id_to_not_standing[membership.person_id]
+                )),
+                party_id=membership.on_behalf_of_id,
+                party_slug=membership.on_behalf_of.extra.slug,
+                party_name=membership.on_behalf_of.name,
+                party_list_position=membership.extra.party_list_position,
+                elected=membership.extra.elected,
+            )
+            for membership in memberships
+        ])
+        invalidate_post_caches(m.post_id for m in memberships)
+
+    def rebuild(self, batch_size=1000):
+        """Recreate the listings of every candidacy from scratch"""
+        self.invalidate_post_caches()
+        self.all().delete()
+        membership_ids = list(
+            Membership.objects.filter(
+                extra__election__isnull=False,
+                post__isnull=False,
+                on_behalf_of__isnull=False,
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+        for i in range(0, len(membership_ids), batch_size):
+            self.update_for_memberships(membership_ids[i:i + batch_size])
+
+
+class CandidacyListing(models.Model):
+    """A denormalized copy of the details needed to list a candidacy
+
+    The pages listing the candidates for a post, area or party only
+    need a query on this table, rather than joining across memberships,
+    people, parties and elections. There's one of these for every
+    membership of a post (on behalf of a party) in an election. They're
+    kept up to date by signal handlers when any of the objects they're
+    built from are saved, or you can recreate them all with the
+    candidates_rebuild_candidacy_listings command."""
+
+    membership = models.OneToOneField(
+        Membership, related_name='candidacy_listing')
+    election = models.ForeignKey(Election, related_name='candidacy_listings')
+    post = models.ForeignKey(Post, related_name='candidacy_listings')
+    role = models.CharField(max_length=512, blank=True)
+    person = models.ForeignKey(Person, related_name='candidacy_listings')
+    person_name = models.CharField(max_length=512)
+    person_gender = models.CharField(max_length=128, blank=True)
+    person_image = models.CharField(max_length=512, blank=True)
+    # A JSON array of the slugs of elections the person is known not
+    # to be standing in:
+    not_standing = models.TextField(default='[]')
+    party = models.ForeignKey(
+        Organization, related_name='candidacy_listings')
+    party_slug = models.CharField(max_length=256, blank=True)
+    party_name = models.CharField(max_length=512)
+    party_list_position = models.IntegerField(null=True)
+    elected = models.NullBooleanField()
+
+    objects = CandidacyListingQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ('post', 'election'),
+            ('election', 'party'),
+        ]
+
+    @property
+    def listed_person(self):
+        return ListedPerson(self)
+
+    def is_candidate_in(self, election):
+        return self.election_id == election.id and \
+            self.role == election.candidate_membership_role
+
+    def is_not_standing_in(self, election):
+        return election.slug in json.loads(self.not_standing)
+
+
+def update_candidacy_listing_for_membership(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    CandidacyListing.objects.update_for_membership(instance)
+
+
+def update_candidacy_listing_for_membership_extra(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    CandidacyListing.objects.update_for_membership(instance.base, instance)
+
+
+def remove_candidacy_listing_for_membership_extra(sender, instance, **kwargs):
+    # The membership itself may be being deleted too, so don't try to
+    # rebuild the listing from it:
+    listings = CandidacyListing.objects.filter(membership_id=instance.base_id)
+    listings.invalidate_post_caches()
+    listings.delete()
+
+
+def update_candidacy_listings_for_person(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    CandidacyListing.objects.update_for_person(instance)
+
+
+def update_candidacy_listings_for_not_standing(sender, instance, action,
+                                               **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and \
+            isinstance(instance, PersonExtra):
+        CandidacyListing.objects.update_person_extra(instance)
+
+
+def update_candidacy_listings_for_image(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    person_extra = instance.content_object
+    if isinstance(person_extra, PersonExtra):
+        CandidacyListing.objects.update_person_extra(person_extra)
+
+
+def update_candidacy_listings_for_party(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    CandidacyListing.objects.update_for_party(instance)
+
+
+def update_candidacy_listings_for_party_extra(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    listings = CandidacyListing.objects.filter(party_id=instance.base_id)
+    listings.invalidate_post_caches()
+    listings.update(party_slug=instance.slug)
+
+
+# The cached candidate list for a post also depends on whether it's
+# locked, how many winners there are, and on some settings of the
+# elections it's in and of the site, which aren't part of the
+# listings:
+
+def invalidate_post_cache_for_post_extra(sender, instance, **kwargs):
+    invalidate_post_caches([instance.base_id])
+
+
+def invalidate_post_cache_for_post_extra_election(sender, instance, **kwargs):
+    invalidate_post_caches(
+        PostExtra.objects.filter(pk=instance.postextra_id)
+        .values_list('base_id', flat=True)
+    )
+
+
+def invalidate_post_caches_for_election(sender, instance, **kwargs):
+    invalidate_post_caches(
+        PostExtra.objects.filter(elections=instance)
+        .values_list('base_id', flat=True)
+    )
+
+
+def invalidate_post_caches_for_site_settings(sender, instance, **kwargs):
+    invalidate_all_post_caches()
+
+
+post_save.connect(update_candidacy_listing_for_membership, sender=Membership)
+post_save.connect(
+    update_candidacy_listing_for_membership_extra, sender=MembershipExtra)
+post_delete.connect(
+    remove_candidacy_listing_for_membership_extra, sender=MembershipExtra)
+post_save.connect(update_candidacy_listings_for_person, sender=Person)
+m2m_changed.connect(
+    update_candidacy_listings_for_not_standing,
+    sender=PersonExtra.not_standing.through
+)
+post_save.connect(update_candidacy_listings_for_image, sender=Image)
+post_delete.connect(update_candidacy_listings_for_image, sender=Image)
+post_save.connect(update_candidacy_listings_for_party, sender=Organization)
+post_save.connect(
+    update_candidacy_listings_for_party_extra, sender=OrganizationExtra)
+post_save.connect(invalidate_post_cache_for_post_extra, sender=PostExtra)
+post_save.connect(
+    invalidate_post_cache_for_post_extra_election, sender=PostExtraElection)
+post_delete.connect(
+    invalidate_post_cache_for_post_extra_election, sender=PostExtraElection)
+post_save.connect(invalidate_post_caches_for_election, sender=Election)
+post_save.connect(invalidate_post_caches_for_site_settings, sender=SiteSettings)
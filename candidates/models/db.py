@@ -2,10 +2,12 @@ from __future__ import unicode_literals
 
 from datetime import datetime, timedelta
 from functools import reduce
+import threading
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.utils.html import escape
 from django.utils.six import text_type
@@ -62,6 +64,13 @@ class LoggedAction(models.Model):
 
     objects = LoggedActionQuerySet.as_manager()
 
+    class Meta:
+        # For the changes feed in the API, which goes through the
+        # actions in this order:
+        index_together = [
+            ('created', 'id'),
+        ]
+
     def __repr__(self):
         fmt = str("<LoggedAction username='{username}' action_type='{action_type}'>")
         return fmt.format(username=self.user.username, action_type=self.action_type)
@@ -128,3 +137,81 @@ def create_user_terms_agreement(sender, instance, created, **kwargs):
         UserTermsAgreement.objects.create(user=instance)
 
 post_save.connect(create_user_terms_agreement, sender=User)
+
+
+class LoggedActionUpdateQuerySet(models.QuerySet):
+
+    def process(self, logged_action_ids=None, batch_size=500):
+        """Bring up to date what depends on queued logged actions
+
+        This marks the people and posts each action affects as changed
+        (see candidates.last_changed) and regenerates the precomputed
+        CSV files of those posts (if they're enabled), once per post in
+        each batch.  If 'logged_action_ids' is given, only those actions are
+        processed.  The queued rows are locked while they're processed,
+        so that two processes don't do the same work at once.  Returns
+        the number of logged actions processed."""
+        from ..last_changed import mark_changed_by_logged_actions
+        from ..precomputed_csv import update_csv_for_logged_actions
+        processed = 0
+        while True:
+            with transaction.atomic():
+                queued = self.select_for_update().order_by('pk')
+                if logged_action_ids is not None:
+                    queued = queued.filter(
+                        logged_action_id__in=list(logged_action_ids))
+                rows = list(
+                    queued.values_list('pk', 'logged_action_id')[:batch_size])
+                if not rows:
+                    return processed
+                logged_actions = list(
+                    LoggedAction.objects.filter(
+                        pk__in=[la_id for _, la_id in rows]
+                    ).select_related('post__extra')
+                )
+                mark_changed_by_logged_actions(logged_actions)
+                if settings.PRECOMPUTED_CSV_ENABLED:
+                    update_csv_for_logged_actions(logged_actions)
+                self.filter(pk__in=[pk for pk, _ in rows]).delete()
+                processed += len(rows)
+
+
+class LoggedActionUpdate(models.Model):
+    """A logged action whose effects on precomputed data are pending
+
+    The views log an action before they change the person or their
+    candidacies, in the same transaction, so what the action affects
+    can only be worked out once that transaction has committed.
+    Creating a LoggedAction just adds one of these; the queue is
+    processed at the end of each request (by
+    LoggedActionUpdateMiddleware) for the actions logged in it, and
+    otherwise by the candidates_process_logged_actions command."""
+
+    logged_action = models.ForeignKey(LoggedAction)
+    queued = models.DateTimeField(auto_now_add=True)
+
+    objects = LoggedActionUpdateQuerySet.as_manager()
+
+
+_queued_in_thread = threading.local()
+
+
+def get_logged_actions_queued_in_thread():
+    """Return the IDs of logged actions queued by this thread"""
+    if not hasattr(_queued_in_thread, 'logged_action_ids'):
+        _queued_in_thread.logged_action_ids = set()
+    return _queued_in_thread.logged_action_ids
+
+
+def pop_logged_actions_queued_in_thread():
+    logged_action_ids = get_logged_actions_queued_in_thread()
+    _queued_in_thread.logged_action_ids = set()
+    return logged_action_ids
+
+
+def queue_logged_action_update(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        LoggedActionUpdate.objects.create(logged_action=instance)
+        get_logged_actions_queued_in_thread().add(instance.id)
+
+post_save.connect(queue_logged_action_update, sender=LoggedAction)
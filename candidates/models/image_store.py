@@ -0,0 +1,161 @@
+from __future__ import unicode_literals
+
+import hashlib
+from os.path import join, splitext
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject, empty
+
+from images.models import Image
+
+
+def get_md5sum(f):
+    """Return the MD5 checksum of a Django File, read a chunk at a time"""
+    md5 = hashlib.md5()
+    for chunk in f.chunks():
+        md5.update(chunk)
+    return md5.hexdigest()
+
+
+def get_stored_name(desired_name, md5sum):
+    """Return where a file with a given checksum is kept in the store
+
+    Files are kept under the top-level directory of the name they were
+    saved with (e.g. 'images' or 'queued-images'), and keep its
+    extension, so that they're served with the right content type."""
+    directory = desired_name.replace('\\', '/').split('/')[0]
+    extension = splitext(desired_name)[1].lower()
+    return join(directory, md5sum[:2], md5sum[2:4], md5sum + extension)
+
+
+class StoredImageQuerySet(models.QuerySet):
+
+    def store(self, content, desired_name, storage=None):
+        """Add a reference to the stored copy of content, returning it
+
+        content must be a Django File that can be read more than once.
+        The file is only written if no file with the same contents has
+        been stored (or that file has since gone missing)."""
+        if storage is None:
+            storage = ContentAddressedStorage()
+        md5sum = get_md5sum(content)
+        with transaction.atomic():
+            stored_image, created = self.select_for_update().get_or_create(
+                md5sum=md5sum,
+                defaults={'name': get_stored_name(desired_name, md5sum)},
+            )
+            if created or not storage.exists(stored_image.name):
+                saved_name = storage.save_new_file(stored_image.name, content)
+                if saved_name != stored_image.name:
+                    # Another process wrote the same file while we were
+                    # writing ours, so ours isn't needed:
+                    storage.delete(saved_name)
+            self.filter(pk=stored_image.pk).update(
+                reference_count=F('reference_count') + 1)
+        stored_image.reference_count += 1
+        return stored_image
+
+    def release(self, name):
+        """Remove a reference to the stored file with this name
+
+        Unreferenced files aren't deleted straight away; that's done by
+        delete_unreferenced."""
+        self.filter(name=name, reference_count__gt=0).update(
+            reference_count=F('reference_count') - 1)
+
+    def delete_unreferenced(self):
+        """Delete the stored files that nothing refers to any more
+
+        Returns the number of files deleted."""
+        storage = ContentAddressedStorage()
+        deleted = 0
+        for pk in self.filter(reference_count=0).values_list('pk', flat=True):
+            with transaction.atomic():
+                # Lock the row so that no one can add a reference to
+                # the file while it's being deleted:
+                try:
+                    stored_image = self.select_for_update().get(
+                        pk=pk, reference_count=0)
+                except StoredImage.DoesNotExist:
+                    continue
+                stored_image.delete()
+                storage.delete(stored_image.name)
+                deleted += 1
+        return deleted
+
+
+class StoredImage(models.Model):
+    """A file in the content-addressed image store
+
+    Each distinct file is only stored once, named after its MD5
+    checksum, however many images or queued images use it; the
+    reference count is the number of those."""
+
+    md5sum = models.CharField(max_length=32, unique=True)
+    name = models.CharField(max_length=512, unique=True)
+    reference_count = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = StoredImageQuerySet.as_manager()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """A file system storage that only keeps one copy of each file
+
+    Saving a file returns the name of the copy in the store, and adds
+    a reference to it."""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is chosen from the file's contents when it's saved
+        return name
+
+    def _save(self, name, content):
+        return StoredImage.objects.store(content, name, storage=self).name
+
+    def save_new_file(self, name, content):
+        """Write content to the store, without adding a reference
+
+        If a file with this name appears in the meantime, the content
+        is saved under a different name, which is returned."""
+        # This storage's get_available_name would make the file system
+        # storage keep retrying the same name, so use a plain one:
+        storage = FileSystemStorage(
+            location=self.location,
+            base_url=self.base_url,
+            file_permissions_mode=self.file_permissions_mode,
+            directory_permissions_mode=self.directory_permissions_mode,
+        )
+        return storage.save(name, content)
+
+
+class DefaultContentAddressedStorage(LazyObject):
+    """The content-addressed storage for MEDIA_ROOT, as for default_storage
+
+    Like default_storage, it's recreated if MEDIA_ROOT or MEDIA_URL are
+    changed (e.g. by override_settings in tests)."""
+
+    def _setup(self):
+        self._wrapped = ContentAddressedStorage()
+
+
+content_addressed_storage = DefaultContentAddressedStorage()
+
+
+def reset_content_addressed_storage(setting, **kwargs):
+    if setting in ('MEDIA_ROOT', 'MEDIA_URL'):
+        content_addressed_storage._wrapped = empty
+
+
+def release_stored_image(sender, instance, **kwargs):
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+post_delete.connect(release_stored_image, sender=Image)
+setting_changed.connect(reset_content_addressed_storage)
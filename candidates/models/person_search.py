@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, unicode_literals
+
+from collections import defaultdict
+from datetime import timedelta
+import math
+import re
+import threading
+import unicodedata
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, transaction
+from django.db.models import Count, Min
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from compat import text_type
+from popolo.models import Membership, Organization, OtherName, Person
+
+from .popolo_extra import PersonExtra
+
+
+# Letters that don't decompose into a base letter and accents:
+FOLDED_LETTERS = {
+    'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ł': 'l', 'đ': 'd',
+    'ð': 'd', 'þ': 'th', 'ı': 'i',
+}
+
+APOSTROPHES_RE = re.compile("['’ʼ`]")
+NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+# The fraction of the trigrams of a word in a query that must be in
+# a word of someone's name for it to count as a match:
+MIN_SIMILARITY = 0.5
+
+# Matches on a party's name count for less than matches on a name:
+PARTY_WEIGHT = 0.5
+
+# The most people whose names are compared with the query in detail:
+MAX_CANDIDATES = 500
+
+
+def get_words(text):
+    """Return the words in text, lowercased and with accents removed
+
+    Apostrophes are removed rather than splitting words, so that
+    "O'Reilly" and "OReilly" are the same word."""
+    text = unicodedata.normalize('NFKD', text_type(text).lower())
+    text = ''.join(
+        FOLDED_LETTERS.get(c, c) for c in text
+        if not unicodedata.combining(c)
+    )
+    text = APOSTROPHES_RE.sub('', text)
+    return [word for word in NON_WORD_RE.split(text) if word]
+
+
+def get_trigrams(word, partial=False):
+    """Return the set of trigrams in a word, padded as in pg_trgm
+
+    If 'partial' is true, the word may be the start of a longer one,
+    so the trigrams that include the end of the word are left out."""
+    padded = '  ' + word + ('' if partial else ' ')
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def get_word_similarity(query_word, word):
+    """Return how well a word in a query matches a word in a name
+
+    A complete or partial (prefix) match is a good match; otherwise
+    it's the fraction of the trigrams of the query word that are in
+    the word, which allows for a typo or two in longer words."""
+    if word == query_word:
+        return 1
+    if word.startswith(query_word):
+        return 0.9
+    query_trigrams = get_trigrams(query_word, partial=True)
+    shared = len(query_trigrams & get_trigrams(word)) / len(query_trigrams)
+    return 0.8 * shared if shared >= MIN_SIMILARITY else 0
+
+
+def get_best_similarity(query_word, words, weight=1):
+    return weight * max(
+        [get_word_similarity(query_word, word) for word in words] or [0])
+
+
+class PersonSearchDocumentQuerySet(models.QuerySet):
+
+    def update_for_people(self, person_ids):
+        """Create, update or remove the documents for these people
+
+        This takes a fixed number of queries however many people
+        there are."""
+        person_ids = list(person_ids)
+        people = list(
+            Person.objects.filter(pk__in=person_ids)
+            .prefetch_related('other_names')
+        )
+        person_id_to_parties = defaultdict(set)
+        for person_id, party_name in Membership.objects.filter(
+                person_id__in=person_ids,
+                on_behalf_of__isnull=False,
+        ).values_list('person_id', 'on_behalf_of__name'):
+            person_id_to_parties[person_id].add(party_name)
+        PersonSearchTrigram.objects \
+            .filter(document_id__in=person_ids).delete()
+        self.filter(person_id__in=person_ids).delete()
+        documents = []
+        trigrams = []
+        for person in people:
+            names = [
+                person.name, person.given_name, person.family_name,
+                person.additional_name,
+            ] + [other_name.name for other_name in person.other_names.all()]
+            name_words = set(get_words(' '.join(n for n in names if n)))
+            party_words = set(get_words(
+                ' '.join(sorted(person_id_to_parties[person.id]))))
+            documents.append(PersonSearchDocument(
+                person=person,
+                name=person.name,
+                name_words=' '.join(sorted(name_words)),
+                party_words=' '.join(sorted(party_words)),
+            ))
+            person_trigrams = set()
+            for word in name_words | party_words:
+                person_trigrams.update(get_trigrams(word))
+            trigrams.extend(
+                PersonSearchTrigram(document_id=person.id, trigram=trigram)
+                for trigram in sorted(person_trigrams)
+            )
+        self.bulk_create(documents)
+        PersonSearchTrigram.objects.bulk_create(trigrams, batch_size=1000)
+
+    def rebuild(self, batch_size=1000):
+        """Recreate the search documents of every person from scratch"""
+        PersonSearchUpdate.objects.all().delete()
+        PersonSearchTrigram.objects.all().delete()
+        self.all().delete()
+        person_ids = list(
+            Person.objects.order_by('pk').values_list('pk', flat=True))
+        for i in range(0, len(person_ids), batch_size):
+            self.update_for_people(person_ids[i:i + batch_size])
+
+    def search(self, query):
+        """Return the IDs of people matching the query, best first
+
+        People are found by the trigrams their names (and parties)
+        share with the words in the query, and then each of those
+        words has to match one of the words in their names or parties,
+        completely, as the start of the word, or with a typo or two.
+        Those matching more of the query, and more of it in their
+        names rather than parties, come first."""
+        query_words = get_words(query)
+        if not query_words:
+            return []
+        query_trigrams = set()
+        for word in query_words:
+            query_trigrams.update(get_trigrams(word, partial=True))
+        min_matches = max(
+            1, int(math.ceil(MIN_SIMILARITY * len(query_trigrams))))
+        candidate_ids = [
+            row['document_id'] for row in
+            PersonSearchTrigram.objects
+            .filter(trigram__in=query_trigrams)
+            .values('document_id')
+            .annotate(matches=Count('id'))
+            .filter(matches__gte=min_matches)
+            .order_by('-matches', 'document_id')[:MAX_CANDIDATES]
+        ]
+        results = []
+        for document in self.filter(person_id__in=candidate_ids):
+            name_words = document.name_words.split()
+            party_words = document.party_words.split()
+            score = 0
+            for query_word in query_words:
+                word_score = max(
+                    get_best_similarity(query_word, name_words),
+                    get_best_similarity(
+                        query_word, party_words, PARTY_WEIGHT),
+                )
+                if not word_score:
+                    break
+                score += word_score
+            else:
+                results.append((-score, document.name, document.person_id))
+        return [person_id for _, _, person_id in sorted(results)]
+
+
+class PersonSearchDocument(models.Model):
+    """The words in a person's names and parties, for searching
+
+    Each person has one of these, and a PersonSearchTrigram for each
+    trigram in those words, which is what's looked up to find people
+    whose names are like the query.  The words are lowercased and
+    have accents removed.  When people, their other names and their
+    candidacies are changed, they're queued to be updated (see
+    PersonSearchUpdate), or you can recreate them all with the
+    candidates_rebuild_person_search_index command."""
+
+    person = models.OneToOneField(
+        Person, primary_key=True, related_name='search_document')
+    name = models.CharField(max_length=512)
+    name_words = models.TextField()
+    party_words = models.TextField()
+
+    objects = PersonSearchDocumentQuerySet.as_manager()
+
+
+class PersonSearchTrigram(models.Model):
+    document = models.ForeignKey(
+        PersonSearchDocument, related_name='trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        index_together = [
+            ('trigram', 'document'),
+        ]
+
+
+class PersonSearchUpdateQuerySet(models.QuerySet):
+
+    def process(self, person_ids=None, batch_size=1000):
+        """Update the search documents of queued people, in batches
+
+        If 'person_ids' is given, only those people are updated.  The
+        queued rows are locked while their people are updated, so that
+        two processes don't update the same people at once.  Returns
+        the number of people updated."""
+        updated = 0
+        while True:
+            with transaction.atomic():
+                queued = self.select_for_update().order_by('pk')
+                if person_ids is not None:
+                    queued = queued.filter(person_id__in=list(person_ids))
+                rows = list(queued.values_list('pk', 'person_id')[:batch_size])
+                if not rows:
+                    return updated
+                batch_person_ids = set(person_id for _, person_id in rows)
+                PersonSearchDocument.objects \
+                    .update_for_people(batch_person_ids)
+                # Any later rows for these people were queued by
+                # transactions that hadn't committed yet, so are kept:
+                self.filter(
+                    person_id__in=batch_person_ids,
+                    pk__lte=max(pk for pk, _ in rows),
+                ).delete()
+                updated += len(batch_person_ids)
+
+    def get_lag(self):
+        """Return how long the oldest queued update has been waiting"""
+        oldest = self.aggregate(Min('queued'))['queued__min']
+        if oldest is None:
+            return timedelta(0)
+        return timezone.now() - oldest
+
+
+class PersonSearchUpdate(models.Model):
+    """A person whose search document needs to be updated
+
+    Saving a person, their other names or candidacies just adds one of
+    these, in the same transaction, rather than updating the search
+    index there and then.  The queue is processed in batches at the
+    end of each request (by PersonSearchUpdateMiddleware) for the
+    people edited in it, and otherwise by the
+    candidates_update_person_search_index command.  There may be
+    several rows for the same person, and the person may since have
+    been deleted, which is why this isn't a foreign key."""
+
+    person_id = models.IntegerField(db_index=True)
+    queued = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = PersonSearchUpdateQuerySet.as_manager()
+
+
+_queued_in_thread = threading.local()
+
+
+def queue_search_update(person_ids):
+    person_ids = set(person_ids)
+    if not person_ids:
+        return
+    PersonSearchUpdate.objects.bulk_create(
+        [PersonSearchUpdate(person_id=person_id) for person_id in person_ids],
+        batch_size=1000,
+    )
+    get_queued_in_thread().update(person_ids)
+
+
+def get_queued_in_thread():
+    """Return the IDs of people queued for an update by this thread"""
+    if not hasattr(_queued_in_thread, 'person_ids'):
+        _queued_in_thread.person_ids = set()
+    return _queued_in_thread.person_ids
+
+
+def pop_queued_in_thread():
+    person_ids = get_queued_in_thread()
+    _queued_in_thread.person_ids = set()
+    return person_ids
+
+
+def queue_search_update_for_person(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    queue_search_update([instance.id])
+
+
+def queue_search_update_for_person_extra(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    queue_search_update([instance.base_id])
+
+
+def queue_search_update_for_other_name(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if instance.content_type_id == \
+            ContentType.objects.get_for_model(Person).id:
+        queue_search_update([instance.object_id])
+
+
+def queue_search_update_for_membership(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    queue_search_update([instance.person_id])
+
+
+def queue_search_update_for_party(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    queue_search_update(
+        Membership.objects.filter(on_behalf_of=instance)
+        .order_by().values_list('person_id', flat=True).distinct()
+    )
+
+
+post_save.connect(queue_search_update_for_person, sender=Person)
+post_save.connect(queue_search_update_for_person_extra, sender=PersonExtra)
+post_save.connect(queue_search_update_for_other_name, sender=OtherName)
+post_delete.connect(queue_search_update_for_other_name, sender=OtherName)
+post_save.connect(queue_search_update_for_membership, sender=Membership)
+post_delete.connect(queue_search_update_for_membership, sender=Membership)
+post_save.connect(queue_search_update_for_party, sender=Organization)
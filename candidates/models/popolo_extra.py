@@ -9,7 +9,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.storage import FileSystemStorage
+from django.core.files import File
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.template import loader, Context
@@ -25,9 +25,7 @@ from slugify import slugify
 from django_date_extensions.fields import ApproximateDate
 
 from elections.models import Election, AreaType
-from popolo.models import (
-    ContactDetail, Person, Organization, Post, Membership, Area, Identifier
-)
+from popolo.models import Person, Organization, Post, Membership, Area
 from images.models import Image, HasImageMixin
 
 from compat import python_2_unicode_compatible
@@ -35,10 +33,12 @@ from .fields import (
     ExtraField, PersonExtraFieldValue, SimplePopoloField, ComplexPopoloField,
     get_complex_popolo_fields,
 )
+from .image_store import StoredImage
 from ..diffs import get_version_diffs
+from ..thumbnails import generate_thumbnails
 from ..twitter_api import update_twitter_user_id, TwitterAPITokenMissing
 from .sitesettings import get_site_setting
-from .versions import get_person_as_version_data
+from .versions import get_person_as_version_data, PersonVersion
 
 """Extensions to the base django-popolo classes for YourNextRepresentative
 
@@ -247,11 +247,49 @@ class PersonExtraQuerySet(models.QuerySet):
                 'images__extra__uploading_user',
             )
 
+    def csv_rows(self, election, base_url=None):
+        """Return the CSV rows of every person in this queryset
+
+        The rows are as from PersonExtra.as_list_of_dicts, including
+        the country-specific extra columns, but everything needed for
+        them is fetched in a fixed number of queries, however many
+        people there are."""
+        complex_popolo_fields = get_complex_popolo_fields()
+        user_settings = get_current_usersettings()
+        result = []
+        for person_extra in self.joins_for_csv_output():
+            # Share one copy of the complex fields mapping rather than
+            # fetching it for each person:
+            person_extra.complex_popolo_fields = complex_popolo_fields
+            result += person_extra.as_list_of_dicts(
+                election, base_url, user_settings=user_settings)
+        return result
+
 
 class MultipleTwitterIdentifiers(Exception):
     pass
 
 
+def get_twitter_identifiers(name, person_id, user_ids, screen_names):
+    """Return a person's Twitter user ID and screen name (or None)
+
+    'user_ids' and 'screen_names' should be every Twitter user ID and
+    screen name the person has; if they have more than one of either,
+    MultipleTwitterIdentifiers is raised."""
+    if len(screen_names) > 1:
+        msg = "Multiple Twitter screen names found for {name} ({id})"
+        raise MultipleTwitterIdentifiers(
+            _(msg).format(name=name, id=person_id))
+    if len(user_ids) > 1:
+        msg = "Multiple Twitter user IDs found for {name} ({id})"
+        raise MultipleTwitterIdentifiers(
+            _(msg).format(name=name, id=person_id))
+    return (
+        user_ids[0] if user_ids else None,
+        screen_names[0] if screen_names else None,
+    )
+
+
 class VersionNotFound(Exception):
     pass
 
@@ -260,9 +298,17 @@ class VersionNotFound(Exception):
 class PersonExtra(HasImageMixin, models.Model):
     base = models.OneToOneField(Person, related_name='extra')
 
-    # This field stores JSON data with previous version information
-    # (as it did in PopIt).
-    versions = models.TextField(blank=True)
+    # This field used to store JSON data with previous version
+    # information (as it did in PopIt); now each version is a
+    # PersonVersion row.  It's only kept so that
+    # candidates_backfill_person_versions can convert any histories
+    # that haven't been moved yet.
+    legacy_versions = models.TextField(blank=True, db_column='versions')
+
+    # When anything shown about the person last changed, for
+    # conditional GETs of their page and API data (see
+    # candidates/last_changed.py):
+    last_changed = models.DateTimeField(auto_now=True, db_index=True)
 
     images = GenericRelation(Image)
 
@@ -413,44 +459,61 @@ class PersonExtra(HasImageMixin, models.Model):
 
     @property
     def twitter_identifiers(self):
-        screen_name = None
-        user_id = None
-        # Get the Twitter screen name and user ID if they exist:
-        try:
-            screen_name = self.base.contact_details \
-                .get(contact_type='twitter').value
-        except ContactDetail.DoesNotExist:
-            screen_name = None
-        except ContactDetail.MultipleObjectsReturned:
-            msg = "Multiple Twitter screen names found for {name} ({id})"
-            raise MultipleTwitterIdentifiers(
-                _(msg).format(name=self.base.name, id=self.base.id))
+        # Get the Twitter user ID and screen name if they exist:
+        return get_twitter_identifiers(
+            self.base.name,
+            self.base.id,
+            list(
+                self.base.identifiers.filter(scheme='twitter')
+                .values_list('identifier', flat=True)
+            ),
+            list(
+                self.base.contact_details.filter(contact_type='twitter')
+                .values_list('value', flat=True)
+            ),
+        )
+
+    @property
+    def versions(self):
+        """Return a list of this person's versions, most recent first
+
+        If the versions have been prefetched (as in the API), this
+        doesn't need another query."""
+        return self.base.person_versions.all().as_versions()
+
+    def get_version(self, version_id):
         try:
-            user_id = self.base.identifiers \
-                .get(scheme='twitter').identifier
-        except Identifier.DoesNotExist:
-            user_id = None
-        except Identifier.MultipleObjectsReturned:
-            msg = "Multiple Twitter user IDs found for {name} ({id})"
-            raise MultipleTwitterIdentifiers(
-                _(msg).format(name=self.base.name, id=self.base.id))
-        return user_id, screen_name
+            return PersonVersion.objects.get(
+                person_id=self.base_id, version_id=version_id
+            ).as_version()
+        except PersonVersion.DoesNotExist:
+            msg = "Couldn't find version {0} for person with ID {1}"
+            raise VersionNotFound(msg.format(version_id, self.base_id))
 
     @property
     def version_diffs(self):
-        versions = self.versions
-        if not versions:
-            versions = []
-        return get_version_diffs(json.loads(versions))
+        person_versions = list(
+            PersonVersion.objects.filter(person_id=self.base_id)
+        )
+        if all(pv.diffs for pv in person_versions):
+            return [pv.as_version_with_diffs() for pv in person_versions]
+        # Then the diffs of some versions haven't been stored yet
+        # (candidates_backfill_version_diffs will do that) so we have
+        # to work them all out:
+        return get_version_diffs([pv.as_version() for pv in person_versions])
 
     def diff_for_version(self, version_id, inline_style=False):
-        versions = self.versions or []
-        all_version_diffs = get_version_diffs(json.loads(versions))
+        person_version = PersonVersion.objects.filter(
+            person_id=self.base_id, version_id=version_id
+        ).first()
         right_version_diff = None
-        for version_diff in all_version_diffs:
-            if version_diff['version_id'] == version_id:
-                right_version_diff = version_diff
-                break
+        if person_version and person_version.diffs:
+            right_version_diff = person_version.as_version_with_diffs()
+        elif person_version:
+            for version_diff in self.version_diffs:
+                if version_diff['version_id'] == version_id:
+                    right_version_diff = version_diff
+                    break
         if not right_version_diff:
             msg = "Couldn't find version {0} for person with ID {1}"
             raise VersionNotFound(msg.format(version_id, self.base.id))
@@ -463,13 +526,9 @@ class PersonExtra(HasImageMixin, models.Model):
         return squash_whitespace('<dl>{0}</dl>'.format(rendered))
 
     def record_version(self, change_metadata):
-        versions = []
-        if self.versions:
-            versions = json.loads(self.versions)
         new_version = change_metadata.copy()
         new_version['data'] = get_person_as_version_data(self.base)
-        versions.insert(0, new_version)
-        self.versions = json.dumps(versions)
+        PersonVersion.objects.create_from_version(self.base, new_version)
 
     def update_complex_field(self, location, new_value):
         existing_info_types = [location.info_type]
@@ -547,9 +606,45 @@ class PersonExtra(HasImageMixin, models.Model):
         update_person_from_form(person, person_extra, form)
         return person_extra
 
-    def as_list_of_dicts(self, election, base_url=None):
+    def as_list_of_dicts(self, election, base_url=None, user_settings=None):
+        from ..election_specific import get_extra_csv_values
         result = []
-        user_settings = get_current_usersettings()
+        for candidacy, row in self._csv_rows_without_extra_values(
+                election, base_url, user_settings
+        ):
+            extra_csv_data = get_extra_csv_values(
+                self.base, election, candidacy.post)
+            row.update(extra_csv_data)
+            result.append(row)
+        return result
+
+    def as_dicts_for_csv_files(self, base_url=None, user_settings=None):
+        """Return the CSV rows for every candidacy of this person
+
+        Each element is a tuple of the candidacy's election, the row
+        for the CSV file of all elections and the row for the CSV file
+        of just that election. This is equivalent to calling
+        as_list_of_dicts for None and then for each election, but only
+        builds each row once."""
+        from ..election_specific import get_extra_csv_values
+        result = []
+        for candidacy, row in self._csv_rows_without_extra_values(
+                None, base_url, user_settings
+        ):
+            election = candidacy.extra.election
+            all_elections_row = row.copy()
+            all_elections_row.update(
+                get_extra_csv_values(self.base, None, candidacy.post))
+            row.update(
+                get_extra_csv_values(self.base, election, candidacy.post))
+            result.append((election, all_elections_row, row))
+        return result
+
+    def _csv_rows_without_extra_values(self, election, base_url,
+                                       user_settings=None):
+        result = []
+        if user_settings is None:
+            user_settings = get_current_usersettings()
         if not base_url:
             base_url = ''
         # Find the list of relevant candidacies. So as not to cause
@@ -648,10 +743,7 @@ class PersonExtra(HasImageMixin, models.Model):
                 'image_uploading_user': image_uploading_user,
                 'image_uploading_user_notes': image_uploading_user_notes,
             }
-            from ..election_specific import get_extra_csv_values
-            extra_csv_data = get_extra_csv_values(self.base, election, post)
-            row.update(extra_csv_data)
-            result.append(row)
+            result.append((candidacy, row))
 
         return result
 
@@ -697,6 +789,10 @@ class PostExtra(HasImageMixin, models.Model):
     group = models.CharField(max_length=1024, blank=True)
     party_set = models.ForeignKey('PartySet', blank=True, null=True)
 
+    # When the post or anyone standing for it last changed (see
+    # candidates/last_changed.py):
+    last_changed = models.DateTimeField(auto_now=True, db_index=True)
+
     def __str__(self):
         # WARNING: This will cause an extra query when getting the
         # repr() or unicode() of this object unless the base object
@@ -805,13 +901,22 @@ class ImageExtraManager(models.Manager):
     def create_from_file(
             self, image_filename, ideal_relative_name, base_kwargs, extra_kwargs
     ):
-        # Import the file to media root and create the ORM
-        # objects.
-        storage = FileSystemStorage()
-        desired_storage_path = join('images', ideal_relative_name)
         with open(image_filename, 'rb') as f:
-            storage_filename = storage.save(desired_storage_path, f)
-        image = Image.objects.create(image=storage_filename, **base_kwargs)
+            return self.create_from_content(
+                f, ideal_relative_name, base_kwargs, extra_kwargs)
+
+    def create_from_content(
+            self, f, ideal_relative_name, base_kwargs, extra_kwargs
+    ):
+        # Add the file object's contents to the image store (unless
+        # they're there already) and create the ORM objects.
+        stored_image = StoredImage.objects.store(
+            File(f), join('images', ideal_relative_name))
+        extra_kwargs.setdefault('md5sum', stored_image.md5sum)
+        image = Image.objects.create(image=stored_image.name, **base_kwargs)
+        # Make the thumbnails now, rather than when someone first
+        # views a page with the image on:
+        generate_thumbnails(image.image)
         return ImageExtra.objects.create(base=image, **extra_kwargs)
 
     def update_or_create_from_file(
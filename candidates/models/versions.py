@@ -2,11 +2,18 @@ from __future__ import unicode_literals
 
 from collections import defaultdict
 from datetime import datetime
+import json
 import re
 
+from dateutil import parser
+
 from .fields import ExtraField, SimplePopoloField, ComplexPopoloField
 
+from django.db import models, transaction
 from django.db.models import F
+from django.utils import timezone
+
+from popolo.models import Person
 
 from ..twitter_api import update_twitter_user_id, TwitterAPITokenMissing
 
@@ -14,21 +21,80 @@ from ..twitter_api import update_twitter_user_id, TwitterAPITokenMissing
 # FIXME: check all the preserve_fields are dealt with
 
 def get_person_as_version_data(person):
+    return person_as_version_data(
+        person,
+        list(SimplePopoloField.objects.all()),
+        list(ComplexPopoloField.objects.all()),
+        list(ExtraField.objects.all()),
+    )
+
+
+def get_people_as_version_data(person_ids):
+    """Return a dict mapping person ID to the version data for that person
+
+    This gives the same result as calling get_person_as_version_data
+    for each person, but in a fixed number of queries."""
+    from popolo.models import Membership
+    simple_fields = list(SimplePopoloField.objects.all())
+    complex_fields = list(ComplexPopoloField.objects.all())
+    extra_fields = list(ExtraField.objects.all())
+    complex_popolo_fields = {cf.name: cf for cf in complex_fields}
+    people = Person.objects.filter(pk__in=person_ids) \
+        .select_related('extra') \
+        .prefetch_related(
+            models.Prefetch(
+                'memberships',
+                Membership.objects.select_related(
+                    'extra__election',
+                    'on_behalf_of__extra',
+                    'post__extra',
+                )
+            ),
+            'contact_details',
+            'extra__not_standing',
+            'extra_field_values__field',
+            'identifiers',
+            'links',
+            'other_names',
+        )
+    result = {}
+    for person in people:
+        person.extra.base = person
+        person.extra.complex_popolo_fields = complex_popolo_fields
+        result[person.id] = person_as_version_data(
+            person, simple_fields, complex_fields, extra_fields)
+    return result
+
+
+def other_name_sort_key(other_name):
+    # This is the same as ordering by name, start_date and end_date
+    # in PostgreSQL, where nulls come last:
+    return (
+        other_name.name,
+        other_name.start_date is None, other_name.start_date or '',
+        other_name.end_date is None, other_name.end_date or '',
+    )
+
+
+def person_as_version_data(person, simple_fields, complex_fields,
+                           all_extra_fields):
+    # This only uses all() on related managers, so that it doesn't
+    # need any queries for relations that have been prefetched.
     from candidates.election_specific import shorten_post_label
     result = {}
     person_extra = person.extra
     result['id'] = str(person.id)
-    for field in SimplePopoloField.objects.all():
+    for field in simple_fields:
         result[field.name] = getattr(person, field.name) or ''
-    for field in ComplexPopoloField.objects.all():
+    for field in complex_fields:
         result[field.name] = getattr(person_extra, field.name)
     extra_values = {
         extra_value.field.key: extra_value.value
-        for extra_value in person.extra_field_values.select_related('field')
+        for extra_value in person.extra_field_values.all()
     }
     extra_fields = {
         extra_field.key: extra_values.get(extra_field.key, '')
-        for extra_field in ExtraField.objects.all()
+        for extra_field in all_extra_fields
     }
     if extra_fields:
         result['extra_fields'] = extra_fields
@@ -39,7 +105,7 @@ def get_person_as_version_data(person):
             'start_date': on.start_date,
             'end_date': on.end_date,
         }
-        for on in person.other_names.order_by('name', 'start_date', 'end_date')
+        for on in sorted(person.other_names.all(), key=other_name_sort_key)
     ]
     identifiers = list(person.identifiers.all())
     if identifiers:
@@ -53,8 +119,10 @@ def get_person_as_version_data(person):
     result['image'] = person.image
     standing_in = {}
     party_memberships = {}
-    for membership in person.memberships.filter(post__isnull=False):
+    for membership in person.memberships.all():
         from candidates.models import MembershipExtra
+        if membership.post_id is None:
+            continue
         post = membership.post
         try:
             membership_extra = membership.extra
@@ -177,6 +245,9 @@ def revert_person_from_version_data(person, person_extra, version_data):
     except TwitterAPITokenMissing:
         pass
 
+class InconsistentVersionHistory(Exception):
+    pass
+
 def version_timestamp_key(version):
     return datetime.strptime(version['timestamp'], '%Y-%m-%dT%H:%M:%S.%f')
 
@@ -228,7 +299,7 @@ def get_versions_parent_map(versions_data):
             msg = "Found a bogus merge version for person with " \
                   "ID: {person_id} - no merged history of person " \
                   "with ID {other_person_id} found"
-            raise Exception(msg.format(
+            raise InconsistentVersionHistory(msg.format(
                 person_id=canonical_person_id,
                 other_person_id=merged_from))
         last_version_id_of_other = \
@@ -238,9 +309,244 @@ def get_versions_parent_map(versions_data):
         msg = "It looks like there was a bogus merge version for person " \
               "with ID {person_id}; there were {nm} merge versions and {np} " \
               "person IDs."
-        raise Exception(msg.format(
+        raise InconsistentVersionHistory(msg.format(
             person_id=canonical_person_id,
             nm=number_of_merges,
             np=number_of_person_ids,
         ))
     return version_id_to_parent_ids
+
+
+def parse_version_timestamp(timestamp):
+    """Turn the timestamp string of a version into an aware datetime
+
+    The timestamps in version data are naive ISO 8601 strings in UTC."""
+    result = parser.parse(timestamp)
+    if timezone.is_naive(result):
+        result = timezone.make_aware(result, timezone.utc)
+    return result
+
+
+def get_person_version_fields(version, parent_diff_operations=None):
+    """Return the PersonVersion field values to store a version dict
+
+    If 'parent_diff_operations' isn't supplied, the diffs are left
+    to be worked out by candidates_backfill_version_diffs."""
+    metadata = {k: v for k, v in version.items() if k != 'data'}
+    result = {
+        'version_id': version['version_id'],
+        'timestamp': parse_version_timestamp(version['timestamp']),
+        'metadata': json.dumps(metadata),
+        'data': json.dumps(version.get('data', {})),
+    }
+    if parent_diff_operations is not None:
+        result['diffs'] = json.dumps(parent_diff_operations)
+    return result
+
+
+def move_legacy_versions_to_table(
+        person_extra_model, person_version_model, batch_size=100,
+        progress_callback=None,
+):
+    """Convert JSON arrays of versions into one PersonVersion row per version
+
+    This is used by the candidates_backfill_person_versions command
+    (migration 0037 has its own copy of it).  Only batch_size
+    people's versions are held in memory at once, and each batch is
+    committed in its own transaction, so it's safe to interrupt and
+    run again.  Returns the number of people whose versions were
+    moved."""
+    converted = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            person_extra_model.objects
+            .filter(pk__gt=last_pk)
+            .exclude(legacy_versions='')
+            .order_by('pk')
+            .values_list('pk', 'base_id', 'legacy_versions')[:batch_size]
+        )
+        if not batch:
+            return converted
+        with transaction.atomic():
+            for person_extra_id, person_id, legacy_versions in batch:
+                # The JSON array has the most recent version first, but
+                # PersonVersion rows are ordered most recently created
+                # first, so insert the oldest version first:
+                person_version_model.objects.bulk_create([
+                    person_version_model(
+                        person_id=person_id, **get_person_version_fields(v)
+                    )
+                    for v in reversed(json.loads(legacy_versions))
+                ])
+            person_extra_model.objects \
+                .filter(pk__in=[row[0] for row in batch]) \
+                .update(legacy_versions='')
+        converted += len(batch)
+        last_pk = batch[-1][0]
+        if progress_callback:
+            progress_callback(converted)
+
+
+def build_person_versions(person, versions):
+    """Return unsaved PersonVersions for versions given most recent first
+
+    This lets the caller create the rows for many people at once."""
+    from candidates.diffs import get_versions_parent_diff_operations
+    new_person_versions = [
+        PersonVersion(person=person, **get_person_version_fields(v))
+        for v in reversed(versions)
+    ]
+    try:
+        id_to_parent_diff_operations = \
+            get_versions_parent_diff_operations(versions)
+    except InconsistentVersionHistory:
+        pass
+    else:
+        for person_version in new_person_versions:
+            person_version.diffs = json.dumps(
+                id_to_parent_diff_operations[person_version.version_id]
+            )
+    return new_person_versions
+
+
+class PersonVersionQuerySet(models.QuerySet):
+
+    def get_parents_of_new_version(self, person, version):
+        """Return (version_id, data) for each parent of a version to be recorded
+
+        Its parent is the most recent version of the same person, and
+        if it records a merge, the most recent version of the person
+        that was merged in (whose versions must have been moved to
+        this person already) is a parent too.  Those are almost always
+        the first few rows, so the rows are fetched a few at a time."""
+        wanted_person_ids = [version['data']['id']]
+        merged_from = is_a_merge(version)
+        if merged_from:
+            wanted_person_ids.append(merged_from)
+        found = {}
+        qs = self.filter(person=person).only('version_id', 'data')
+        start = 0
+        while len(found) < len(wanted_person_ids):
+            chunk = list(qs[start:start + 10])
+            if not chunk:
+                break
+            for person_version in chunk:
+                data = json.loads(person_version.data)
+                if data.get('id') in wanted_person_ids:
+                    found.setdefault(
+                        data['id'], (person_version.version_id, data))
+            start += len(chunk)
+        return [found[i] for i in wanted_person_ids if i in found]
+
+    def create_from_version(self, person, version):
+        """Record a new version, working out its diffs against its parents"""
+        from candidates.diffs import (
+            get_parent_diff_operations, get_parents_version_data
+        )
+        from candidates.last_changed import mark_people_changed
+        parents_with_data = \
+            self.get_parents_of_new_version(person, version) or \
+            get_parents_version_data([], {})
+        mark_people_changed([person.id])
+        return self.create(
+            person=person,
+            **get_person_version_fields(
+                version,
+                get_parent_diff_operations(version['data'], parents_with_data)
+            )
+        )
+
+    def bulk_create_new_versions(self, person_id_to_version):
+        """Record a new version for each of many people at once
+
+        This is like calling create_from_version for each person,
+        except that it doesn't handle versions that record merges:
+        the parent of each new version is just the most recent
+        version of that person, which is found for everyone in two
+        queries."""
+        from candidates.diffs import (
+            get_parent_diff_operations, get_parents_version_data
+        )
+        from candidates.last_changed import mark_people_changed
+        mark_people_changed(person_id_to_version.keys())
+        latest_ids = [
+            row['latest_id'] for row in
+            self.filter(person_id__in=list(person_id_to_version.keys()))
+            .order_by().values('person')
+            .annotate(latest_id=models.Max('id'))
+        ]
+        person_id_to_parents = {
+            person_version.person_id: [(
+                person_version.version_id, json.loads(person_version.data)
+            )]
+            for person_version in self.filter(pk__in=latest_ids)
+            .only('person', 'version_id', 'data')
+        }
+        return self.bulk_create([
+            PersonVersion(
+                person_id=person_id,
+                **get_person_version_fields(
+                    version,
+                    get_parent_diff_operations(
+                        version['data'],
+                        person_id_to_parents.get(person_id) or
+                        get_parents_version_data([], {})
+                    )
+                )
+            )
+            for person_id, version in sorted(person_id_to_version.items())
+        ])
+
+    def bulk_create_from_versions(self, person, versions):
+        """Create rows for a list of versions, the most recent first"""
+        return self.bulk_create(
+            build_person_versions(person, versions)
+        )
+
+    def as_versions(self):
+        return [person_version.as_version() for person_version in self]
+
+
+class PersonVersion(models.Model):
+    '''A single version of a person's data, recorded after each edit
+
+    These used to be stored in a JSON array on PersonExtra (as they
+    were in PopIt), which meant that every edit had to rewrite the
+    person's whole history.  Now each version gets its own row, and
+    PersonExtra.versions only fetches them when they're needed.
+
+    'metadata' is the JSON of everything in the version apart from
+    'data' (e.g. 'version_id', 'timestamp', 'username' and
+    'information_source'), and 'data' is the JSON representation of
+    the person at that time.
+
+    'diffs' is the JSON of the patch operations that get from each of
+    the version's parents to this version, which are worked out once
+    when the version is recorded.  It's blank if they haven't been
+    worked out yet.'''
+
+    person = models.ForeignKey(Person, related_name='person_versions')
+    version_id = models.CharField(max_length=32, db_index=True)
+    timestamp = models.DateTimeField()
+    metadata = models.TextField()
+    data = models.TextField()
+    diffs = models.TextField(blank=True)
+
+    objects = PersonVersionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-id',)
+        index_together = [
+            ('person', 'timestamp'),
+        ]
+
+    def as_version(self):
+        version = json.loads(self.metadata)
+        version['data'] = json.loads(self.data)
+        return version
+
+    def as_version_with_diffs(self):
+        """Return the version as get_version_diffs would, from the stored diffs"""
+        from candidates.diffs import explain_parent_diffs
+        return explain_parent_diffs(self.as_version(), json.loads(self.diffs))
@@ -0,0 +1,112 @@
+"""Versions for the cached candidate lists of each post
+
+The candidates listed for a post (and the rendered HTML for each of
+them) are cached under keys that include a version token for that
+post. Rather than finding and deleting all of those keys when
+something changes, the post's version token is replaced, so the old
+entries are no longer used and will be evicted in time.
+
+Since the version is replaced when the change is made, before the
+transaction it's made in has committed, another request could cache
+the old list under the new version in between.  So the versions
+replaced during a request are replaced again once it's finished (by
+PostCacheMiddleware), when its transactions have committed.  The
+version tokens for people's cached API data (in candidates.api_cache)
+are replaced in the same way."""
+
+from __future__ import unicode_literals
+
+import threading
+from uuid import uuid4
+
+from django.core.cache import cache
+
+# Entries for old versions are never looked up again, so there's no
+# point keeping them around for long (this should match the timeout
+# in candidates/_person_in_list_cached.html):
+CANDIDATE_LIST_CACHE_SECONDS = 24 * 60 * 60
+
+ALL_POSTS_VERSION_KEY = 'candidate-list-version'
+
+
+def get_post_cache_version_key(post_id):
+    return 'candidate-list-version:{0}'.format(post_id)
+
+
+def get_cache_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        # Use whichever version was stored first, if another process
+        # got in before us:
+        version = cache.get(key)
+    return version
+
+
+def get_post_cache_version(post_id):
+    """Return the current version of cached candidate lists for a post
+
+    This changes whenever the post's list changes, or when something
+    affecting every post's list (like the site settings) changes. If
+    the cache isn't storing anything, this returns None."""
+    all_posts_version = get_cache_version(ALL_POSTS_VERSION_KEY)
+    post_version = get_cache_version(get_post_cache_version_key(post_id))
+    if all_posts_version is None or post_version is None:
+        return None
+    return '{0}-{1}'.format(all_posts_version, post_version)
+
+
+def get_candidate_list_cache_key(election, post_id, candidates_locked,
+                                 version):
+    return 'candidate-list:{election}:{post_id}:{locked}:{version}'.format(
+        election=election,
+        post_id=post_id,
+        locked=int(bool(candidates_locked)),
+        version=version,
+    )
+
+
+_invalidated_in_thread = threading.local()
+
+
+def get_keys_invalidated_in_thread():
+    """Return the version keys replaced by this thread"""
+    if not hasattr(_invalidated_in_thread, 'keys'):
+        _invalidated_in_thread.keys = set()
+    return _invalidated_in_thread.keys
+
+
+def pop_keys_invalidated_in_thread():
+    keys = get_keys_invalidated_in_thread()
+    _invalidated_in_thread.keys = set()
+    return keys
+
+
+def replace_versions(keys):
+    """Replace these version tokens now, and again after the request"""
+    keys = set(keys)
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+    get_keys_invalidated_in_thread().update(keys)
+
+
+def invalidate_post_caches(post_ids):
+    """Stop using any cached candidate lists for these posts"""
+    replace_versions(
+        get_post_cache_version_key(post_id)
+        for post_id in post_ids
+        if post_id is not None
+    )
+
+
+def invalidate_all_post_caches():
+    replace_versions([ALL_POSTS_VERSION_KEY])
+
+
+def invalidate_post_caches_again():
+    """Replace the versions replaced by this thread again
+
+    This should be called once the changes that the versions were
+    replaced for have been committed."""
+    keys = pop_keys_invalidated_in_thread()
+    if keys:
+        cache.set_many({key: uuid4().hex for key in keys}, None)
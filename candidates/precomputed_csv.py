@@ -0,0 +1,192 @@
+from __future__ import unicode_literals
+
+from datetime import datetime
+import json
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from elections.models import Election
+
+from .csv_helpers import list_to_csv
+from .models import MembershipExtra, PersonExtra, PersonVersion, PostExtra
+
+
+# The directory in default_storage that the CSV files are kept in:
+PRECOMPUTED_CSV_DIRECTORY = 'candidates-csv'
+
+
+def precomputed_csv_enabled():
+    return settings.PRECOMPUTED_CSV_ENABLED
+
+
+def get_post_csv_filename(election_slug, post_slug):
+    return '{directory}/{election}/posts/{post}.csv'.format(
+        directory=PRECOMPUTED_CSV_DIRECTORY,
+        election=election_slug,
+        post=post_slug,
+    )
+
+
+def get_election_csv_filename(election_slug):
+    return '{directory}/{election}/all.csv'.format(
+        directory=PRECOMPUTED_CSV_DIRECTORY,
+        election=election_slug,
+    )
+
+
+def is_safe_slug(slug):
+    # The slugs come from URLs, so make sure they can't be used to
+    # read files from outside the CSV directory:
+    return '..' not in slug
+
+
+def get_post_csv(election, post_extra):
+    """Return the CSV of candidates for one post in an election"""
+    people = PersonExtra.objects.filter(
+        base__memberships__extra__election=election,
+        base__memberships__post=post_extra.base,
+    ).distinct()
+    return list_to_csv(people.csv_rows(election))
+
+
+def get_election_csv(election):
+    """Return the CSV of candidates for a whole election"""
+    people = PersonExtra.objects.filter(
+        base__memberships__extra__election=election,
+    ).distinct()
+    return list_to_csv(people.csv_rows(election), group_by_post=True)
+
+
+def save_csv(filename, csv):
+    """Replace the CSV file in storage without it ever being missing
+
+    The new file is written under a temporary name (which storage makes
+    unique, so concurrent saves don't interfere) and then renamed over
+    the old one, so a request serving the file always finds a complete
+    copy."""
+    temporary_filename = default_storage.save(
+        filename + '.tmp', ContentFile(csv.encode('utf-8')))
+    os.rename(
+        default_storage.path(temporary_filename),
+        default_storage.path(filename)
+    )
+
+
+def read_csv(filename):
+    with default_storage.open(filename) as f:
+        return f.read().decode('utf-8')
+
+
+def update_post_csv(election, post_extra):
+    csv = get_post_csv(election, post_extra)
+    save_csv(get_post_csv_filename(election.slug, post_extra.slug), csv)
+    return csv
+
+
+def get_or_update_post_csv(election, post_extra):
+    filename = get_post_csv_filename(election.slug, post_extra.slug)
+    if default_storage.exists(filename):
+        return read_csv(filename)
+    return update_post_csv(election, post_extra)
+
+
+def update_election_csv(election):
+    """Build the CSV for a whole election from the CSV of each post
+
+    Within a post, the rows of an election's CSV file are in the same
+    order as in that post's CSV file, so this just needs to join them
+    together in order of post label."""
+    header = list_to_csv([])
+    post_extras = sorted(
+        PostExtra.objects.filter(elections=election).select_related('base'),
+        key=lambda pe: (pe.short_label, pe.slug)
+    )
+    csv = header + ''.join(
+        get_or_update_post_csv(election, post_extra)[len(header):]
+        for post_extra in post_extras
+    )
+    save_csv(get_election_csv_filename(election.slug), csv)
+    return csv
+
+
+def get_affected_posts(logged_action):
+    """Return (election slug, post slug) pairs whose CSV may have changed
+
+    As well as the post the action was about (if any), these are the
+    posts the person is standing in now and those they were standing
+    in as of their two most recent versions, so that a candidacy that
+    has been moved or removed is noticed too."""
+    result = set()
+    if logged_action.post:
+        post_extra = logged_action.post.extra
+        for election in post_extra.elections.all():
+            result.add((election.slug, post_extra.slug))
+    if logged_action.person_id:
+        result.update(
+            MembershipExtra.objects.filter(
+                base__person_id=logged_action.person_id,
+                base__post__isnull=False,
+                election__isnull=False,
+            ).values_list('election__slug', 'base__post__extra__slug')
+        )
+        for person_version in PersonVersion.objects.filter(
+                person_id=logged_action.person_id
+        )[:2]:
+            standing_in = json.loads(person_version.data).get('standing_in')
+            for election_slug, candidacy in (standing_in or {}).items():
+                if candidacy:
+                    result.add((election_slug, candidacy['post_id']))
+    return result
+
+
+def update_csv_for_logged_actions(logged_actions):
+    """Regenerate the CSV files of every post these actions affect
+
+    This must only be called once the changes the actions record have
+    been committed, since get_affected_posts looks at the candidacies
+    people have now."""
+    affected_posts = set()
+    for logged_action in logged_actions:
+        affected_posts.update(get_affected_posts(logged_action))
+    elections = {}
+    for election_slug, post_slug in sorted(affected_posts):
+        election = elections.get(election_slug)
+        if election is None:
+            election = Election.objects.filter(slug=election_slug).first()
+            if election is None:
+                continue
+            elections[election_slug] = election
+        post_extra = PostExtra.objects.filter(slug=post_slug).first()
+        if post_extra is None:
+            continue
+        update_post_csv(election, post_extra)
+    # Rather than rebuilding the CSV file for each whole election
+    # now, just remove them; they'll be rebuilt from the post CSV
+    # files when they're next requested.
+    for election_slug in elections:
+        default_storage.delete(get_election_csv_filename(election_slug))
+
+
+def get_csv_etag(filename):
+    if not (precomputed_csv_enabled() and default_storage.exists(filename)):
+        return None
+    modified = get_csv_last_modified(filename)
+    return '{size:x}-{modified:x}'.format(
+        size=default_storage.size(filename),
+        modified=int((modified - datetime(1970, 1, 1, tzinfo=timezone.utc))
+                     .total_seconds())
+    )
+
+
+def get_csv_last_modified(filename):
+    if not (precomputed_csv_enabled() and default_storage.exists(filename)):
+        return None
+    modified = default_storage.modified_time(filename)
+    if timezone.is_naive(modified):
+        modified = timezone.make_aware(
+            modified, timezone.get_default_timezone())
+    return modified
@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
-import json
+from datetime import datetime, timedelta
+
+from django.utils import timezone
 
 from rest_framework import serializers
 from rest_framework.reverse import reverse
@@ -300,11 +302,6 @@ class PostElectionSerializer(serializers.HyperlinkedModelSerializer):
     election = MinimalElectionSerializer(read_only=True)
 
 
-class JSONSerializerField(serializers.Field):
-    def to_representation(self, value):
-        return json.loads(value)
-
-
 class PersonExtraFieldSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = candidates_models.PersonExtraFieldValue
@@ -345,13 +342,14 @@ class PersonSerializer(MinimalPersonSerializer):
     other_names = OtherNameSerializer(many=True, read_only=True)
     images = ImageSerializer(many=True, read_only=True, source='extra.images')
 
-    versions = JSONSerializerField(source='extra.versions', read_only=True)
+    versions = serializers.ReadOnlyField(source='extra.versions')
 
     memberships = MembershipSerializer(many=True, read_only=True)
 
     extra_fields = PersonExtraFieldSerializer(
         many=True, read_only=True, source='extra_field_values')
 
+    # If this changes, update THUMBNAIL_SIZES in candidates.thumbnails
     thumbnail = HyperlinkedSorlImageField(
             '300x300',
             options={"crop": "center"},
@@ -410,6 +408,59 @@ class LoggedActionSerializer(serializers.HyperlinkedModelSerializer):
     person = MinimalPersonSerializer(read_only=True)
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def get_change_cursor(logged_action):
+    """Return a cursor for the changes feed just after this action
+
+    It's the time the action was created (in microseconds since the
+    epoch) and its ID, which are the order that changes are listed in."""
+    created = logged_action.created - EPOCH
+    microseconds = (created.days * 24 * 60 * 60 + created.seconds) * \
+        1000000 + created.microseconds
+    return '{0}-{1}'.format(microseconds, logged_action.id)
+
+
+def parse_change_cursor(cursor):
+    """Return the (created, id) encoded in a cursor, or raise ValueError"""
+    microseconds, logged_action_id = cursor.split('-')
+    return (
+        EPOCH + timedelta(microseconds=int(microseconds)),
+        int(logged_action_id)
+    )
+
+
+class ChangeSerializer(serializers.HyperlinkedModelSerializer):
+    """A LoggedAction as an event in the changes feed
+
+    This has the person and post that were changed (and the elections
+    for that post), so that a client can fetch just those again."""
+
+    class Meta:
+        model = candidates_models.LoggedAction
+        fields = (
+            'cursor',
+            'created',
+            'action_type',
+            'person',
+            'post',
+            'elections',
+            'person_new_version',
+        )
+
+    cursor = serializers.SerializerMethodField()
+    person = MinimalPersonSerializer(read_only=True)
+    post = MinimalPostExtraSerializer(source='post.extra', read_only=True)
+    elections = MinimalElectionSerializer(
+        source='post.extra.elections', many=True, read_only=True)
+    person_new_version = serializers.ReadOnlyField(
+        source='popit_person_new_version')
+
+    def get_cursor(self, logged_action):
+        return get_change_cursor(logged_action)
+
+
 class ExtraFieldSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = candidates_models.ExtraField
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 from datetime import date, timedelta
+import json
 
 import factory
 
@@ -174,7 +175,17 @@ class PersonExtraFactory(factory.DjangoModelFactory):
         model = 'candidates.PersonExtra'
 
     base = factory.SubFactory(PersonFactory)
-    versions = '[]'
+
+    @factory.post_generation
+    def versions(self, create, extracted, **kwargs):
+        # Allow tests to pass in a version history as a JSON array
+        # (most recent version first) as they would have been stored
+        # before PersonVersion existed.
+        if create and extracted:
+            from candidates.models import PersonVersion
+            PersonVersion.objects.bulk_create_from_versions(
+                self.base, json.loads(extracted)
+            )
 
 
 class MembershipFactory(factory.DjangoModelFactory):
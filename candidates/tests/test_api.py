@@ -1,5 +1,9 @@
 from __future__ import unicode_literals
 
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django_webtest import WebTest
 
 from .factories import (
@@ -164,6 +168,46 @@ class TestAPI(UK2015ExamplesMixin, SettingsMixin, WebTest):
         self.assertEqual(persons['count'], len(persons['results']))
         self.assertEqual(persons['count'], 5)
 
+    def test_api_persons_queries_dont_depend_on_page_size(self):
+        # Everything serialized for each person is prefetched, including
+        # their versions, so the list needs no extra queries per person:
+        self.app.get('/api/v0.9/persons/?page_size=1')
+        with CaptureQueriesContext(connection) as one_person:
+            self.app.get('/api/v0.9/persons/?page_size=1')
+        with self.assertNumQueries(len(one_person)):
+            persons = self.app.get('/api/v0.9/persons/').json
+        self.assertEqual(len(persons['results']), 5)
+
+    def test_api_persons_cursor_pagination(self):
+        person_ids = []
+        url = '/api/v0.9/persons/?cursor=&page_size=2'
+        while url:
+            persons = self.app.get(url).json
+            self.assertNotIn('count', persons)
+            self.assertLessEqual(len(persons['results']), 2)
+            person_ids += [p['id'] for p in persons['results']]
+            url = persons['next']
+        self.assertEqual(person_ids, [818, 2009, 4322, 5163, 5795])
+
+    def test_api_persons_ndjson(self):
+        response = self.app.get('/api/v0.9/persons/ndjson/')
+        self.assertEqual(response.content_type, 'application/x-ndjson')
+        persons = [
+            json.loads(line) for line in response.text.splitlines()
+        ]
+        self.assertEqual(
+            [p['id'] for p in persons], [818, 2009, 4322, 5163, 5795])
+        # Each person should be serialized as they are elsewhere:
+        self.assertEqual(
+            persons[1], self.app.get('/api/v0.9/persons/2009/').json)
+
+    def test_api_elections_ndjson_filtered(self):
+        response = self.app.get('/api/v0.9/elections/ndjson/?current=True')
+        elections = [
+            json.loads(line) for line in response.text.splitlines()
+        ]
+        self.assertEqual([e['id'] for e in elections], ['2015'])
+
     def test_api_person(self):
         person_resp = self.app.get('/api/v0.9/persons/2009/')
 
@@ -343,3 +387,4 @@ class TestAPI(UK2015ExamplesMixin, SettingsMixin, WebTest):
             'Origin': b'http://example.com'}
         )
         self.assertFalse('Access-Control-Allow-Origin' in resp.headers)
+
@@ -0,0 +1,123 @@
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django_webtest import WebTest
+
+from candidates.models import LoggedAction
+
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .settings import SettingsMixin
+from .uk_examples import UK2015ExamplesMixin
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-api-cache',
+    },
+})
+class TestPersonAPICache(UK2015ExamplesMixin, SettingsMixin, WebTest):
+
+    def setUp(self):
+        super(TestPersonAPICache, self).setUp()
+        cache.clear()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell'
+        )
+        self.candidacy_extra = CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+        for person_id, name in (('4322', 'Helen Hayes'), ('818', 'Sheila Gilmore')):
+            person_extra = PersonExtraFactory.create(
+                base__id=person_id,
+                base__name=name,
+            )
+            CandidacyExtraFactory.create(
+                election=self.election,
+                base__person=person_extra.base,
+                base__post=self.dulwich_post_extra.base,
+                base__on_behalf_of=self.labour_party_extra.base
+            )
+
+    def tearDown(self):
+        cache.clear()
+        super(TestPersonAPICache, self).tearDown()
+
+    def get_person(self):
+        return self.app.get('/api/v0.9/persons/2009/').json
+
+    def test_cached_list_needs_fewer_queries(self):
+        with CaptureQueriesContext(connection) as uncached:
+            first = self.app.get('/api/v0.9/persons/').json
+        with CaptureQueriesContext(connection) as cached:
+            second = self.app.get('/api/v0.9/persons/').json
+        self.assertEqual(first, second)
+        self.assertEqual([p['id'] for p in second['results']], [818, 2009, 4322])
+        self.assertLess(len(cached), len(uncached))
+
+    def test_cached_data_shared_by_list_detail_and_ndjson(self):
+        listed = self.app.get('/api/v0.9/persons/').json['results'][1]
+        self.assertEqual(listed, self.get_person())
+        lines = self.app.get('/api/v0.9/persons/ndjson/').text.splitlines()
+        self.assertEqual(len(lines), 3)
+
+    def test_saving_person_updates(self):
+        self.get_person()
+        person = self.person_extra.base
+        person.name = 'Tessa Jowell-Mills'
+        person.save()
+        self.assertEqual(self.get_person()['name'], 'Tessa Jowell-Mills')
+
+    def test_logged_action_updates(self):
+        self.get_person()
+        # Changing a candidacy doesn't touch the person, but every
+        # edit is logged:
+        self.candidacy_extra.elected = True
+        self.candidacy_extra.save()
+        self.assertIsNone(self.get_person()['memberships'][0]['elected'])
+        LoggedAction.objects.create(
+            person=self.person_extra.base,
+            action_type='set-candidate-elected',
+        )
+        self.assertTrue(self.get_person()['memberships'][0]['elected'])
+
+    def test_related_objects_update(self):
+        self.get_person()
+        person = self.person_extra.base
+        person.identifiers.create(scheme='uk.org.publicwhip', identifier='1')
+        self.assertEqual(
+            [i['identifier'] for i in self.get_person()['identifiers']],
+            ['1']
+        )
+        person.contact_details.create(
+            contact_type='twitter', value='tessajowell')
+        self.assertEqual(
+            [c['value'] for c in self.get_person()['contact_details']],
+            ['tessajowell']
+        )
+        other_name = person.other_names.create(name='Baroness Jowell')
+        self.assertEqual(
+            [o['name'] for o in self.get_person()['other_names']],
+            ['Baroness Jowell']
+        )
+        other_name.delete()
+        self.assertEqual(self.get_person()['other_names'], [])
+
+    def test_renaming_party_updates(self):
+        self.get_person()
+        party = self.labour_party_extra.base
+        party.name = 'New Labour'
+        party.save()
+        self.assertEqual(
+            self.get_person()['memberships'][0]['on_behalf_of']['name'],
+            'New Labour'
+        )
+
+    def test_missing_person(self):
+        self.app.get('/api/v0.9/persons/1234/', status=404)
@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from django_webtest import WebTest
+
+from candidates.models import LoggedAction
+
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .settings import SettingsMixin
+from .uk_examples import UK2015ExamplesMixin
+
+
+class TestChangesAPI(UK2015ExamplesMixin, SettingsMixin, WebTest):
+
+    def setUp(self):
+        super(TestChangesAPI, self).setUp()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell'
+        )
+        CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+        self.an_hour_ago = timezone.now() - timedelta(hours=1)
+        self.person_update = self.log_action(
+            person=self.person_extra.base,
+            action_type='person-update',
+            popit_person_new_version='0123456789abcdef',
+        )
+        self.post_lock = self.log_action(
+            post=self.dulwich_post_extra.base,
+            action_type='constituency-lock',
+        )
+
+    def log_action(self, minutes_ago=30, **kwargs):
+        logged_action = LoggedAction.objects.create(source='Testing', **kwargs)
+        # Only changes that have had time to settle are listed:
+        LoggedAction.objects.filter(pk=logged_action.pk).update(
+            created=timezone.now() - timedelta(minutes=minutes_ago))
+        return LoggedAction.objects.get(pk=logged_action.pk)
+
+    def test_all_changes(self):
+        changes = self.app.get('/api/v0.9/changes/').json
+        self.assertEqual(
+            [c['action_type'] for c in changes['results']],
+            ['person-update', 'constituency-lock']
+        )
+        person_update, post_lock = changes['results']
+        self.assertEqual(person_update['person']['id'], 2009)
+        self.assertEqual(
+            person_update['person_new_version'], '0123456789abcdef')
+        self.assertIsNone(person_update['post'])
+        self.assertIsNone(person_update['elections'])
+        self.assertIsNone(post_lock['person'])
+        self.assertEqual(post_lock['post']['id'], '65808')
+        self.assertEqual(
+            sorted(e['id'] for e in post_lock['elections']), ['2010', '2015'])
+        self.assertEqual(changes['next_cursor'], post_lock['cursor'])
+
+    def test_changes_since(self):
+        first = self.app.get('/api/v0.9/changes/?limit=1').json
+        self.assertEqual(len(first['results']), 1)
+        second = self.app.get(first['next']).json
+        self.assertEqual(
+            [c['action_type'] for c in second['results']],
+            ['constituency-lock']
+        )
+        # Nothing's changed since then:
+        third = self.app.get(second['next']).json
+        self.assertEqual(third['results'], [])
+        self.assertEqual(third['next_cursor'], second['next_cursor'])
+        self.log_action(
+            minutes_ago=1,
+            person=self.person_extra.base,
+            action_type='person-update',
+        )
+        fourth = self.app.get(third['next']).json
+        self.assertEqual(len(fourth['results']), 1)
+
+    def test_ties_are_ordered_by_id(self):
+        LoggedAction.objects.update(created=self.an_hour_ago)
+        first = self.app.get('/api/v0.9/changes/?limit=1').json
+        self.assertEqual(
+            first['results'][0]['action_type'], 'person-update')
+        second = self.app.get(first['next']).json
+        self.assertEqual(
+            [c['action_type'] for c in second['results']],
+            ['constituency-lock']
+        )
+
+    def test_recent_changes_not_listed_yet(self):
+        LoggedAction.objects.create(source='Testing', action_type='recent')
+        changes = self.app.get('/api/v0.9/changes/').json
+        self.assertNotIn(
+            'recent', [c['action_type'] for c in changes['results']])
+
+    def test_settle_seconds_setting(self):
+        self.log_action(minutes_ago=2, action_type='two-minutes-ago')
+        with override_settings(CHANGES_FEED_SETTLE_SECONDS=180):
+            changes = self.app.get('/api/v0.9/changes/').json
+        self.assertNotIn(
+            'two-minutes-ago',
+            [c['action_type'] for c in changes['results']])
+        with override_settings(CHANGES_FEED_SETTLE_SECONDS=60):
+            changes = self.app.get('/api/v0.9/changes/').json
+        self.assertIn(
+            'two-minutes-ago',
+            [c['action_type'] for c in changes['results']])
+
+    def test_bad_cursor(self):
+        self.app.get('/api/v0.9/changes/?since=nonsense', status=400)
@@ -0,0 +1,146 @@
+from __future__ import unicode_literals
+
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from popolo.models import Membership, Person
+
+from candidates.bulk_import import BulkCandidacyImporter, BulkImportError
+from candidates.models import CandidacyListing, LoggedAction, PersonVersion
+
+from .auth import TestUserMixin
+from .uk_examples import UK2015ExamplesMixin
+
+
+class TestBulkCandidacyImporter(TestUserMixin, UK2015ExamplesMixin, TestCase):
+
+    def import_candidacies(self, rows, **kwargs):
+        importer = BulkCandidacyImporter(
+            source='Imported from a test', user=self.user, **kwargs)
+        for identifier, name, post_slug, party_slug in rows:
+            importer.add_candidacy(
+                election_slug='2015',
+                post_slug=post_slug,
+                party_slug=party_slug,
+                party_name='Unused',
+                identifier_scheme='test-import-id',
+                identifier=identifier,
+                name=name,
+            )
+        importer.finish()
+        return importer
+
+    def test_creates_candidacies(self):
+        self.import_candidacies([
+            ('1', 'Tessa Jowell', '65808', 'party:53'),
+            ('2', 'Harriet Harman', '65913', 'party:53'),
+        ])
+        person = Person.objects.get(
+            identifiers__scheme='test-import-id',
+            identifiers__identifier='1',
+        )
+        self.assertEqual(person.name, 'Tessa Jowell')
+        membership = Membership.objects.get(person=person)
+        self.assertEqual(membership.post, self.dulwich_post_extra.base)
+        self.assertEqual(membership.on_behalf_of, self.labour_party_extra.base)
+        self.assertEqual(membership.extra.election, self.election)
+        listing = CandidacyListing.objects.get(membership=membership)
+        self.assertEqual(listing.person_name, 'Tessa Jowell')
+        self.assertEqual(listing.party_name, 'Labour Party')
+        version = PersonVersion.objects.get(person=person).as_version()
+        self.assertEqual(version['data']['name'], 'Tessa Jowell')
+        self.assertEqual(
+            version['data']['standing_in']['2015']['post_id'], '65808')
+        self.assertEqual(version['username'], 'john')
+        action = LoggedAction.objects.get(person=person)
+        self.assertEqual(action.action_type, 'person-create')
+        self.assertEqual(action.user, self.user)
+        self.assertEqual(action.source, 'Imported from a test')
+        self.assertEqual(
+            action.popit_person_new_version, version['version_id'])
+
+    def test_reimport_updates(self):
+        self.import_candidacies([
+            ('1', 'Tessa Jowell', '65808', 'party:53'),
+        ])
+        self.import_candidacies([
+            ('1', 'Tessa Jowell-Mills', '65808', 'party:53'),
+        ])
+        person = Person.objects.get()
+        self.assertEqual(person.name, 'Tessa Jowell-Mills')
+        self.assertEqual(Membership.objects.count(), 1)
+        self.assertEqual(
+            CandidacyListing.objects.get().person_name, 'Tessa Jowell-Mills')
+        self.assertEqual(
+            list(LoggedAction.objects.order_by('id')
+                 .values_list('action_type', flat=True)),
+            ['person-create', 'person-update']
+        )
+        versions = PersonVersion.objects.filter(person=person).order_by('id')
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(
+            versions[1].as_version()['data']['name'], 'Tessa Jowell-Mills')
+
+    def test_logged_actions_stamped_when_finished(self):
+        importer = BulkCandidacyImporter(
+            source='Imported from a test', user=self.user)
+        importer.add_candidacy(
+            election_slug='2015',
+            post_slug='65808',
+            party_slug='party:53',
+            party_name='Unused',
+            identifier_scheme='test-import-id',
+            identifier='1',
+            name='Tessa Jowell',
+        )
+        importer.flush()
+        # This test runs in a transaction, so the actions are only
+        # stamped with the time they'll be committed by finish():
+        before_finish = timezone.now()
+        importer.finish()
+        self.assertGreaterEqual(
+            LoggedAction.objects.get().created, before_finish)
+
+    def test_new_party_added_to_party_set(self):
+        self.import_candidacies(
+            [('1', 'Tessa Jowell', '65808', 'party:new')],
+            party_set=self.gb_parties,
+        )
+        party = Membership.objects.get().on_behalf_of
+        self.assertEqual(party.extra.slug, 'party:new')
+        self.assertEqual(party.name, 'Unused')
+        self.assertIn(party, self.gb_parties.parties.all())
+
+    def test_unknown_post(self):
+        with self.assertRaises(BulkImportError):
+            self.import_candidacies([
+                ('1', 'Tessa Jowell', 'no-such-post', 'party:53'),
+            ])
+
+    @skipUnless(
+        connection.vendor == 'postgresql',
+        'New rows are only created in bulk on PostgreSQL'
+    )
+    def test_queries_dont_grow_with_candidacies(self):
+        # Import a row first so that caches like the content types
+        # are filled in:
+        self.import_candidacies([('0', 'Warm Up', '14419', 'party:52')])
+        parties = ['party:53', 'party:52', 'party:90']
+        posts = ['65808', '65913', '14420']
+
+        def rows(prefix, n):
+            return [
+                (prefix + str(i), 'Person {0}'.format(i),
+                 posts[i % 3], parties[i % 3])
+                for i in range(n)
+            ]
+
+        with CaptureQueriesContext(connection) as few:
+            self.import_candidacies(rows('a', 3))
+        with CaptureQueriesContext(connection) as many:
+            self.import_candidacies(rows('b', 30))
+        self.assertEqual(len(few), len(many))
@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from candidates.models import CandidacyListing
+
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .output import capture_output, split_output
+from .uk_examples import UK2015ExamplesMixin
+
+
+class TestCandidacyListing(UK2015ExamplesMixin, TestCase):
+
+    def setUp(self):
+        super(TestCandidacyListing, self).setUp()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell',
+            base__gender='female',
+        )
+        self.candidacy_extra = CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+
+    def get_listing(self):
+        return CandidacyListing.objects.get(
+            membership=self.candidacy_extra.base)
+
+    def test_listing_created(self):
+        listing = self.get_listing()
+        self.assertEqual(listing.election, self.election)
+        self.assertEqual(listing.post, self.dulwich_post_extra.base)
+        self.assertEqual(listing.person_name, 'Tessa Jowell')
+        self.assertEqual(listing.person_gender, 'female')
+        self.assertEqual(listing.party_slug, 'party:53')
+        self.assertEqual(listing.party_name, 'Labour Party')
+        self.assertIsNone(listing.elected)
+        self.assertTrue(listing.is_candidate_in(self.election))
+        self.assertFalse(listing.is_candidate_in(self.earlier_election))
+
+    def test_listing_follows_edits(self):
+        person = self.person_extra.base
+        person.name = 'Tessa Jowell-Mills'
+        person.save()
+        self.candidacy_extra.elected = True
+        self.candidacy_extra.save()
+        self.person_extra.not_standing.add(self.earlier_election)
+        listing = self.get_listing()
+        self.assertEqual(listing.person_name, 'Tessa Jowell-Mills')
+        self.assertTrue(listing.elected)
+        self.assertTrue(listing.is_not_standing_in(self.earlier_election))
+        self.assertFalse(listing.is_not_standing_in(self.election))
+
+    def test_listing_removed_with_candidacy(self):
+        self.candidacy_extra.base.delete()
+        self.assertFalse(CandidacyListing.objects.exists())
+
+    def test_rebuild_command(self):
+        expected = list(CandidacyListing.objects.values_list(
+            'membership_id', 'person_name', 'party_slug', 'elected'))
+        CandidacyListing.objects.all().delete()
+        with capture_output() as (out, err):
+            call_command('candidates_rebuild_candidacy_listings')
+        self.assertEqual(
+            split_output(out),
+            ['Finished: there are now 1 candidacy listings']
+        )
+        self.assertEqual(
+            list(CandidacyListing.objects.values_list(
+                'membership_id', 'person_name', 'party_slug', 'elected')),
+            expected
+        )
@@ -37,7 +37,7 @@ class ComplexFieldsTests(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebT
         self.person = Person.objects.create(
             name="John the Well-Described",
         )
-        self.person_extra = PersonExtra.objects.create(base=self.person, versions='[]')
+        self.person_extra = PersonExtra.objects.create(base=self.person)
         self.person_extra.update_complex_field(an_field, 'http://example.com/additional')
 
     def test_create_form_has_fields(self):
@@ -3,13 +3,17 @@
 from __future__ import unicode_literals
 
 from datetime import timedelta
+from io import open
 from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
 
 from django.conf import settings
+from django.core.management import call_command
 from django.test import TestCase
 
 from candidates.models import PersonExtra, ImageExtra
-from ..csv_helpers import list_to_csv
+from ..csv_helpers import SortedCSVFile, list_to_csv
 
 from . import factories
 from .auth import TestUserMixin
@@ -159,3 +163,87 @@ class CSVTests(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, TestCase):
             list_of_dicts = gb_person_extra.as_list_of_dicts(None)
             list_of_dicts += ni_person_extra.as_list_of_dicts(None)
         self.assertEqual(list_to_csv(list_of_dicts), example_output)
+
+    def test_csv_rows_fixed_number_of_queries(self):
+        # Load the site settings and content types, which are cached
+        # after the first time:
+        PersonExtra.objects.all().csv_rows(None)
+        # After that there's one query for the complex fields mapping
+        # and the rest are for the people and their related objects;
+        # this shouldn't depend on the number of people:
+        with self.assertNumQueries(13):
+            one_person_rows = PersonExtra.objects \
+                .filter(pk=self.gb_person_extra.id).csv_rows(None)
+        with self.assertNumQueries(13):
+            all_rows = PersonExtra.objects.all().csv_rows(None)
+        self.assertEqual(len(one_person_rows), 2)
+        self.assertEqual(len(all_rows), 4)
+        self.assertEqual(
+            list_to_csv(all_rows),
+            list_to_csv(self.get_all_list_of_dicts(None))
+        )
+
+    def get_all_list_of_dicts(self, election):
+        return [
+            d
+            for person_extra in PersonExtra.objects.joins_for_csv_output()
+            for d in person_extra.as_list_of_dicts(election)
+        ]
+
+    def test_sorted_csv_file_with_runs_matches_list_to_csv(self):
+        list_of_dicts = self.get_all_list_of_dicts(None)
+        temp_dir = mkdtemp()
+        try:
+            output_filename = join(temp_dir, 'output.csv')
+            sorted_csv_file = SortedCSVFile(
+                output_filename, False, temp_dir, run_size=1)
+            for d in reversed(list_of_dicts):
+                sorted_csv_file.add(d)
+            self.assertEqual(len(sorted_csv_file.run_filenames), 4)
+            sorted_csv_file.write()
+            with open(output_filename, encoding='utf-8', newline='') as f:
+                self.assertEqual(
+                    f.read(),
+                    list_to_csv(list_of_dicts)
+                )
+        finally:
+            rmtree(temp_dir)
+
+    def test_create_csv_command(self):
+        candidacy_extra = self.gb_person_extra.base.memberships.get(
+            extra__election=self.earlier_election
+        ).extra
+        candidacy_extra.elected = True
+        candidacy_extra.save()
+        temp_dir = mkdtemp()
+        try:
+            output_prefix = join(temp_dir, 'candidates')
+            call_command('candidates_create_csv', output_prefix)
+
+            def read_csv(suffix):
+                filename = output_prefix + suffix
+                with open(filename, encoding='utf-8', newline='') as f:
+                    return f.read()
+
+            self.assertEqual(
+                read_csv('-all.csv'),
+                list_to_csv(self.get_all_list_of_dicts(None))
+            )
+            all_2010 = self.get_all_list_of_dicts(self.earlier_election)
+            self.assertEqual(
+                read_csv('-2010.csv'),
+                list_to_csv(all_2010, group_by_post=True)
+            )
+            self.assertEqual(
+                read_csv('-elected-2010.csv'),
+                list_to_csv(
+                    [d for d in all_2010 if d['name'] == 'Tessa Jowell'],
+                    group_by_post=True
+                )
+            )
+            self.assertEqual(
+                read_csv('-elected-2015.csv'),
+                list_to_csv([], group_by_post=True)
+            )
+        finally:
+            rmtree(temp_dir)
@@ -46,7 +46,7 @@ class ExtraFieldTests(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest
         self.person = Person.objects.create(
             name="John the Well-Described"
         )
-        PersonExtra.objects.create(base=self.person, versions='[]')
+        PersonExtra.objects.create(base=self.person)
         # Now create values for those fields:
         PersonExtraFieldValue.objects.create(
             field=c_field,
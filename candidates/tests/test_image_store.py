@@ -0,0 +1,89 @@
+from __future__ import unicode_literals
+
+from os.path import dirname, join
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from candidates.management.images import get_file_md5sum
+from candidates.models import ContentAddressedStorage, ImageExtra, StoredImage
+from moderation_queue.models import QueuedImage
+
+from . import factories
+from .auth import TestUserMixin
+from .output import capture_output
+
+
+class TestImageStore(TestUserMixin, TestCase):
+
+    def setUp(self):
+        self.labour_extra = factories.PartyExtraFactory.create(
+            slug='party:53',
+            base__name='Labour Party',
+        )
+        self.image_filename = join(
+            dirname(__file__), '..', '..', 'moderation_queue', 'tests',
+            'example-image.jpg'
+        )
+        self.md5sum = get_file_md5sum(self.image_filename)
+
+    def create_image(self, ideal_relative_name):
+        return ImageExtra.objects.create_from_file(
+            self.image_filename,
+            ideal_relative_name,
+            base_kwargs={
+                'content_object': self.labour_extra,
+                'source': 'An example emblem',
+            },
+            extra_kwargs={'uploading_user': self.user},
+        )
+
+    def test_identical_images_stored_once(self):
+        first = self.create_image('images/emblem.jpg')
+        second = self.create_image('images/emblem-again.jpg')
+        self.assertEqual(first.base.image.name, second.base.image.name)
+        self.assertEqual(first.md5sum, self.md5sum)
+        stored_image = StoredImage.objects.get()
+        self.assertEqual(stored_image.md5sum, self.md5sum)
+        self.assertEqual(stored_image.reference_count, 2)
+        self.assertEqual(
+            stored_image.name,
+            'images/{0}/{1}/{2}.jpg'.format(
+                self.md5sum[:2], self.md5sum[2:4], self.md5sum),
+        )
+
+    def test_unreferenced_files_deleted(self):
+        first = self.create_image('images/emblem.jpg')
+        second = self.create_image('images/emblem-again.jpg')
+        name = first.base.image.name
+        storage = ContentAddressedStorage()
+        first.base.delete()
+        self.assertEqual(StoredImage.objects.get().reference_count, 1)
+        self.assertEqual(StoredImage.objects.delete_unreferenced(), 0)
+        second.base.delete()
+        self.assertEqual(StoredImage.objects.get().reference_count, 0)
+        self.assertTrue(storage.exists(name))
+        with capture_output():
+            call_command('candidates_update_image_store')
+        self.assertFalse(StoredImage.objects.exists())
+        self.assertFalse(storage.exists(name))
+
+    def test_queued_images_share_files(self):
+        person = factories.PersonExtraFactory.create(
+            base__id='2009', base__name='Tessa Jowell').base
+        with open(self.image_filename, 'rb') as f:
+            data = f.read()
+        queued_images = []
+        for i in range(2):
+            qi = QueuedImage(person=person, user=self.user)
+            qi.image.save('avatar.jpg', ContentFile(data), save=False)
+            qi.save()
+            queued_images.append(qi)
+        self.assertEqual(
+            queued_images[0].image.name, queued_images[1].image.name)
+        self.assertTrue(queued_images[0].image.name.startswith('queued-images/'))
+        stored_image = StoredImage.objects.get()
+        self.assertEqual(stored_image.reference_count, 2)
+        queued_images[0].delete()
+        self.assertEqual(StoredImage.objects.get().reference_count, 1)
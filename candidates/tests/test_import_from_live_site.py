@@ -0,0 +1,348 @@
+from __future__ import unicode_literals
+
+import json
+from os.path import exists, join
+import shutil
+from tempfile import mkdtemp
+from threading import Thread
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import TestCase
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib_parse import parse_qs, urlsplit
+
+from mock import patch
+from requests.exceptions import HTTPError
+
+from candidates.management.commands.candidates_import_from_live_site \
+    import Command
+from candidates.models import (
+    CandidacyListing, ImageExtra, PersonExtraFieldValue, PersonVersion
+)
+from elections.models import Election
+from popolo.models import Membership, Person, Post
+
+from .output import capture_output
+
+
+EXAMPLE_IMAGE_FILENAME = join(
+    settings.BASE_DIR, 'moderation_queue', 'tests', 'example-image.jpg'
+)
+
+
+def make_person(person_id, name):
+    return {
+        'id': person_id,
+        'url': '',
+        'name': name,
+        'other_names': [{'name': name.upper(), 'note': ''}],
+        'identifiers': [],
+        'honorific_prefix': '',
+        'honorific_suffix': '',
+        'sort_name': '',
+        'email': '',
+        'gender': 'female',
+        'birth_date': '1947',
+        'death_date': '',
+        'versions': [
+            {
+                'version_id': 'abcdef{0}'.format(person_id),
+                'timestamp': '2015-04-01T12:00:00.000000',
+                'information_source': 'Imported',
+                'username': 'john',
+                'data': {'id': str(person_id), 'name': name},
+            },
+        ],
+        'contact_details': [],
+        'links': [{'note': 'homepage', 'url': 'http://example.org/'}],
+        'extra_fields': [{'key': 'cv', 'value': 'http://example.org/cv'}],
+    }
+
+
+def make_membership(membership_id, person_id):
+    return {
+        'id': membership_id,
+        'url': '',
+        'label': '',
+        'role': 'Candidate',
+        'elected': None,
+        'party_list_position': None,
+        'person': {'id': person_id},
+        'organization': None,
+        'on_behalf_of': {'id': 'party:53'},
+        'post': {'id': '65808'},
+        'start_date': '',
+        'end_date': '',
+        'election': {'id': '2015'},
+    }
+
+
+API_DATA = {
+    'extra_fields': [
+        {'id': 1, 'url': '', 'key': 'cv', 'type': 'url', 'label': 'CV',
+         'order': 1},
+    ],
+    'simple_fields': [],
+    'complex_fields': [],
+    'area_types': [
+        {'id': 1, 'url': '', 'name': 'WMC', 'source': 'MaPit'},
+    ],
+    'party_sets': [
+        {'id': 1, 'url': '', 'name': 'Great Britain', 'slug': 'gb'},
+    ],
+    'organizations': [
+        {
+            'id': slug,
+            'url': '',
+            'name': name,
+            'other_names': [],
+            'identifiers': [],
+            'classification': classification,
+            'parent': None,
+            'founding_date': None,
+            'dissolution_date': None,
+            'contact_details': [],
+            'images': [],
+            'links': [],
+            'sources': [],
+            'register': '',
+            'party_sets': party_sets,
+        }
+        for slug, name, classification, party_sets in (
+            ('commons', 'House of Commons', 'Legislature', []),
+            ('party:53', 'Labour Party', 'Party', [{'slug': 'gb'}]),
+        )
+    ],
+    'areas': [
+        {
+            'id': 4,
+            'url': '',
+            'name': 'Dulwich and West Norwood',
+            'identifier': '65808',
+            'classification': 'WMC',
+            'other_identifiers': [
+                {'scheme': 'gss', 'identifier': 'E14000673'},
+            ],
+            'parent': None,
+            'type': {'id': 1},
+        },
+    ],
+    'elections': [
+        {
+            'id': '2015',
+            'url': '',
+            'name': '2015 General Election',
+            'for_post_role': 'Member of Parliament',
+            'winner_membership_role': None,
+            'candidate_membership_role': 'Candidate',
+            'election_date': '2015-05-07',
+            'current': True,
+            'use_for_candidate_suggestions': False,
+            'area_types': [{'id': 1}],
+            'area_generation': 22,
+            'organization': {'id': 'commons'},
+            'party_lists_in_use': False,
+            'default_party_list_members_to_show': 0,
+            'show_official_documents': True,
+            'ocd_division': '',
+            'description': '',
+        },
+    ],
+    'posts': [
+        {
+            'id': '65808',
+            'url': '',
+            'label': 'Member of Parliament for Dulwich and West Norwood',
+            'role': 'Member of Parliament',
+            'group': 'England',
+            'candidates_locked': False,
+            'party_set': {'id': 1},
+            'organization': {'id': 'commons'},
+            'area': {'id': 4},
+            'elections': [{'id': '2015'}],
+            'memberships': [],
+        },
+    ],
+    'post_elections': [
+        {
+            'id': 1,
+            'url': '',
+            'post': {'id': '65808'},
+            'election': {'id': '2015'},
+            'winner_count': 1,
+        },
+    ],
+    'persons': [
+        make_person(1, 'Tessa Jowell'),
+        make_person(2, 'Helen Hayes'),
+        make_person(3, 'Rosa Heyday'),
+    ],
+    'memberships': [
+        make_membership(11, 1),
+        make_membership(12, 2),
+        make_membership(13, 3),
+    ],
+    'images': [
+        {
+            'id': 1,
+            'url': '',
+            'source': 'Found on their website',
+            'is_primary': True,
+            'md5sum': 'e3f95d3e7a3f6f6e8e3b4e1d5bd3f1a2',
+            'copyright': 'example-license',
+            'uploading_user': None,
+            'user_notes': '',
+            'user_copyright': '',
+            'notes': '',
+            'image_url': '/media/images/tessa.jpg',
+            'content_object': 'http://localhost/api/v0.9/persons/1/',
+        },
+    ],
+}
+
+
+class StandInAPIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves API_DATA in pages, like the API of a live site"""
+
+    def do_GET(self):
+        split_url = urlsplit(self.path)
+        self.server.requested_paths.append(split_url.path)
+        if split_url.path == '/media/images/tessa.jpg':
+            with open(EXAMPLE_IMAGE_FILENAME, 'rb') as f:
+                return self.send_body(f.read(), 'image/jpeg')
+        endpoint = split_url.path.split('/')[3]
+        query = parse_qs(split_url.query)
+        page = int(query['page'][0])
+        page_size = int(query['page_size'][0])
+        if (endpoint, page) in self.server.failing_pages:
+            return self.send_error(500)
+        results = API_DATA[endpoint]
+        if page > 1 and (page - 1) * page_size >= len(results):
+            return self.send_error(404)
+        has_next = page * page_size < len(results)
+        self.send_body(json.dumps({
+            'count': len(results),
+            'next': self.path if has_next else None,
+            'results': results[(page - 1) * page_size:page * page_size],
+        }).encode('utf-8'), 'application/json')
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInAPIServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestImportFromLiveSite(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestImportFromLiveSite, cls).tearDownClass()
+        # The import resets the sequences of the tables it imported
+        # into, which isn't undone when the test's transaction is
+        # rolled back, so set them back to match what's left:
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), Command.sequence_reset_models()
+            ):
+                cursor.execute(sql)
+
+    def setUp(self):
+        self.server = StandInAPIServer(('127.0.0.1', 0), StandInAPIHandler)
+        self.server.requested_paths = []
+        self.server.failing_pages = set()
+        Thread(target=self.server.serve_forever).start()
+        self.site_url = 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+        self.directory = mkdtemp()
+        self.checkpoint_filename = join(self.directory, 'checkpoint.json')
+        cache_patcher = patch(
+            'candidates.management.commands.candidates_import_from_live_site.CACHE_DIRECTORY',
+            join(self.directory, 'cache')
+        )
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def run_import(self, **kwargs):
+        with capture_output():
+            call_command(
+                'candidates_import_from_live_site',
+                self.site_url,
+                page_size=2,
+                workers=3,
+                checkpoint_file=self.checkpoint_filename,
+                **kwargs
+            )
+
+    def assert_everything_imported(self):
+        self.assertEqual(Election.objects.get().slug, '2015')
+        self.assertEqual(Post.objects.get().extra.slug, '65808')
+        self.assertEqual(
+            sorted(Person.objects.values_list('id', 'name')),
+            [(1, 'Tessa Jowell'), (2, 'Helen Hayes'), (3, 'Rosa Heyday')]
+        )
+        tessa = Person.objects.get(pk=1)
+        self.assertEqual(tessa.start_date, '1947')
+        self.assertEqual(tessa.other_names.get().name, 'TESSA JOWELL')
+        self.assertEqual(tessa.links.get().url, 'http://example.org/')
+        self.assertEqual(
+            PersonVersion.objects.get(person=tessa).version_id, 'abcdef1')
+        self.assertEqual(
+            PersonExtraFieldValue.objects.get(person=tessa).value,
+            'http://example.org/cv'
+        )
+        self.assertEqual(
+            sorted(Membership.objects.values_list('id', 'person_id')),
+            [(11, 1), (12, 2), (13, 3)]
+        )
+        self.assertEqual(
+            sorted(CandidacyListing.objects.values_list(
+                'person_name', flat=True)),
+            ['Helen Hayes', 'Rosa Heyday', 'Tessa Jowell']
+        )
+        image_extra = ImageExtra.objects.get()
+        self.assertEqual(image_extra.base.object_id, tessa.extra.id)
+        self.assertTrue(image_extra.base.is_primary)
+
+    def test_import(self):
+        self.run_import()
+        self.assert_everything_imported()
+        self.assertFalse(exists(self.checkpoint_filename))
+
+    def test_resume_without_checkpoint(self):
+        with self.assertRaises(CommandError):
+            self.run_import(resume=True)
+        self.assertEqual(self.server.requested_paths, [])
+
+    def test_resume_after_failure(self):
+        self.server.failing_pages.add(('memberships', 2))
+        with self.assertRaises(HTTPError):
+            self.run_import()
+        # The first page of memberships was imported before the
+        # failure:
+        self.assertEqual(
+            list(Membership.objects.values_list('id', flat=True)), [11, 12])
+        self.assertTrue(exists(self.checkpoint_filename))
+        self.server.failing_pages.clear()
+        self.server.requested_paths = []
+        self.run_import(resume=True)
+        self.assert_everything_imported()
+        self.assertNotIn('/api/v0.9/persons/', self.server.requested_paths)
+        self.assertEqual(
+            self.server.requested_paths.count('/api/v0.9/memberships/'), 1)
@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from popolo.models import Person
+
+from candidates.models import PersonExtra
+from candidates.utils import keyset_iterator
+
+from . import factories
+from .uk_examples import UK2015ExamplesMixin
+
+
+class TestKeysetIterator(UK2015ExamplesMixin, TestCase):
+
+    def setUp(self):
+        super(TestKeysetIterator, self).setUp()
+        for person_id, name in (
+                (5, 'Bob Smith'),
+                (2, 'Alice Jones'),
+                (7, 'Alice Jones'),
+                (3, 'Carol Brown'),
+                (9, 'Dave Evans'),
+        ):
+            factories.PersonExtraFactory.create(
+                base__id=person_id,
+                base__name=name,
+            )
+
+    def test_primary_key_order_in_chunks(self):
+        # Two queries for the full chunks, one for the partial chunk:
+        with self.assertNumQueries(3):
+            person_ids = [
+                p.id for p in keyset_iterator(Person.objects.all(), 2)
+            ]
+        self.assertEqual(person_ids, [2, 3, 5, 7, 9])
+
+    def test_exact_multiple_of_chunk_size(self):
+        with self.assertNumQueries(2):
+            person_ids = [
+                p.id for p in
+                keyset_iterator(Person.objects.exclude(pk=9), 4)
+            ]
+        self.assertEqual(person_ids, [2, 3, 5, 7])
+
+    def test_order_by_field_with_ties(self):
+        people = keyset_iterator(Person.objects.all(), 1, order_by='name')
+        self.assertEqual(
+            [(p.name, p.id) for p in people],
+            [
+                ('Alice Jones', 2),
+                ('Alice Jones', 7),
+                ('Bob Smith', 5),
+                ('Carol Brown', 3),
+                ('Dave Evans', 9),
+            ]
+        )
+
+    def test_distinct(self):
+        person = Person.objects.get(pk=5)
+        for election, post_extra, party_extra in (
+                (self.election, self.dulwich_post_extra,
+                 self.labour_party_extra),
+                (self.earlier_election, self.camberwell_post_extra,
+                 self.green_party_extra),
+        ):
+            factories.CandidacyExtraFactory.create(
+                election=election,
+                base__person=person,
+                base__post=post_extra.base,
+                base__on_behalf_of=party_extra.base,
+            )
+        qs = PersonExtra.objects.filter(
+            base__memberships__role='Candidate'
+        )
+        self.assertEqual(
+            [pe.base_id for pe in keyset_iterator(qs, 10)],
+            [5, 5]
+        )
+        self.assertEqual(
+            [pe.base_id for pe in keyset_iterator(qs, 10, distinct=True)],
+            [5]
+        )
@@ -0,0 +1,190 @@
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.test.utils import override_settings
+from django_webtest import WebTest
+
+from candidates.models import LoggedAction, LoggedActionUpdate
+
+from .auth import TestUserMixin
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .settings import SettingsMixin
+from .uk_examples import UK2015ExamplesMixin
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-last-changed',
+    },
+})
+class TestConditionalGet(
+        TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest):
+
+    person_url = '/person/2009/tessa-jowell'
+    post_url = '/election/2015/post/65808/dulwich-and-west-norwood'
+
+    def setUp(self):
+        super(TestConditionalGet, self).setUp()
+        cache.clear()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell'
+        )
+        CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+
+    def tearDown(self):
+        cache.clear()
+        super(TestConditionalGet, self).tearDown()
+
+    def assert_not_modified(self, url, response):
+        self.app.get(
+            url,
+            headers={'If-None-Match': str(response.headers['ETag'])},
+            status=304,
+        )
+        self.app.get(
+            url,
+            headers={
+                'If-Modified-Since': str(response.headers['Last-Modified'])
+            },
+            status=304,
+        )
+
+    def assert_modified(self, url, response):
+        new_response = self.app.get(
+            url,
+            headers={'If-None-Match': str(response.headers['ETag'])},
+            status=200,
+        )
+        self.assertNotEqual(
+            new_response.headers['ETag'], response.headers['ETag'])
+
+    def log_action(self, **kwargs):
+        LoggedAction.objects.create(
+            user=self.user,
+            action_type='person-update',
+            source='Just testing',
+            **kwargs
+        )
+        LoggedActionUpdate.objects.process()
+
+    def test_person_page(self):
+        response = self.app.get(self.person_url)
+        self.assert_not_modified(self.person_url, response)
+        self.log_action(person=self.person_extra.base)
+        self.assert_modified(self.person_url, response)
+
+    def test_person_page_recorded_version(self):
+        response = self.app.get(self.person_url)
+        self.person_extra.record_version({
+            'information_source': 'Just testing',
+            'timestamp': '2015-05-08T01:52:27.061038',
+            'version_id': '0000000000000001',
+        })
+        self.assert_modified(self.person_url, response)
+
+    def test_person_page_logged_in(self):
+        response = self.app.get(self.person_url, user=self.user)
+        self.assertNotIn('ETag', response.headers)
+
+    def test_post_page(self):
+        response = self.app.get(self.post_url)
+        self.assert_not_modified(self.post_url, response)
+        # An edit to someone standing for the post changes it:
+        self.log_action(person=self.person_extra.base)
+        self.assert_modified(self.post_url, response)
+
+    def test_post_page_candidacy_added(self):
+        response = self.app.get(self.post_url)
+        helen_hayes = PersonExtraFactory.create(
+            base__id='4322', base__name='Helen Hayes')
+        CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=helen_hayes.base,
+            base__post=self.camberwell_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+        # The action is logged before the candidacy is created, so the
+        # post must be marked as changed after that's committed:
+        self.app.get(self.post_url, user=self.user)
+        self.app.post(
+            '/election/2015/candidacy',
+            {
+                'person_id': helen_hayes.base.id,
+                'post_id': '65808',
+                'source': 'Just testing',
+                'csrfmiddlewaretoken': self.app.cookies['csrftoken'],
+            },
+            user=self.user,
+            status=302,
+        )
+        self.assertFalse(LoggedActionUpdate.objects.exists())
+        self.app.reset()
+        self.assert_modified(self.post_url, response)
+
+    def test_post_page_winner_retracted(self):
+        candidacy_extra = self.person_extra.base.memberships.get().extra
+        candidacy_extra.elected = True
+        candidacy_extra.save()
+        response = self.app.get(self.post_url)
+        self.app.get(self.post_url, user=self.user_who_can_record_results)
+        self.app.post(
+            '/election/2015/post/65808/retract-winner',
+            {'csrfmiddlewaretoken': self.app.cookies['csrftoken']},
+            user=self.user_who_can_record_results,
+            status=302,
+        )
+        self.app.reset()
+        self.assert_modified(self.post_url, response)
+
+    def test_renaming_party_changes_every_page(self):
+        person_response = self.app.get(self.person_url)
+        post_response = self.app.get(self.post_url)
+        party = self.labour_party_extra.base
+        party.name = 'New Labour'
+        party.save()
+        self.assert_modified(self.person_url, person_response)
+        self.assert_modified(self.post_url, post_response)
+
+    def test_api_person(self):
+        url = '/api/v0.9/persons/2009/'
+        response = self.app.get(url)
+        self.assert_not_modified(url, response)
+        self.log_action(person=self.person_extra.base)
+        self.assert_modified(url, response)
+
+    def test_api_format_has_own_etag(self):
+        url = '/api/v0.9/persons/2009/'
+        json_response = self.app.get(url + '?format=json')
+        api_response = self.app.get(url + '?format=api')
+        self.assertNotEqual(
+            json_response.headers['ETag'], api_response.headers['ETag'])
+
+    def test_api_person_list(self):
+        url = '/api/v0.9/persons/'
+        response = self.app.get(url)
+        self.assert_not_modified(url, response)
+        PersonExtraFactory.create(base__id='4322', base__name='Helen Hayes')
+        self.assert_modified(url, response)
+
+    def test_api_post(self):
+        url = '/api/v0.9/posts/65808/'
+        response = self.app.get(url)
+        self.assert_not_modified(url, response)
+        self.log_action(person=self.person_extra.base)
+        self.assert_modified(url, response)
+
+    def test_no_validators_without_cache(self):
+        with self.settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+            },
+        }):
+            response = self.app.get(self.person_url)
+        self.assertNotIn('ETag', response.headers)
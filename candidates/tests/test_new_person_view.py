@@ -1,7 +1,5 @@
 from __future__ import unicode_literals
 
-import json
-
 from django.utils.six.moves.urllib_parse import urlsplit
 
 from django_webtest import WebTest
@@ -109,9 +107,7 @@ class TestNewPersonView(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTe
         self.assertEqual(links.count(), 1)
         self.assertEqual(links[0].url, 'http://en.wikipedia.org/wiki/Lizzie_Bennet')
 
-        self.assertNotEqual(person.extra.versions, '[]')
-
-        versions = json.loads(person.extra.versions)
+        versions = person.extra.versions
         self.assertEqual(len(versions), 1)
         self.assertEqual(versions[0]['information_source'],
                          'Testing adding a new person to a post')
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from popolo.models import OtherName, Person
+
+from candidates.models import PersonSearchDocument, PersonSearchUpdate
+from candidates.models.person_search import get_words
+
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .output import capture_output, split_output
+from .uk_examples import UK2015ExamplesMixin
+
+
+class TestPersonSearch(UK2015ExamplesMixin, TestCase):
+
+    def setUp(self):
+        super(TestPersonSearch, self).setUp()
+        for person_id, name, party_extra in (
+                ('2009', 'Tessa Jowell', self.labour_party_extra),
+                ('2010', 'Sigourney Wéaver-Smith', self.green_party_extra),
+                ('2011', "Charlotte O'Lucas", self.ld_party_extra),
+                ('2012', 'Elizabeth Bennet', self.conservative_party_extra),
+        ):
+            person_extra = PersonExtraFactory.create(
+                base__id=person_id,
+                base__name=name,
+            )
+            CandidacyExtraFactory.create(
+                election=self.election,
+                base__person=person_extra.base,
+                base__post=self.dulwich_post_extra.base,
+                base__on_behalf_of=party_extra.base,
+            )
+
+    def assert_found(self, query, *names):
+        PersonSearchUpdate.objects.process()
+        self.assertEqual(
+            [
+                Person.objects.get(pk=person_id).name for person_id
+                in PersonSearchDocument.objects.search(query)
+            ],
+            list(names),
+        )
+
+    def test_get_words(self):
+        self.assertEqual(
+            get_words("Seán O'Brien-Łukasz"),
+            ['sean', 'obrien', 'lukasz'],
+        )
+
+    def test_full_name(self):
+        self.assert_found('Tessa Jowell', 'Tessa Jowell')
+
+    def test_partial_name(self):
+        self.assert_found('jow', 'Tessa Jowell')
+        self.assert_found('Eliz', 'Elizabeth Bennet')
+
+    def test_typo(self):
+        self.assert_found('Tessa Jowel', 'Tessa Jowell')
+        self.assert_found('Elizabeht Bennet', 'Elizabeth Bennet')
+
+    def test_accents(self):
+        self.assert_found('weaver', 'Sigourney Wéaver-Smith')
+        self.assert_found('WÉAVER SMITH', 'Sigourney Wéaver-Smith')
+
+    def test_apostrophe(self):
+        self.assert_found("O'Lucas", "Charlotte O'Lucas")
+        self.assert_found('olucas', "Charlotte O'Lucas")
+
+    def test_no_match(self):
+        self.assert_found('Darcy')
+        self.assert_found('')
+        self.assert_found("'-")
+
+    def test_every_word_must_match(self):
+        self.assert_found('Tessa Bennet')
+
+    def test_party(self):
+        self.assert_found('Green', 'Sigourney Wéaver-Smith')
+        self.assert_found('Tessa Labour', 'Tessa Jowell')
+
+    def test_name_ranked_above_party(self):
+        person_extra = PersonExtraFactory.create(
+            base__id='2013',
+            base__name='Alice Green',
+        )
+        CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base,
+        )
+        self.assert_found('Green', 'Alice Green', 'Sigourney Wéaver-Smith')
+
+    def test_renamed_person(self):
+        person = Person.objects.get(pk=2012)
+        person.name = 'Lizzie Bennet'
+        person.save()
+        self.assert_found('Elizabeth')
+        self.assert_found('Lizzie', 'Lizzie Bennet')
+
+    def test_other_name(self):
+        OtherName.objects.create(
+            content_type=ContentType.objects.get_for_model(Person),
+            object_id=2009,
+            name='Baroness Jowell of Brixton',
+        )
+        self.assert_found('brixton', 'Tessa Jowell')
+
+    def test_renamed_party(self):
+        party = self.green_party_extra.base
+        party.name = 'Ecology Party'
+        party.save()
+        self.assert_found('Ecology', 'Sigourney Wéaver-Smith')
+        self.assert_found('Green')
+
+    def test_removed_candidacy(self):
+        Person.objects.get(pk=2009).memberships.all().delete()
+        self.assert_found('Tessa Labour')
+        self.assert_found('Tessa', 'Tessa Jowell')
+
+    def test_updates_are_queued(self):
+        PersonSearchUpdate.objects.process()
+        self.assertEqual(
+            PersonSearchUpdate.objects.get_lag(), timedelta(0))
+        person = Person.objects.get(pk=2012)
+        person.name = 'Lizzie Bennet'
+        person.save()
+        person.extra.save()
+        self.assertEqual(
+            PersonSearchDocument.objects.get(person=person).name,
+            'Elizabeth Bennet'
+        )
+        PersonSearchUpdate.objects.update(
+            queued=timezone.now() - timedelta(seconds=90))
+        self.assertGreaterEqual(
+            PersonSearchUpdate.objects.get_lag(), timedelta(seconds=90))
+        self.assertEqual(PersonSearchUpdate.objects.process(), 1)
+        self.assertEqual(
+            PersonSearchDocument.objects.get(person=person).name,
+            'Lizzie Bennet'
+        )
+        self.assertFalse(PersonSearchUpdate.objects.exists())
+
+    def test_process_only_some_people(self):
+        for person in Person.objects.all():
+            person.save()
+        self.assertEqual(PersonSearchUpdate.objects.process([2009]), 1)
+        self.assertEqual(
+            sorted(PersonSearchUpdate.objects.values_list(
+                'person_id', flat=True).distinct()),
+            [2010, 2011, 2012]
+        )
+
+    def test_update_command(self):
+        Person.objects.get(pk=2009).save()
+        PersonSearchUpdate.objects.update(
+            queued=timezone.now() - timedelta(seconds=90))
+        with capture_output() as (out, err):
+            call_command('candidates_update_person_search_index', lag=True)
+        self.assertGreaterEqual(int(split_output(out)[0]), 90)
+        self.assertTrue(PersonSearchUpdate.objects.exists())
+        call_command('candidates_update_person_search_index', verbosity=0)
+        self.assertFalse(PersonSearchUpdate.objects.exists())
+
+    def test_rebuild_command(self):
+        PersonSearchUpdate.objects.all().delete()
+        PersonSearchDocument.objects.all().delete()
+        self.assert_found('Tessa')
+        call_command('candidates_rebuild_person_search_index', verbosity=0)
+        self.assertEqual(PersonSearchDocument.objects.count(), 4)
+        self.assert_found('Tessa', 'Tessa Jowell')
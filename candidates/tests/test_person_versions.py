@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from candidates.diffs import get_version_diffs
+from candidates.models import PersonExtra, PersonVersion
+
+from .output import capture_output, split_output
+from . import factories
+
+
+def make_version(version_id, timestamp, name):
+    return {
+        'information_source': 'Made up for tests',
+        'timestamp': timestamp,
+        'username': 'test',
+        'version_id': version_id,
+        'data': {
+            'id': '1234',
+            'name': name,
+        },
+    }
+
+
+class TestPersonVersions(TestCase):
+
+    def setUp(self):
+        self.person_extra = factories.PersonExtraFactory.create(
+            base__id='1234',
+            base__name='Sarah Jones',
+        )
+        self.older_version = make_version(
+            '2f07734529a83242', '2015-03-10T05:35:15.297559', 'Sarah Jone')
+        self.newer_version = make_version(
+            '3fc494d54f61a157', '2015-05-08T01:52:27.061038', 'Sarah Jones')
+
+    def test_record_version_adds_a_row(self):
+        self.person_extra.record_version({
+            'information_source': 'Testing recording a version',
+            'timestamp': '2015-05-08T01:52:27.061038',
+            'version_id': '0123456789abcdef',
+        })
+        person_version = PersonVersion.objects.get()
+        self.assertEqual(person_version.person_id, 1234)
+        self.assertEqual(person_version.version_id, '0123456789abcdef')
+        version = self.person_extra.versions[0]
+        self.assertEqual(
+            version['information_source'], 'Testing recording a version')
+        self.assertEqual(version['data']['name'], 'Sarah Jones')
+
+    def test_versions_most_recent_first(self):
+        PersonVersion.objects.bulk_create_from_versions(
+            self.person_extra.base, [self.newer_version, self.older_version]
+        )
+        self.assertEqual(
+            self.person_extra.versions,
+            [self.newer_version, self.older_version]
+        )
+        self.assertEqual(
+            self.person_extra.get_version('2f07734529a83242'),
+            self.older_version
+        )
+
+    def test_backfill_command(self):
+        PersonExtra.objects.filter(pk=self.person_extra.pk).update(
+            legacy_versions=json.dumps(
+                [self.newer_version, self.older_version]
+            )
+        )
+        with capture_output() as (out, err):
+            call_command('candidates_backfill_person_versions', batch_size=1)
+        self.assertEqual(
+            split_output(out),
+            ['Finished: moved the versions of 1 people']
+        )
+        self.assertEqual(
+            self.person_extra.versions,
+            [self.newer_version, self.older_version]
+        )
+        self.assertEqual(
+            PersonExtra.objects.get(pk=self.person_extra.pk).legacy_versions,
+            ''
+        )
+        # Running it again should have nothing left to do:
+        with capture_output() as (out, err):
+            call_command('candidates_backfill_person_versions')
+        self.assertEqual(PersonVersion.objects.count(), 2)
+
+    def test_record_version_stores_diffs(self):
+        for version_id, timestamp in (
+                ('0000000000000001', '2015-05-08T01:52:27.061038'),
+                ('0000000000000002', '2015-05-09T01:52:27.061038'),
+        ):
+            self.person_extra.record_version({
+                'information_source': 'Testing recording a version',
+                'timestamp': timestamp,
+                'version_id': version_id,
+            })
+            person = self.person_extra.base
+            person.name = 'Sarah Smith'
+            person.save()
+        newest, oldest = PersonVersion.objects.all()
+        self.assertEqual(
+            json.loads(newest.diffs)[0]['parent_version_id'],
+            '0000000000000001'
+        )
+        self.assertEqual(
+            json.loads(oldest.diffs)[0]['parent_version_id'],
+            None
+        )
+        self.assertEqual(
+            self.person_extra.version_diffs,
+            get_version_diffs(self.person_extra.versions)
+        )
+        self.assertEqual(
+            self.person_extra.version_diffs[0]['diffs'][0]['parent_diff'],
+            [{
+                'op': 'replace',
+                'path': 'name',
+                'previous_value': 'Sarah Jones',
+                'value': 'Sarah Smith',
+            }]
+        )
+
+    def test_backfill_version_diffs_command(self):
+        PersonVersion.objects.bulk_create_from_versions(
+            self.person_extra.base, [self.newer_version, self.older_version]
+        )
+        expected_version_diffs = self.person_extra.version_diffs
+        PersonVersion.objects.update(diffs='')
+        with capture_output() as (out, err):
+            call_command('candidates_backfill_version_diffs')
+        self.assertEqual(
+            split_output(out),
+            ['Finished: stored the version diffs of 1 people']
+        )
+        self.assertFalse(PersonVersion.objects.filter(diffs='').exists())
+        self.assertEqual(
+            self.person_extra.version_diffs,
+            expected_version_diffs
+        )
@@ -0,0 +1,139 @@
+from __future__ import unicode_literals
+
+from django.core.cache import cache
+from django.test.utils import override_settings
+from django_webtest import WebTest
+
+from .auth import TestUserMixin
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .settings import SettingsMixin
+from .uk_examples import UK2015ExamplesMixin
+
+from ..models import CandidacyListing
+from ..post_cache import (
+    get_keys_invalidated_in_thread, get_post_cache_version,
+    invalidate_post_caches_again
+)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-post-cache',
+    },
+})
+class TestPostCache(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest):
+
+    post_url = '/election/2015/post/65808/dulwich-and-west-norwood'
+
+    def setUp(self):
+        super(TestPostCache, self).setUp()
+        cache.clear()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell'
+        )
+        self.candidacy_extra = CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+
+    def tearDown(self):
+        cache.clear()
+        super(TestPostCache, self).tearDown()
+
+    def get_version(self):
+        return get_post_cache_version(self.dulwich_post_extra.base.id)
+
+    def test_candidate_list_is_cached(self):
+        response = self.app.get(self.post_url)
+        response.mustcontain('Tessa Jowell')
+        # Changing the listing without going through the model
+        # methods doesn't invalidate the cache, so shouldn't show up:
+        CandidacyListing.objects.filter(person_id='2009') \
+            .update(person_name='Someone Else')
+        response = self.app.get(self.post_url)
+        response.mustcontain('Tessa Jowell', no=['Someone Else'])
+
+    def test_cached_list_shared_with_logged_in_users(self):
+        self.app.get(self.post_url)
+        CandidacyListing.objects.filter(person_id='2009') \
+            .update(person_name='Someone Else')
+        response = self.app.get(self.post_url, user=self.user_who_can_lock)
+        response.mustcontain('Tessa Jowell', no=['Someone Else'])
+        # ... but the parts for that user are still shown:
+        response.mustcontain('Lock candidate list')
+
+    def test_renaming_person_invalidates(self):
+        self.app.get(self.post_url)
+        version = self.get_version()
+        person = self.person_extra.base
+        person.name = 'Tessa Jowell-Mills'
+        person.save()
+        self.assertNotEqual(self.get_version(), version)
+        response = self.app.get(self.post_url)
+        response.mustcontain('Tessa Jowell-Mills')
+
+    def test_recording_winner_invalidates(self):
+        self.app.get(self.post_url)
+        version = self.get_version()
+        self.candidacy_extra.elected = True
+        self.candidacy_extra.save()
+        self.assertNotEqual(self.get_version(), version)
+        response = self.app.get(self.post_url)
+        response.mustcontain('<div class="candidates__elected">')
+
+    def test_locking_invalidates(self):
+        version = self.get_version()
+        self.dulwich_post_extra.candidates_locked = True
+        self.dulwich_post_extra.save()
+        self.assertNotEqual(self.get_version(), version)
+
+    def test_moving_candidacy_invalidates_both_posts(self):
+        camberwell_version = get_post_cache_version(
+            self.camberwell_post_extra.base.id)
+        version = self.get_version()
+        membership = self.candidacy_extra.base
+        membership.post = self.camberwell_post_extra.base
+        membership.save()
+        self.assertNotEqual(self.get_version(), version)
+        self.assertNotEqual(
+            get_post_cache_version(self.camberwell_post_extra.base.id),
+            camberwell_version
+        )
+        response = self.app.get(self.post_url)
+        response.mustcontain(no=['Tessa Jowell'])
+
+    def test_invalidated_again_after_commit(self):
+        version = self.get_version()
+        person = self.person_extra.base
+        person.name = 'Tessa Jowell-Mills'
+        person.save()
+        # A list cached by another request before this change committed
+        # would be stored under this version:
+        changed_version = self.get_version()
+        self.assertNotEqual(changed_version, version)
+        invalidate_post_caches_again()
+        self.assertNotEqual(self.get_version(), changed_version)
+        # Each change is only invalidated again once:
+        again_version = self.get_version()
+        invalidate_post_caches_again()
+        self.assertEqual(self.get_version(), again_version)
+
+    def test_edit_in_request_invalidated_again(self):
+        self.app.get(self.post_url, user=self.user)
+        self.app.post(
+            '/election/2015/candidacy/delete',
+            {
+                'person_id': '2009',
+                'post_id': '65808',
+                'source': 'Just testing',
+                'csrfmiddlewaretoken': self.app.cookies['csrftoken'],
+            },
+            user=self.user,
+            status=302,
+        )
+        # The versions were replaced again at the end of the request:
+        self.assertFalse(get_keys_invalidated_in_thread())
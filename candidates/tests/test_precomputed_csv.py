@@ -0,0 +1,198 @@
+from __future__ import unicode_literals
+
+from os import listdir
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from django.test.utils import override_settings
+from django_webtest import WebTest
+
+from .auth import TestUserMixin
+from .factories import CandidacyExtraFactory, PersonExtraFactory
+from .settings import SettingsMixin
+from .uk_examples import UK2015ExamplesMixin
+
+from ..models import LoggedAction, LoggedActionUpdate
+from ..precomputed_csv import get_election_csv, save_csv
+
+
+class TestPrecomputedCSV(
+        TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest):
+
+    post_csv_url = '/election/2015/post/65808/dulwich-and-west-norwood.csv'
+
+    def setUp(self):
+        super(TestPrecomputedCSV, self).setUp()
+        self.media_root = mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            PRECOMPUTED_CSV_ENABLED=True,
+        )
+        self.settings_override.enable()
+        self.person_extra = PersonExtraFactory.create(
+            base__id='2009',
+            base__name='Tessa Jowell'
+        )
+        self.candidacy = CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=self.person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        ).base
+        other_person_extra = PersonExtraFactory.create(
+            base__id='4322',
+            base__name='Helen Hayes'
+        )
+        CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=other_person_extra.base,
+            base__post=self.camberwell_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        rmtree(self.media_root)
+        super(TestPrecomputedCSV, self).tearDown()
+
+    def log_action(self):
+        LoggedAction.objects.create(
+            user=self.user,
+            person=self.person_extra.base,
+            action_type='person-update',
+            source='Just testing',
+        )
+        # Outside a request, the queue is processed by a command:
+        LoggedActionUpdate.objects.process()
+
+    def rename_person(self, name):
+        person = self.person_extra.base
+        person.name = name
+        person.save()
+
+    def test_post_csv_is_served_from_storage(self):
+        response = self.app.get(self.post_csv_url)
+        self.assertIn('Tessa Jowell', response.body.decode('utf-8'))
+        # Without an edit being logged, the stored CSV is still used:
+        self.rename_person('Tessa Jowell-Mills')
+        response = self.app.get(self.post_csv_url)
+        self.assertNotIn('Tessa Jowell-Mills', response.body.decode('utf-8'))
+        # ... and once one is logged, it's regenerated:
+        self.log_action()
+        response = self.app.get(self.post_csv_url)
+        self.assertIn('Tessa Jowell-Mills', response.body.decode('utf-8'))
+
+    def test_post_csv_filename_uses_post_label(self):
+        expected = 'attachment; filename="2015-dulwich-and-west-norwood.csv"'
+        other_url = '/election/2015/post/65808/anything.csv'
+        # Both when the CSV is generated and when it's read from storage:
+        for url in (other_url, other_url, self.post_csv_url):
+            response = self.app.get(url)
+            self.assertEqual(response.headers['Content-Disposition'], expected)
+
+    def test_save_csv_replaces_file(self):
+        save_csv('candidates-csv/2015/posts/65808.csv', 'old')
+        save_csv('candidates-csv/2015/posts/65808.csv', 'new')
+        directory = join(self.media_root, 'candidates-csv', '2015', 'posts')
+        # No temporary files are left behind:
+        self.assertEqual(listdir(directory), ['65808.csv'])
+        with open(join(directory, '65808.csv')) as f:
+            self.assertEqual(f.read(), 'new')
+
+    def test_post_csv_conditional_get(self):
+        response = self.app.get(self.post_csv_url)
+        response = self.app.get(self.post_csv_url)
+        self.assertTrue(response.headers['Last-Modified'])
+        response = self.app.get(
+            self.post_csv_url,
+            headers={'If-None-Match': str(response.headers['ETag'])},
+            status=304,
+        )
+        self.assertEqual(response.body, b'')
+
+    def test_moved_candidacy_updates_previous_post(self):
+        self.person_extra.record_version({
+            'information_source': 'Standing in Dulwich',
+            'timestamp': '2015-05-08T01:52:27.061038',
+            'version_id': '0000000000000001',
+        })
+        self.log_action()
+        response = self.app.get(self.post_csv_url)
+        self.assertIn('Tessa Jowell', response.body.decode('utf-8'))
+        self.candidacy.post = self.camberwell_post_extra.base
+        self.candidacy.save()
+        self.person_extra.record_version({
+            'information_source': 'Moved to Camberwell',
+            'timestamp': '2015-05-09T01:52:27.061038',
+            'version_id': '0000000000000002',
+        })
+        self.log_action()
+        response = self.app.get(self.post_csv_url)
+        self.assertNotIn('Tessa Jowell', response.body.decode('utf-8'))
+
+    def test_election_csv(self):
+        expected_csv = get_election_csv(self.election)
+        self.assertIn('Helen Hayes', expected_csv)
+        response = self.app.get('/election/2015/candidates.csv')
+        self.assertEqual(response.body.decode('utf-8'), expected_csv)
+        self.rename_person('Tessa Jowell-Mills')
+        self.log_action()
+        response = self.app.get('/election/2015/candidates.csv')
+        self.assertEqual(
+            response.body.decode('utf-8'),
+            get_election_csv(self.election)
+        )
+        self.assertIn('Tessa Jowell-Mills', response.body.decode('utf-8'))
+
+    def post_candidacy_form(self, url, person_id, post_id):
+        self.app.get(
+            '/election/2015/post/65808/dulwich-and-west-norwood',
+            user=self.user,
+        )
+        response = self.app.post(
+            url,
+            {
+                'person_id': person_id,
+                'post_id': post_id,
+                'source': 'Just testing',
+                'csrfmiddlewaretoken': self.app.cookies['csrftoken'],
+            },
+            user=self.user,
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_candidacy_views_update_post_csv(self):
+        response = self.app.get(self.post_csv_url)
+        self.assertNotIn('Helen Hayes', response.body.decode('utf-8'))
+        # The actions are logged before the candidacies are changed,
+        # so the CSV must be regenerated after that's committed:
+        self.post_candidacy_form('/election/2015/candidacy', '4322', '65808')
+        self.assertFalse(LoggedActionUpdate.objects.exists())
+        response = self.app.get(self.post_csv_url)
+        self.assertIn('Helen Hayes', response.body.decode('utf-8'))
+        self.post_candidacy_form(
+            '/election/2015/candidacy/delete', '4322', '65808')
+        response = self.app.get(self.post_csv_url)
+        self.assertNotIn('Helen Hayes', response.body.decode('utf-8'))
+
+    def get_elected_column(self):
+        header, row = self.app.get(self.post_csv_url).body.decode('utf-8') \
+            .splitlines()
+        return dict(zip(header.split(','), row.split(',')))['elected']
+
+    def test_retracting_winner_updates_post_csv(self):
+        self.candidacy.extra.elected = True
+        self.candidacy.extra.save()
+        self.assertEqual(self.get_elected_column(), 'True')
+        self.app.get(
+            '/election/2015/post/65808/dulwich-and-west-norwood',
+            user=self.user_who_can_record_results,
+        )
+        self.app.post(
+            '/election/2015/post/65808/retract-winner',
+            {'csrfmiddlewaretoken': self.app.cookies['csrftoken']},
+            user=self.user_who_can_record_results,
+            status=302,
+        )
+        self.assertEqual(self.get_elected_column(), '')
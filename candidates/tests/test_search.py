@@ -14,7 +14,7 @@ class TestSearchView(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, WebTest)
 
     def setUp(self):
         super(TestSearchView, self).setUp()
-        call_command('rebuild_index', verbosity=0, interactive=False)
+        call_command('candidates_rebuild_person_search_index', verbosity=0)
 
     def test_search_page(self):
         # we have to create the candidate by submitting the form as otherwise
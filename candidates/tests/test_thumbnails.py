@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+
+from mock import call, patch
+from os.path import dirname, join
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from sorl.thumbnail.models import KVStore
+
+from candidates.models import ImageExtra
+from candidates.thumbnails import THUMBNAIL_SIZES
+
+from . import factories
+from .auth import TestUserMixin
+from .output import capture_output
+
+
+class TestThumbnails(TestUserMixin, TestCase):
+
+    def setUp(self):
+        self.labour_extra = factories.PartyExtraFactory.create(
+            slug='party:53',
+            base__name='Labour Party',
+        )
+        self.image_filename = join(
+            dirname(__file__), '..', '..', 'moderation_queue', 'tests',
+            'example-image.jpg'
+        )
+
+    def create_image(self):
+        return ImageExtra.objects.create_from_file(
+            self.image_filename,
+            'images/emblem.jpg',
+            base_kwargs={
+                'content_object': self.labour_extra,
+                'source': 'An example emblem',
+            },
+            extra_kwargs={'uploading_user': self.user},
+        )
+
+    def get_stored_image_keys(self):
+        # The source image and each thumbnail have one of these:
+        return KVStore.objects.filter(key__startswith='sorl-thumbnail||image||')
+
+    @patch('candidates.thumbnails.get_thumbnail')
+    def test_thumbnails_made_on_import(self, mock_get_thumbnail):
+        image_extra = self.create_image()
+        self.assertEqual(
+            mock_get_thumbnail.mock_calls,
+            [
+                call(image_extra.base.image, geometry_string, **options)
+                for geometry_string, options in THUMBNAIL_SIZES
+            ]
+        )
+
+    def test_command_makes_missing_thumbnails(self):
+        self.create_image()
+        self.assertEqual(
+            self.get_stored_image_keys().count(), len(THUMBNAIL_SIZES) + 1)
+        KVStore.objects.all().delete()
+        with capture_output():
+            call_command('candidates_generate_thumbnails')
+        self.assertEqual(
+            self.get_stored_image_keys().count(), len(THUMBNAIL_SIZES) + 1)
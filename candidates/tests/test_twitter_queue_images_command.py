@@ -1,12 +1,16 @@
 from __future__ import print_function, unicode_literals
 
-from mock import Mock, call, patch
+from mock import Mock, patch
 from os.path import dirname, join
 import re
+import threading
+from time import sleep
 
 from django.core.management import call_command
 from django.test import TestCase
 
+import requests
+
 from candidates.models import ImageExtra
 from moderation_queue.models import QueuedImage
 from .auth import TestUserMixin
@@ -14,6 +18,14 @@ from .factories import PersonExtraFactory
 from .output import capture_output, split_output
 
 
+def get_requested_urls(mock_requests):
+    # The images are downloaded concurrently, so the order they're
+    # requested in isn't fixed:
+    return sorted(
+        c[1][0] for c in mock_requests.Session.return_value.get.mock_calls
+    )
+
+
 @patch('candidates.management.commands.candidates_add_twitter_images_to_queue.requests')
 @patch('candidates.management.commands.candidates_add_twitter_images_to_queue.TwitterAPIData')
 class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
@@ -121,7 +133,7 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             '1006': 'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
         }
 
-        mock_requests.get.return_value = \
+        mock_requests.Session.return_value.get.return_value = \
             Mock(content=self.example_image_binary_data, status_code=200)
 
         call_command('candidates_add_twitter_images_to_queue')
@@ -130,10 +142,10 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             id__in=self.existing_queued_image_ids)
 
         self.assertEqual(
-            mock_requests.get.mock_calls,
+            get_requested_urls(mock_requests),
             [
-                call('https://pbs.twimg.com/profile_images/mno/xyzzy.jpg'),
-                call('https://pbs.twimg.com/profile_images/abc/foo.jpg'),
+                'https://pbs.twimg.com/profile_images/abc/foo.jpg',
+                'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
             ]
         )
 
@@ -160,7 +172,7 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             '1006': 'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
         }
 
-        mock_requests.get.return_value = \
+        mock_requests.Session.return_value.get.return_value = \
             Mock(content=self.example_image_binary_data, status_code=200)
 
         with capture_output() as (out, err):
@@ -192,9 +204,9 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             id__in=self.existing_queued_image_ids)
 
         self.assertEqual(
-            mock_requests.get.mock_calls,
+            get_requested_urls(mock_requests),
             [
-                call('https://pbs.twimg.com/profile_images/mno/xyzzy.jpg'),
+                'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
             ]
         )
 
@@ -222,7 +234,7 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             else:
                 return Mock(content=self.example_image_binary_data, status_code=200)
 
-        mock_requests.get.side_effect = fake_get
+        mock_requests.Session.return_value.get.side_effect = fake_get
 
         call_command('candidates_add_twitter_images_to_queue')
 
@@ -230,10 +242,10 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             id__in=self.existing_queued_image_ids)
 
         self.assertEqual(
-            mock_requests.get.mock_calls,
+            get_requested_urls(mock_requests),
             [
-                call('https://pbs.twimg.com/profile_images/mno/xyzzy.jpg'),
-                call('https://pbs.twimg.com/profile_images/abc/foo.jpg'),
+                'https://pbs.twimg.com/profile_images/abc/foo.jpg',
+                'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
             ]
         )
 
@@ -263,7 +275,7 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             else:
                 return Mock(content=self.example_image_binary_data, status_code=200)
 
-        mock_requests.get.side_effect = fake_get
+        mock_requests.Session.return_value.get.side_effect = fake_get
 
         with capture_output() as (out, err):
             call_command('candidates_add_twitter_images_to_queue')
@@ -276,10 +288,10 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
             id__in=self.existing_queued_image_ids)
 
         self.assertEqual(
-            mock_requests.get.mock_calls,
+            get_requested_urls(mock_requests),
             [
-                call('https://pbs.twimg.com/profile_images/mno/xyzzy.jpg'),
-                call('https://pbs.twimg.com/profile_images/abc/foo.jpg'),
+                'https://pbs.twimg.com/profile_images/abc/foo.jpg',
+                'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
             ]
         )
 
@@ -291,3 +303,90 @@ class TestTwitterImageQueueCommand(TestUserMixin, TestCase):
         self.assertEqual(
             newly_enqueued.justification_for_use,
             'Auto imported from Twitter: https://twitter.com/intent/user?user_id=1006')
+
+    def test_failed_download_skipped(self, mock_twitter_data, mock_requests):
+
+        mock_twitter_data.return_value.user_id_to_photo_url = {
+            '1001': 'https://pbs.twimg.com/profile_images/abc/foo.jpg',
+            '1006': 'https://pbs.twimg.com/profile_images/mno/xyzzy.jpg',
+        }
+
+        def fake_get(url, *args, **kwargs):
+            if url == 'https://pbs.twimg.com/profile_images/abc/foo.jpg':
+                raise requests.exceptions.ConnectionError('Connection reset')
+            return Mock(content=self.example_image_binary_data, status_code=200)
+
+        mock_requests.Session.return_value.get.side_effect = fake_get
+
+        with capture_output() as (out, err):
+            call_command('candidates_add_twitter_images_to_queue')
+
+        self.assertEqual(
+            split_output(out),
+            [
+                'WARNING: Failed to download '
+                'https://pbs.twimg.com/profile_images/abc/foo.jpg: '
+                'Connection reset',
+            ]
+        )
+        # Every download is made with a timeout:
+        for c in mock_requests.Session.return_value.get.mock_calls:
+            self.assertTrue(c[2]['timeout'])
+
+        new_queued_images = QueuedImage.objects.exclude(
+            id__in=self.existing_queued_image_ids)
+        self.assertEqual(new_queued_images.count(), 1)
+        self.assertEqual(
+            new_queued_images.get().person,
+            self.p_existing_image_but_none_in_queue
+        )
+
+    def test_per_host_limit(self, mock_twitter_data, mock_requests):
+        user_id_to_photo_url = {}
+        for i in range(8):
+            person = PersonExtraFactory.create(
+                base__id=str(100 + i),
+                base__name='Another Person {0}'.format(i)).base
+            user_id = str(2000 + i)
+            person.identifiers.create(identifier=user_id, scheme='twitter')
+            user_id_to_photo_url[user_id] = \
+                'https://host{0}.example.com/{1}.jpg'.format(i % 2, user_id)
+        mock_twitter_data.return_value.user_id_to_photo_url = \
+            user_id_to_photo_url
+
+        lock = threading.Lock()
+        in_progress = {}
+        most_in_progress = {}
+
+        def fake_get(url, *args, **kwargs):
+            host = url.split('/')[2]
+            with lock:
+                in_progress[host] = in_progress.get(host, 0) + 1
+                most_in_progress[host] = max(
+                    most_in_progress.get(host, 0), in_progress[host])
+            sleep(0.02)
+            with lock:
+                in_progress[host] -= 1
+            return Mock(content=self.example_image_binary_data, status_code=200)
+
+        mock_requests.Session.return_value.get.side_effect = fake_get
+
+        call_command(
+            'candidates_add_twitter_images_to_queue',
+            workers=8,
+            per_host=1,
+        )
+
+        self.assertEqual(
+            most_in_progress,
+            {'host0.example.com': 1, 'host1.example.com': 1}
+        )
+        self.assertEqual(
+            get_requested_urls(mock_requests),
+            sorted(user_id_to_photo_url.values())
+        )
+        self.assertEqual(
+            QueuedImage.objects.exclude(
+                id__in=self.existing_queued_image_ids).count(),
+            8
+        )
@@ -2,8 +2,6 @@
 
 from __future__ import unicode_literals
 
-import json
-
 from django.utils.six.moves.urllib_parse import urlsplit
 
 from django_webtest import WebTest
@@ -137,7 +135,7 @@ class TestUpdatePersonView(TestUserMixin, SettingsMixin, UK2015ExamplesMixin, We
 
         person = Person.objects.get(id='2009')
         self.assertEqual(person.birth_date, '1875-04-01')
-        versions_data = json.loads(person.extra.versions)
+        versions_data = person.extra.versions
         self.assertEqual(
             versions_data[0]['data']['extra_fields'],
             {
@@ -0,0 +1,32 @@
+# Thumbnails of images are made by sorl-thumbnail, which names each
+# one after its source file, size and options. Since the image store
+# names source files after their contents, a thumbnail's URL never
+# needs to change, so they can be cached for as long as you like.
+
+from __future__ import unicode_literals
+
+from sorl.thumbnail import get_thumbnail
+
+
+# The sizes (and options) of thumbnails that the templates and the API
+# ask for. These must match those exactly for the thumbnails made in
+# advance to be used:
+THUMBNAIL_SIZES = (
+    # Lists of candidates and search results:
+    ('x64', {}),
+    # Person pages and the forms for editing people:
+    ('x80', {}),
+    # Party emblems on party and person pages:
+    ('240', {}),
+    # The 'thumbnail' of people in the API:
+    ('300x300', {'crop': 'center'}),
+)
+
+
+def generate_thumbnails(image_file):
+    """Make (if they don't already exist) every thumbnail of an image
+
+    image_file may be an ImageFieldFile or the name of a file in the
+    default storage."""
+    for geometry_string, options in THUMBNAIL_SIZES:
+        get_thumbnail(image_file, geometry_string, **options)
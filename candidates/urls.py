@@ -23,6 +23,7 @@ api_router.register(r'images', views.ImageViewSet)
 api_router.register(r'post_elections', views.PostExtraElectionViewSet)
 api_router.register(r'memberships', views.MembershipViewSet)
 api_router.register(r'logged_actions', views.LoggedActionViewSet)
+api_router.register(r'changes', views.ChangesViewSet, base_name='change')
 api_router.register(r'extra_fields', views.ExtraFieldViewSet)
 api_router.register(r'simple_fields', views.SimplePopoloFieldViewSet)
 api_router.register(r'complex_fields', views.ComplexPopoloFieldViewSet)
@@ -70,6 +71,11 @@ patterns_to_format = [
         'view': views.ConstituencyRetractWinnerView.as_view(),
         'name': 'retract-winner'
     },
+    {
+        'pattern': r'^election/{election}/candidates.csv$',
+        'view': views.ElectionCSVView.as_view(),
+        'name': 'election_csv'
+    },
     {
         'pattern': r'^election/{election}/post/{post}/(?P<ignored_slug>.*).csv$',
         'view': views.ConstituencyDetailCSVView.as_view(),
@@ -2,6 +2,8 @@ from __future__ import unicode_literals
 
 import unicodedata
 
+from django.db.models import Q
+
 from compat import bytes_to_unicode
 
 # From http://stackoverflow.com/a/517974/223092
@@ -10,3 +12,43 @@ def strip_accents(s):
         c for c in unicodedata.normalize('NFKD', bytes_to_unicode(s))
         if not unicodedata.combining(c)
     )
+
+
+def keyset_iterator(qs, chunk_size=1000, distinct=False, order_by=None):
+    """Iterate over all the objects in qs, in primary key order
+
+    The objects are fetched chunk_size at a time. Each chunk is found
+    with a "pk > (the last primary key seen)" condition rather than an
+    OFFSET, so the database doesn't have to step over all the earlier
+    rows again for every chunk. Any select_related or prefetch_related
+    on qs is applied to each chunk.
+
+    To iterate in the order of some other field of the model instead,
+    pass its name as order_by; the primary key is then used to break
+    ties. That field mustn't be nullable.
+
+    If the queryset filters through a multi-valued relation (e.g. a
+    person's memberships) it may return the same object more than
+    once; pass distinct=True to avoid that."""
+    if order_by:
+        qs = qs.order_by(order_by, 'pk')
+    else:
+        qs = qs.order_by('pk')
+    if distinct:
+        qs = qs.distinct()
+    chunk_qs = qs
+    while True:
+        chunk = list(chunk_qs[:chunk_size])
+        for o in chunk:
+            yield o
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+        if order_by:
+            last_value = getattr(last, order_by)
+            chunk_qs = qs.filter(
+                Q(**{order_by + '__gt': last_value}) |
+                Q(**{order_by: last_value, 'pk__gt': last.pk})
+            )
+        else:
+            chunk_qs = qs.filter(pk__gt=last.pk)
@@ -7,12 +7,20 @@ import sys
 from datetime import date, timedelta
 
 import django
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Count, Prefetch
-from django.http import HttpResponse
+from django.db.models import Count, Prefetch, Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition
 from django.views.generic import View
 
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 
 from images.models import Image
 from candidates import serializers
@@ -23,7 +31,13 @@ from rest_framework import pagination, viewsets
 
 from compat import text_type
 
+from ..api_cache import get_serialized_people
 from ..election_specific import fetch_area_ids
+from ..last_changed import (
+    get_all_people_last_changed, get_all_posts_last_changed,
+    get_person_last_changed, get_post_last_changed, make_etag
+)
+from ..utils import keyset_iterator
 
 
 class UpcomingElectionsView(View):
@@ -159,13 +173,143 @@ class PostIDToPartySetView(View):
 
 # Now the django-rest-framework based API views:
 
+class CursorResultsSetPagination(pagination.CursorPagination):
+    """Pagination by a cursor that holds the last primary key seen
+
+    Unlike page numbers, this doesn't need the results to be counted
+    or the earlier ones skipped over, so later pages of a long list
+    are just as quick to fetch as the first."""
+
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'pk'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        # An empty cursor asks for the first page:
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super(CursorResultsSetPagination, self).decode_cursor(request)
+
+
 class ResultsSetPagination(pagination.PageNumberPagination):
+    """Page number pagination, or cursor pagination if asked for
+
+    If there's a 'cursor' query parameter (which should be empty for
+    the first page) the results are paginated with
+    CursorResultsSetPagination instead, and the next and previous
+    links in the response include the cursor to use."""
+
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 200
 
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = CursorResultsSetPagination.cursor_query_param
+        if cursor_query_param not in request.query_params:
+            return super(ResultsSetPagination, self).paginate_queryset(
+                queryset, request, view
+            )
+        self.cursor_pagination = CursorResultsSetPagination()
+        page = self.cursor_pagination.paginate_queryset(
+            queryset, request, view
+        )
+        self.display_page_controls = \
+            self.cursor_pagination.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super(ResultsSetPagination, self).get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_pagination:
+            return self.cursor_pagination.to_html()
+        return super(ResultsSetPagination, self).to_html()
+
+
+class NDJSONMixin(object):
+    """Add an 'ndjson' endpoint that streams every object in the viewset
+
+    The response has one object per line, serialized as it would be
+    in the paginated results, and is generated while it's being sent,
+    fetching the objects ndjson_chunk_size at a time, so that clients
+    can fetch all the objects in one request without the server
+    holding them all in memory."""
+
+    ndjson_chunk_size = 200
+
+    def serialize_objects(self, objects):
+        return self.get_serializer(objects, many=True).data
+
+    @list_route(methods=['get'])
+    def ndjson(self, request, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        renderer = JSONRenderer()
+
+        def lines():
+            chunk = []
+            for o in keyset_iterator(queryset, self.ndjson_chunk_size):
+                chunk.append(o)
+                if len(chunk) == self.ndjson_chunk_size:
+                    for data in self.serialize_objects(chunk):
+                        yield renderer.render(data) + b'\n'
+                    chunk = []
+            for data in self.serialize_objects(chunk):
+                yield renderer.render(data) + b'\n'
+
+        return StreamingHttpResponse(
+            lines(), content_type='application/x-ndjson; charset=utf-8'
+        )
 
-class PersonViewSet(viewsets.ModelViewSet):
+
+class LastChangedMixin(object):
+    """Send ETag and Last-Modified headers for lists and single objects
+
+    These are based on the timestamp returned by get_last_changed(),
+    which is found before the action's handler is called, so that
+    requests with a matching If-None-Match or If-Modified-Since header
+    get a 304 Not Modified response without the objects being fetched
+    or serialized.  The browsable API shows logged-in users their
+    username, so they never get a 304."""
+
+    conditional_actions = ('list', 'retrieve', 'ndjson')
+
+    def get_last_changed(self):
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super(LastChangedMixin, self).initial(request, *args, **kwargs)
+        method = request.method.lower()
+        if self.action not in self.conditional_actions or \
+                method not in ('get', 'head'):
+            return
+        last_changed = None
+        if not request.user.is_authenticated():
+            last_changed = self.get_last_changed()
+        etag = make_etag(last_changed, request.accepted_renderer.format)
+        # The handler for the request is looked up after this, so
+        # replace it with one that checks the request's validators
+        # first:
+        setattr(self, method, condition(
+            etag_func=lambda *a, **kw: etag,
+            last_modified_func=lambda *a, **kw: last_changed,
+        )(getattr(self, method)))
+
+
+class PersonViewSet(LastChangedMixin, NDJSONMixin, viewsets.ModelViewSet):
     queryset = Person.objects \
         .select_related('extra') \
         .prefetch_related(
@@ -185,13 +329,57 @@ class PersonViewSet(viewsets.ModelViewSet):
             'contact_details',
             'links',
             'identifiers',
+            Prefetch('person_versions'),
+            Prefetch(
+                'extra_field_values',
+                extra_models.PersonExtraFieldValue.objects \
+                    .select_related('field')
+            ),
         ) \
         .order_by('id')
     serializer_class = serializers.PersonSerializer
     pagination_class = ResultsSetPagination
 
+    # The people in a list (or a single person) are found with this
+    # queryset, and then their serialized data is taken from the cache
+    # where possible, so that only those who aren't cached need to be
+    # fetched with everything that's serialized:
+    people_to_serialize_queryset = Person.objects \
+        .only('id', 'updated_at') \
+        .order_by('id')
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'ndjson'):
+            return self.people_to_serialize_queryset
+        return super(PersonViewSet, self).get_queryset()
+
+    def get_last_changed(self):
+        if self.action != 'retrieve':
+            return get_all_people_last_changed()
+        try:
+            return get_person_last_changed(int(self.kwargs['pk']))
+        except ValueError:
+            return None
+
+    def serialize_objects(self, people):
+        def serialize(person_ids):
+            return self.get_serializer(
+                self.queryset.filter(pk__in=person_ids), many=True
+            ).data
+        # The data includes URLs, so depends on the scheme, host and
+        # API version:
+        base_url = reverse('api-root', request=self.request)
+        return get_serialized_people(people, base_url, serialize)
 
-class OrganizationViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.serialize_objects(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.serialize_objects([self.get_object()])[0])
+
+
+class OrganizationViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.OrganizationExtra.objects \
         .select_related('base') \
         .prefetch_related(
@@ -211,7 +399,7 @@ class OrganizationViewSet(viewsets.ModelViewSet):
     pagination_class = ResultsSetPagination
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(LastChangedMixin, NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.PostExtra.objects \
         .select_related(
             'base__organization__extra',
@@ -238,8 +426,13 @@ class PostViewSet(viewsets.ModelViewSet):
     serializer_class = serializers.PostExtraSerializer
     pagination_class = ResultsSetPagination
 
+    def get_last_changed(self):
+        if self.action == 'retrieve':
+            return get_post_last_changed(self.kwargs['slug'])
+        return get_all_posts_last_changed()
+
 
-class AreaViewSet(viewsets.ModelViewSet):
+class AreaViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = Area.objects \
         .prefetch_related('extra') \
         .order_by('id')
@@ -247,13 +440,13 @@ class AreaViewSet(viewsets.ModelViewSet):
     pagination_class = ResultsSetPagination
 
 
-class AreaTypeViewSet(viewsets.ModelViewSet):
+class AreaTypeViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = AreaType.objects.order_by('id')
     serializer_class = serializers.AreaTypeSerializer
     pagination_class = ResultsSetPagination
 
 
-class ElectionViewSet(viewsets.ModelViewSet):
+class ElectionViewSet(NDJSONMixin, viewsets.ModelViewSet):
     lookup_value_regex="(?!\.json$)[^/]+"
     queryset = Election.objects.order_by('id')
     lookup_field = 'slug'
@@ -262,19 +455,19 @@ class ElectionViewSet(viewsets.ModelViewSet):
     pagination_class = ResultsSetPagination
 
 
-class PartySetViewSet(viewsets.ModelViewSet):
+class PartySetViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.PartySet.objects.order_by('id')
     serializer_class = serializers.PartySetSerializer
     pagination_class = ResultsSetPagination
 
 
-class ImageViewSet(viewsets.ModelViewSet):
+class ImageViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = Image.objects.order_by('id')
     serializer_class = serializers.ImageSerializer
     pagination_class = ResultsSetPagination
 
 
-class PostExtraElectionViewSet(viewsets.ModelViewSet):
+class PostExtraElectionViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.PostExtraElection.objects \
         .select_related('election', 'postextra') \
         .order_by('id')
@@ -282,36 +475,99 @@ class PostExtraElectionViewSet(viewsets.ModelViewSet):
     pagination_class = ResultsSetPagination
 
 
-class MembershipViewSet(viewsets.ModelViewSet):
+class MembershipViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = Membership.objects.order_by('id')
     serializer_class = serializers.MembershipSerializer
     pagination_class = ResultsSetPagination
 
 
-class LoggedActionViewSet(viewsets.ModelViewSet):
+class LoggedActionViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.LoggedAction.objects.order_by('id')
     serializer_class = serializers.LoggedActionSerializer
     pagination_class = ResultsSetPagination
 
 
-class ExtraFieldViewSet(viewsets.ModelViewSet):
+class ChangesViewSet(viewsets.GenericViewSet):
+    """The changes to people and posts, in the order they were logged
+
+    Each change has a 'cursor'; requesting the list with the 'since'
+    parameter set to one of those returns the changes after it, so a
+    client that has a copy of the data can poll this with the last
+    cursor it saw and just fetch the people and posts that changed.
+    Each response has at most 'limit' changes, found with a range scan
+    of the index on (created, id).
+
+    An action's creation time is when it was inserted, not when its
+    transaction committed, so a transaction that's still in progress
+    could commit an action with an earlier creation time than one
+    that's already listed, which clients that have moved past it would
+    miss.  To make that unlikely, changes from the last
+    CHANGES_FEED_SETTLE_SECONDS (a setting) aren't listed yet.  This
+    is only a heuristic: it should be longer than the transactions
+    that log actions take, which is why BulkCandidacyImporter stamps
+    the actions it creates just before they're committed."""
+
+    queryset = extra_models.LoggedAction.objects \
+        .select_related('person', 'post__extra') \
+        .prefetch_related('post__extra__elections') \
+        .order_by('created', 'id')
+    serializer_class = serializers.ChangeSerializer
+    default_limit = 100
+    max_limit = 1000
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', ''))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset().filter(
+            created__lte=timezone.now() - timedelta(
+                seconds=settings.CHANGES_FEED_SETTLE_SECONDS)
+        )
+        since = request.query_params.get('since')
+        if since:
+            try:
+                created, logged_action_id = \
+                    serializers.parse_change_cursor(since)
+            except ValueError:
+                raise ValidationError(
+                    {'since': ['This must be a cursor from the feed.']})
+            queryset = queryset.filter(created__gte=created).filter(
+                Q(created__gt=created) | Q(id__gt=logged_action_id))
+        changes = list(queryset[:self.get_limit()])
+        if changes:
+            next_cursor = serializers.get_change_cursor(changes[-1])
+        else:
+            next_cursor = since or ''
+        return Response({
+            'next_cursor': next_cursor,
+            'next': replace_query_param(
+                request.build_absolute_uri(), 'since', next_cursor),
+            'results': self.get_serializer(changes, many=True).data,
+        })
+
+
+class ExtraFieldViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.ExtraField.objects.order_by('id')
     serializer_class = serializers.ExtraFieldSerializer
     pagination_class = ResultsSetPagination
 
 
-class SimplePopoloFieldViewSet(viewsets.ModelViewSet):
+class SimplePopoloFieldViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.SimplePopoloField.objects.order_by('id')
     serializer_class = serializers.SimplePopoloFieldSerializer
     pagination_class = ResultsSetPagination
 
 
-class ComplexPopoloFieldViewSet(viewsets.ModelViewSet):
+class ComplexPopoloFieldViewSet(NDJSONMixin, viewsets.ModelViewSet):
     queryset = extra_models.ComplexPopoloField.objects.order_by('id')
     serializer_class = serializers.ComplexPopoloFieldSerializer
     pagination_class = ResultsSetPagination
 
-class PersonRedirectViewSet(viewsets.ReadOnlyModelViewSet):
+class PersonRedirectViewSet(NDJSONMixin, viewsets.ReadOnlyModelViewSet):
     queryset = extra_models.PersonRedirect.objects.order_by('id')
     lookup_field = 'old_person_id'
     serializer_class = serializers.PersonRedirectSerializer
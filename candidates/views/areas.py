@@ -12,7 +12,7 @@ from django.utils.text import slugify
 from django.utils.translation import ugettext as _
 from django.shortcuts import get_object_or_404
 
-from candidates.models import AreaExtra, MembershipExtra
+from candidates.models import AreaExtra, CandidacyListing
 from candidates.models.auth import get_edits_allowed
 
 from elections.models import AreaType, Election
@@ -60,15 +60,11 @@ class AreasView(TemplateView):
                 except Election.DoesNotExist:
                     continue
                 locked = post_extra.candidates_locked
-                extra_qs = MembershipExtra.objects.select_related('election')
                 current_candidacies, _ = split_candidacies(
                     election,
-                    post.memberships.prefetch_related(
-                        Prefetch('extra', queryset=extra_qs)
-                    ).select_related(
-                        'person', 'person__extra', 'on_behalf_of',
-                        'on_behalf_of__extra', 'organization'
-                    ).all()
+                    CandidacyListing.objects.filter(
+                        post=post, election=election
+                    )
                 )
                 elected_candidacies, unelected_candidacies = split_by_elected(
                     election,
@@ -5,6 +5,9 @@ from datetime import timedelta
 from slugify import slugify
 
 from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, HttpResponseRedirect, Http404
@@ -14,9 +17,9 @@ from django.utils.translation import ugettext as _
 from django.views.generic import TemplateView, FormView, View
 from django.shortcuts import get_object_or_404
 from django.db import transaction
-from django.db.models import Prefetch
 
 from elections.mixins import ElectionMixin
+from elections.models import Election
 from auth_helpers.views import GroupRequiredMixin
 from .helpers import (
     get_party_people_for_election_from_memberships,
@@ -25,12 +28,23 @@ from .helpers import (
     split_by_elected, get_redirect_to_party_list
 )
 from .version_data import get_client_ip, get_change_metadata
-from ..csv_helpers import list_to_csv
+from ..precomputed_csv import (
+    get_csv_etag, get_csv_last_modified, get_election_csv,
+    get_election_csv_filename, get_post_csv, get_post_csv_filename,
+    is_safe_slug, precomputed_csv_enabled, read_csv, update_election_csv,
+    update_post_csv
+)
+from ..last_changed import get_post_last_changed, make_language_etag
+from ..post_cache import (
+    CANDIDATE_LIST_CACHE_SECONDS, get_candidate_list_cache_key,
+    get_post_cache_version
+)
 from ..forms import NewPersonForm, ToggleLockForm, ConstituencyRecordWinnerForm
 from ..models import (
     TRUSTED_TO_LOCK_GROUP_NAME, get_edits_allowed,
     RESULT_RECORDERS_GROUP_NAME, LoggedAction, PostExtra, OrganizationExtra,
-    MembershipExtra, PartySet, SimplePopoloField, ExtraField, PostExtraElection
+    PartySet, SimplePopoloField, ExtraField, PostExtraElection,
+    CandidacyListing
 )
 from official_documents.models import OfficialDocument
 from results.models import ResultEvent
@@ -51,6 +65,17 @@ def get_max_winners(post, election):
     return max_winners
 
 
+def post_last_modified(request, election, post_id, ignored_slug):
+    # As with person pages, logged-in users always get a fresh page:
+    if request.user.is_authenticated():
+        return None
+    return get_post_last_changed(post_id)
+
+
+def post_etag(request, *args, **kwargs):
+    return make_language_etag(post_last_modified(request, *args, **kwargs))
+
+
 class ConstituencyDetailView(ElectionMixin, TemplateView):
     template_name = 'candidates/constituency.html'
 
@@ -60,6 +85,99 @@ class ConstituencyDetailView(ElectionMixin, TemplateView):
             *args, **kwargs
         )
 
+    @method_decorator(condition(
+        etag_func=post_etag,
+        last_modified_func=post_last_modified,
+    ))
+    def get(self, request, *args, **kwargs):
+        return super(ConstituencyDetailView, self).get(
+            request, *args, **kwargs
+        )
+
+    def get_candidate_list_context(self, mp_post, candidates_locked, version):
+        """Return the grouped candidacies to list for the post
+
+        This doesn't depend on the user, so it's cached for everyone
+        until the post's cache version changes."""
+        cache_key = get_candidate_list_cache_key(
+            self.election, mp_post.id, candidates_locked, version)
+        candidate_list = cache.get(cache_key)
+        if candidate_list is not None:
+            return candidate_list
+        candidate_list = {}
+
+        current_candidacies, past_candidacies = split_candidacies(
+            self.election_data,
+            CandidacyListing.objects.filter(post=mp_post)
+        )
+
+        current_candidates = set(c.person_id for c in current_candidacies)
+        past_candidates = set(c.person_id for c in past_candidacies)
+
+        other_candidates = past_candidates - current_candidates
+
+        elected, unelected = split_by_elected(
+            self.election_data,
+            current_candidacies,
+        )
+
+        # Now split those candidates into those that we know aren't
+        # standing again, and those that we just don't know about.
+        other_candidacies = [c for c in past_candidacies
+                             if c.person_id in other_candidates]
+        not_standing_candidacies = [c for c in other_candidacies
+                                    if c.is_not_standing_in(self.election_data)]
+        might_stand_candidacies = [c for c in other_candidacies
+                                   if not c.is_not_standing_in(self.election_data)]
+
+        candidate_list['candidacies_not_standing_again'] = \
+            group_candidates_by_party(
+                self.election_data,
+                not_standing_candidacies,
+                party_list=self.election_data.party_lists_in_use,
+                max_people=self.election_data.default_party_list_members_to_show
+            )
+
+        candidate_list['candidacies_might_stand_again'] = \
+            group_candidates_by_party(
+                self.election_data,
+                might_stand_candidacies,
+                party_list=self.election_data.party_lists_in_use,
+                max_people=self.election_data.default_party_list_members_to_show
+            )
+
+        candidate_list['elected'] = group_candidates_by_party(
+            self.election_data,
+            elected,
+            party_list=self.election_data.party_lists_in_use,
+            max_people=None
+        )
+
+        candidate_list['unelected'] = group_candidates_by_party(
+            self.election_data,
+            unelected,
+            party_list=self.election_data.party_lists_in_use,
+            max_people=self.election_data.default_party_list_members_to_show
+        )
+
+        candidate_list['has_elected'] = \
+            len(candidate_list['elected']['parties_and_people']) > 0
+
+        candidate_list['show_retract_result'] = False
+        number_of_winners = 0
+        for c in current_candidacies:
+            if c.elected:
+                number_of_winners += 1
+            if c.elected is not None:
+                candidate_list['show_retract_result'] = True
+
+        max_winners = get_max_winners(mp_post, self.election_data)
+        candidate_list['show_confirm_result'] = (max_winners < 0) \
+            or number_of_winners < max_winners
+
+        cache.set(cache_key, candidate_list, CANDIDATE_LIST_CACHE_SECONDS)
+        return candidate_list
+
     def get_context_data(self, **kwargs):
         from ..election_specific import shorten_post_label
         context = super(ConstituencyDetailView, self).get_context_data(**kwargs)
@@ -110,88 +228,13 @@ class ConstituencyDetailView(ElectionMixin, TemplateView):
         context['candidate_list_edits_allowed'] = \
             get_edits_allowed(self.request.user, context['candidates_locked'])
 
-        extra_qs = MembershipExtra.objects.select_related('election')
-        current_candidacies, past_candidacies = \
-            split_candidacies(
-                self.election_data,
-                mp_post.memberships.prefetch_related(
-                    Prefetch('extra', queryset=extra_qs)
-                ).select_related(
-                    'person', 'person__extra', 'on_behalf_of',
-                    'on_behalf_of__extra', 'organization'
-                ).all()
-            )
-
-        current_candidates = set(c.person for c in current_candidacies)
-        past_candidates = set(c.person for c in past_candidacies)
-
-        other_candidates = past_candidates - current_candidates
-
-        elected, unelected = split_by_elected(
-            self.election_data,
-            current_candidacies,
-        )
-
-        # Now split those candidates into those that we know aren't
-        # standing again, and those that we just don't know about.
-        not_standing_candidates = set(
-            p for p in other_candidates
-            if self.election_data in p.extra.not_standing.all()
-        )
-        might_stand_candidates = set(
-            p for p in other_candidates
-            if self.election_data not in p.extra.not_standing.all()
-        )
-
-        not_standing_candidacies = [c for c in past_candidacies
-                                    if c.person in not_standing_candidates]
-        might_stand_candidacies = [c for c in past_candidacies
-                                   if c.person in might_stand_candidates]
-
-        context['candidacies_not_standing_again'] = \
-            group_candidates_by_party(
-                self.election_data,
-                not_standing_candidacies,
-                party_list=self.election_data.party_lists_in_use,
-                max_people=self.election_data.default_party_list_members_to_show
-            )
-
-        context['candidacies_might_stand_again'] = \
-            group_candidates_by_party(
-                self.election_data,
-                might_stand_candidacies,
-                party_list=self.election_data.party_lists_in_use,
-                max_people=self.election_data.default_party_list_members_to_show
-            )
-
-        context['elected'] = group_candidates_by_party(
-            self.election_data,
-            elected,
-            party_list=self.election_data.party_lists_in_use,
-            max_people=None
-        )
-
-        context['unelected'] = group_candidates_by_party(
-            self.election_data,
-            unelected,
-            party_list=self.election_data.party_lists_in_use,
-            max_people=self.election_data.default_party_list_members_to_show
-        )
-
-        context['has_elected'] = \
-            len(context['elected']['parties_and_people']) > 0
-
-        context['show_retract_result'] = False
-        number_of_winners = 0
-        for c in current_candidacies:
-            if c.extra.elected:
-                number_of_winners += 1
-            if c.extra.elected is not None:
-                context['show_retract_result'] = True
-
-        max_winners = get_max_winners(mp_post, self.election_data)
-        context['show_confirm_result'] = (max_winners < 0) \
-            or number_of_winners < max_winners
+        context['candidate_list_version'] = \
+            get_post_cache_version(mp_post.id)
+        context.update(self.get_candidate_list_context(
+            mp_post,
+            context['candidates_locked'],
+            context['candidate_list_version'],
+        ))
 
         context['add_candidate_form'] = NewPersonForm(
             election=self.election,
@@ -209,33 +252,114 @@ class ConstituencyDetailView(ElectionMixin, TemplateView):
         return context
 
 
-class ConstituencyDetailCSVView(ElectionMixin, View):
+def csv_attachment_response(csv, filename):
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    response.write(csv)
+    return response
+
+
+def post_csv_filename(request, election, post_id, ignored_slug):
+    if is_safe_slug(election) and is_safe_slug(post_id):
+        return get_post_csv_filename(election, post_id)
+
+
+def post_csv_etag(request, *args, **kwargs):
+    filename = post_csv_filename(request, *args, **kwargs)
+    return filename and get_csv_etag(filename)
+
+
+def post_csv_last_modified(request, *args, **kwargs):
+    filename = post_csv_filename(request, *args, **kwargs)
+    return filename and get_csv_last_modified(filename)
+
+
+class ConstituencyDetailCSVView(View):
+    """Return the CSV of candidates for a post in an election
+
+    If PRECOMPUTED_CSV_ENABLED is set, this is served from a file in
+    storage where possible, so that it only needs the query for the
+    post's label; those files are updated whenever an edit affecting
+    the post is logged."""
 
     http_method_names = ['get']
 
+    @method_decorator(condition(
+        etag_func=post_csv_etag,
+        last_modified_func=post_csv_last_modified,
+    ))
     def get(self, request, *args, **kwargs):
-        post = Post.objects \
-            .select_related('extra') \
-            .get(extra__slug=kwargs['post_id'])
-        all_people = []
-        for me in MembershipExtra.objects \
-                .filter(
-                    election=self.election_data,
-                    base__post=post
-                ) \
-                .select_related('base__person') \
-                .prefetch_related('base__person__extra'):
-            for d in me.base.person.extra.as_list_of_dicts(self.election_data):
-                all_people.append(d)
-
+        post_extra = get_object_or_404(
+            PostExtra.objects.select_related('base'),
+            slug=kwargs['post_id']
+        )
         filename = "{election}-{constituency_slug}.csv".format(
-            election=self.election,
-            constituency_slug=slugify(post.extra.short_label),
+            election=kwargs['election'],
+            constituency_slug=slugify(post_extra.short_label),
         )
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
-        response.write(list_to_csv(all_people))
-        return response
+        storage_filename = post_csv_filename(request, **kwargs)
+        if storage_filename and precomputed_csv_enabled() and \
+                default_storage.exists(storage_filename):
+            try:
+                return csv_attachment_response(
+                    read_csv(storage_filename), filename)
+            except IOError:
+                # It was removed after the check above; fall back to
+                # generating it again:
+                pass
+        election = get_object_or_404(Election, slug=kwargs['election'])
+        if precomputed_csv_enabled():
+            csv = update_post_csv(election, post_extra)
+        else:
+            csv = get_post_csv(election, post_extra)
+        return csv_attachment_response(csv, filename)
+
+
+def election_csv_filename(request, election):
+    if is_safe_slug(election):
+        return get_election_csv_filename(election)
+
+
+def election_csv_etag(request, *args, **kwargs):
+    filename = election_csv_filename(request, *args, **kwargs)
+    return filename and get_csv_etag(filename)
+
+
+def election_csv_last_modified(request, *args, **kwargs):
+    filename = election_csv_filename(request, *args, **kwargs)
+    return filename and get_csv_last_modified(filename)
+
+
+class ElectionCSVView(View):
+    """Return the CSV of candidates for a whole election
+
+    Like ConstituencyDetailCSVView, this is served from storage where
+    possible, and otherwise rebuilt from the CSV files of each post."""
+
+    http_method_names = ['get']
+
+    @method_decorator(condition(
+        etag_func=election_csv_etag,
+        last_modified_func=election_csv_last_modified,
+    ))
+    def get(self, request, *args, **kwargs):
+        filename = "{election}.csv".format(election=kwargs['election'])
+        storage_filename = election_csv_filename(request, **kwargs)
+        if storage_filename and precomputed_csv_enabled() and \
+                default_storage.exists(storage_filename):
+            try:
+                return csv_attachment_response(
+                    read_csv(storage_filename), filename)
+            except IOError:
+                # As for posts, it may have been removed since the
+                # check above:
+                pass
+        election = get_object_or_404(Election, slug=kwargs['election'])
+        if precomputed_csv_enabled():
+            csv = update_election_csv(election)
+        else:
+            csv = get_election_csv(election)
+        return csv_attachment_response(csv, filename)
 
 
 class ConstituencyListView(ElectionMixin, TemplateView):
@@ -478,6 +602,15 @@ class ConstituencyRetractWinnerView(ElectionMixin, GroupRequiredMixin, View):
                     )
                     candidate.extra.record_version(change_metadata)
                     candidate.save()
+                    LoggedAction.objects.create(
+                        user=self.request.user,
+                        action_type='retract-winner',
+                        ip_address=get_client_ip(self.request),
+                        popit_person_new_version=change_metadata['version_id'],
+                        person=candidate,
+                        post=post,
+                        source=change_metadata['information_source'],
+                    )
 
         return HttpResponseRedirect(
             reverse(
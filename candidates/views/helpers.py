@@ -13,7 +13,7 @@ from elections.models import Election
 from slugify import slugify
 
 from ..models import (
-    MembershipExtra, PartySet, SimplePopoloField, ExtraField,
+    PartySet, SimplePopoloField, ExtraField,
     ComplexPopoloField
 )
 
@@ -161,46 +161,40 @@ def get_party_people_for_election_from_memberships(
 
     return people
 
-def split_candidacies(election_data, memberships):
-    # Group the candidates from memberships of a post into current and
-    # past elections. To save queries, memberships should have their
-    # 'extra' objects loaded with prefetch_related, and the 'election'
-    # property of those 'extra' objects should have been loaded with
-    # select_related.
+def split_candidacies(election_data, candidacy_listings):
+    # Group the candidacies from the CandidacyListing objects of a
+    # post into those for the given election and those for other
+    # elections.
     current_candidadacies = set()
     past_candidadacies = set()
-    for membership in memberships:
-        try:
-            membership_extra = membership.extra
-        except MembershipExtra.DoesNotExist:
-            continue
-        if membership_extra.election == election_data:
-            if not membership.role == election_data.candidate_membership_role:
+    for candidacy_listing in candidacy_listings:
+        if candidacy_listing.election_id == election_data.id:
+            if not candidacy_listing.is_candidate_in(election_data):
                 continue
-            current_candidadacies.add(membership)
-        elif membership_extra.election:
-            past_candidadacies.add(membership)
+            current_candidadacies.add(candidacy_listing)
+        else:
+            past_candidadacies.add(candidacy_listing)
 
     return current_candidadacies, past_candidadacies
 
 
-def split_by_elected(election_data, memberships):
+def split_by_elected(election_data, candidacy_listings):
     elected_candidates = set()
     unelected_candidates = set()
-    for membership in memberships:
-        if membership.extra.elected:
-            elected_candidates.add(membership)
+    for candidacy_listing in candidacy_listings:
+        if candidacy_listing.elected:
+            elected_candidates.add(candidacy_listing)
             user_settings = get_current_usersettings()
             if not user_settings.HOIST_ELECTED_CANDIDATES:
-                unelected_candidates.add(membership)
+                unelected_candidates.add(candidacy_listing)
         else:
-            unelected_candidates.add(membership)
+            unelected_candidates.add(candidacy_listing)
 
     return elected_candidates, unelected_candidates
 
 
 def group_candidates_by_party(election_data, candidacies, party_list=True, max_people=None):
-    """Take a list of candidacies and return the people grouped by party
+    """Take CandidacyListing objects and return the people grouped by party
 
     This returns a tuple of the party_list boolean and a list of
     parties-and-people.
@@ -223,12 +217,12 @@ def group_candidates_by_party(election_data, candidacies, party_list=True, max_p
     party_truncated = dict()
     party_total = dict()
     for candidacy in candidacies:
-        party = candidacy.on_behalf_of
-        party_id_to_name[party.extra.slug] = party.name
-        position = candidacy.extra.party_list_position
-        party_id_to_people[party.extra.slug].append(
-            (position, candidacy.person, candidacy.extra.elected)
-        )
+        party_id_to_name[candidacy.party_slug] = candidacy.party_name
+        party_id_to_people[candidacy.party_slug].append((
+            candidacy.party_list_position,
+            candidacy.listed_person,
+            candidacy.elected
+        ))
     for party_id, people_list in party_id_to_people.items():
         truncated = False
         total_count = len(people_list)
@@ -5,9 +5,9 @@ from collections import defaultdict
 from django.views.generic import TemplateView
 from django.shortcuts import get_object_or_404
 
-from popolo.models import Organization, Membership
+from popolo.models import Organization
 
-from candidates.models import OrganizationExtra, PostExtra
+from candidates.models import CandidacyListing, OrganizationExtra, PostExtra
 from elections.mixins import ElectionMixin
 
 
@@ -64,17 +64,16 @@ class PartyDetailView(ElectionMixin, TemplateView):
             }
             for pg in all_post_groups
         }
-        for membership in Membership.objects.filter(
-            on_behalf_of=party,
-            extra__election=self.election_data,
+        for candidacy_listing in CandidacyListing.objects.filter(
+            party=party,
+            election=self.election_data,
             role=self.election_data.candidate_membership_role
-        ).select_related().prefetch_related('post__extra', 'person__extra'):
-            person = membership.person
-            post = membership.post
+        ).select_related('post__extra'):
+            post = candidacy_listing.post
             post_group = post.extra.group
             by_post_group[post_group]['posts_with_memberships'][post].append({
-                'membership': membership,
-                'person': person,
+                'membership': candidacy_listing,
+                'person': candidacy_listing.listed_person,
                 'post': post,
             })
         # That'll only find the posts that someone from the party is
@@ -1,6 +1,5 @@
 from __future__ import unicode_literals
 
-import json
 import re
 
 from slugify import slugify
@@ -18,6 +17,7 @@ from django.utils.decorators import method_decorator
 from django.utils.http import urlquote
 from django.utils.translation import ugettext as _
 from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import FormView, TemplateView, View
 
 from braces.views import LoginRequiredMixin
@@ -26,12 +26,12 @@ from auth_helpers.views import GroupRequiredMixin
 from elections.models import Election
 from elections.mixins import ElectionMixin
 
-from ..diffs import get_version_diffs
 from .mixins import PersonMixin
 from .version_data import get_client_ip, get_change_metadata
 from ..forms import NewPersonForm, UpdatePersonForm, SingleElectionForm
 from ..models import (
-    LoggedAction, PersonRedirect, TRUSTED_TO_MERGE_GROUP_NAME
+    LoggedAction, PersonRedirect, PersonVersion, VersionNotFound,
+    TRUSTED_TO_MERGE_GROUP_NAME
 )
 from ..models.auth import check_creation_allowed, check_update_allowed
 from ..models.versions import (
@@ -41,6 +41,7 @@ from ..models import (
     PersonExtra, merge_popit_people, ExtraField, PersonExtraFieldValue,
     SimplePopoloField, ComplexPopoloField
 )
+from ..last_changed import get_person_last_changed, make_language_etag
 from .helpers import (
     get_field_groupings, get_person_form_fields
 )
@@ -97,6 +98,18 @@ def get_extra_fields(person):
     ]
 
 
+def person_last_modified(request, person_id, *args, **kwargs):
+    # Pages for logged-in users have their own editing controls, so
+    # they're always rendered:
+    if request.user.is_authenticated():
+        return None
+    return get_person_last_changed(person_id)
+
+
+def person_etag(request, *args, **kwargs):
+    return make_language_etag(person_last_modified(request, *args, **kwargs))
+
+
 class PersonView(TemplateView):
     template_name = 'candidates/person-view.html'
 
@@ -147,6 +160,10 @@ class PersonView(TemplateView):
         context['extra_fields'] = get_extra_fields(self.person)
         return context
 
+    @method_decorator(condition(
+        etag_func=person_etag,
+        last_modified_func=person_last_modified,
+    ))
     def get(self, request, *args, **kwargs):
         person_id = self.kwargs['person_id']
         try:
@@ -186,15 +203,9 @@ class RevertPersonView(LoginRequiredMixin, PersonMixin, View):
 
         person_extra = self.person.extra
 
-        versions = json.loads(person_extra.versions)
-
-        data_to_revert_to = None
-        for version in versions:
-            if version['version_id'] == version_id:
-                data_to_revert_to = version['data']
-                break
-
-        if not data_to_revert_to:
+        try:
+            data_to_revert_to = person_extra.get_version(version_id)['data']
+        except VersionNotFound:
             message = _("Couldn't find the version {0} of person {1}")
             raise Exception(message.format(version_id, self.person.id))
 
@@ -267,11 +278,10 @@ class MergePeopleView(GroupRequiredMixin, View):
                 primary_person_extra,
                 merged_person_version_data
             )
-            # Make sure the secondary person's version history is appended, so it
-            # isn't lost.
-            primary_person_versions = json.loads(primary_person_extra.versions)
-            primary_person_versions += json.loads(secondary_person_extra.versions)
-            primary_person_extra.versions = json.dumps(primary_person_versions)
+            # Make sure the secondary person's version history is moved
+            # to the primary person, so it isn't lost.
+            PersonVersion.objects.filter(person=secondary_person) \
+                .update(person=primary_person)
             primary_person_extra.record_version(change_metadata)
             primary_person_extra.save()
             # Change the secondary person's images to point at the primary
@@ -329,9 +339,7 @@ class UpdatePersonView(LoginRequiredMixin, PersonMixin, FormView):
     def get_context_data(self, **kwargs):
         context = super(UpdatePersonView, self).get_context_data(**kwargs)
 
-        context['versions'] = get_version_diffs(
-            json.loads(self.person.extra.versions)
-        )
+        context['versions'] = self.person.extra.version_diffs
 
         elections_standing_in = Election.objects.filter(
             candidacies__base__person=self.person,
@@ -1,20 +1,47 @@
-from django.utils.html import escape
+from __future__ import unicode_literals
 
-from haystack.generic_views import SearchView
-from haystack.forms import SearchForm
+from django import forms
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+from django.views.generic import TemplateView
 
+from popolo.models import Person
 
-class PersonSearchForm(SearchForm):
-    """
-    When Haystack indexed things into its sythesized text field
-    it HTML escapes everything. This means that we also need to
-    escape our search terms as otherwise names with apostrophes
-    and the like never match as the entry in the search index
-    is O&#39;Reilly and our search term is O'Reilly
-    """
-    def clean_q(self):
-        return escape(self.cleaned_data['q'])
+from ..models import PersonSearchDocument
 
 
-class PersonSearch(SearchView):
-    form_class = PersonSearchForm
+class PersonSearchForm(forms.Form):
+    q = forms.CharField(required=False)
+
+
+class PersonSearch(TemplateView):
+    """Search for people by name, other names or party
+
+    This uses the PersonSearchDocument index in the database, which
+    matches partial names and names with a typo or two."""
+
+    template_name = 'search/search.html'
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super(PersonSearch, self).get_context_data(**kwargs)
+        form = PersonSearchForm(self.request.GET)
+        query = form.cleaned_data['q'] if form.is_valid() else ''
+        context['form'] = form
+        context['query'] = query
+        if not query:
+            return context
+        paginator = Paginator(
+            PersonSearchDocument.objects.search(query), self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page', 1))
+        except InvalidPage:
+            raise Http404
+        people = Person.objects.select_related('extra') \
+            .in_bulk(page.object_list)
+        context['page'] = page
+        context['object_list'] = [
+            people[person_id] for person_id in page.object_list
+            if person_id in people
+        ]
+        return context
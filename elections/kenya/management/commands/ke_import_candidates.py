@@ -4,19 +4,12 @@ from __future__ import print_function, unicode_literals
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
-from candidates.models import (
-    AreaExtra, OrganizationExtra, PostExtra, PartySet, PostExtraElection, MembershipExtra, PersonExtra, check_constraints
-)
-from candidates.views import get_change_metadata
-from elections.models import Election
-from popolo.models import Organization, Post, Person, Membership
+from candidates.bulk_import import BulkCandidacyImporter
+from candidates.models import PartySet, check_constraints
 
 import csv
-import re
 import string
 
-from candidates.utils import strip_accents
-
 
 PARTY_SET_SLUG = 'kenya_2017'
 PARTY_SET_NAME = 'Register of Politial Parties'
@@ -87,104 +80,12 @@ ELECTIONS = [
 
 class Command(BaseCommand):
 
-    def get_or_create_person(self, scheme, identifier, name, surname, other_names, gender=None):
-
-        try:
-            person = Person.objects.get(
-                identifiers__scheme=scheme,
-                identifiers__identifier=identifier
-            )
-            person.name = name
-        except Person.DoesNotExist:
-            person = Person.objects.create(
-                name=name
-            )
-
-            person.identifiers.create(
-                scheme=scheme,
-                identifier=identifier
-            )
-
-        person.family_name = surname
-        person.given_name = other_names
-
-        if gender:
-            person.gender = gender
-
-        person.save()
-
-        personExtra, created = PersonExtra.objects.get_or_create(
-            base=person,
-            defaults={
-                'versions': '[]'
-            }
-        )
-
-        return person
-
-    def get_or_create_party(self, identifier, name, party_set):
-
-        party_slug = 'party:' + identifier
-
-        try:
-            party = Organization.objects.get(extra__slug=party_slug)
-        except Organization.DoesNotExist:
-            party = Organization.objects.create(
-                name=name,
-                classification='Party'
-            )
-            partyExtra, created = OrganizationExtra.objects.update_or_create(
-                base=party,
-                defaults={
-                    'slug': party_slug
-                }
-            )
-
-        # This should be in the party set!
-        party_set.parties.add(party)
-
-        return party
-
-    def get_or_create_membership(self, person, post, party, election):
-
-        membership, created = Membership.objects.get_or_create(
-            person=person,
-            post=post,
-            on_behalf_of=party,
-            role=election.candidate_membership_role
-        )
-
-        # We assume that each membership needs only one Extra object
-        membershipExtra, created = MembershipExtra.objects.update_or_create(
-            base=membership,
-            defaults={
-                'election': election,
-                'elected': None
-            }
-        )
-
-        source = "Added from initial import."
-
-        change_metadata = get_change_metadata(None, source)
-        person.extra.record_version(change_metadata)
-        person.extra.save()
-
-    def import_candidates_for_election(self, election, party_set):
+    def import_candidates_for_election(self, election, importer):
 
         # Get the candidates
         reader = csv.DictReader(open('elections/kenya/data/' + election['CANDIDATES_FILE']))
 
-        election_objects = {}
-
-        for i, row in enumerate(reader):
-
-            election_slug = election['ROW_TO_ELECTION_SLUG'](row)
-
-            # Make sure the election exists
-            election_object = election_objects.get(
-                election_slug,
-                Election.objects.get(slug=election_slug)
-            )
+        for row in reader:
 
             # Assemble a coherent name
             surname = string.capwords(row['Surname'])
@@ -195,39 +96,30 @@ class Command(BaseCommand):
             # Build an identifier
             identifier = '{0}-{1}'.format(election['CANDIDATE_ID_PREFIX'], row['No'])
 
-            person = self.get_or_create_person(
-                'iebc-{0}-import-id'.format(election['CANDIDATE_ID_PREFIX']),
-                identifier,
-                name,
-                surname,
-                other_names,
-                row['Gender'].title()
-            )
-
-            # Add the party!
-            party = self.get_or_create_party(
-                identifier=row['Party Code'],
-                name=row['Political Party Name'].title(),
-                party_set=party_set
-            )
-
-            # At this point we have a person and a party, so we can go ahead and create a membership
-
-            # First, get the post.
-            # If this post doesn't exist, we should drop out because someone hasn't run the posts script.
-            post_slug = election['ROW_TO_POST_ID'](row)
-            post = Post.objects.get(extra__slug=post_slug)
-
-            membership = self.get_or_create_membership(
-                person=person,
-                post=post,
-                party=party,
-                election=election_object
+            # Don't clear the gender of someone who's already been
+            # imported if it's missing from this row:
+            person_fields = {}
+            gender = row['Gender'].strip().title()
+            if gender:
+                person_fields['gender'] = gender
+
+            # If the election or post doesn't exist, this raises an
+            # error, since someone hasn't run the posts script.
+            importer.add_candidacy(
+                election_slug=election['ROW_TO_ELECTION_SLUG'](row),
+                post_slug=election['ROW_TO_POST_ID'](row),
+                party_slug='party:' + row['Party Code'],
+                party_name=row['Political Party Name'].title(),
+                identifier_scheme='iebc-{0}-import-id'.format(election['CANDIDATE_ID_PREFIX']),
+                identifier=identifier,
+                name=name,
+                family_name=surname,
+                given_name=other_names,
+                **person_fields
             )
 
-            if not (i + 1) % 50:
-                print('Imported {}'.format(i + 1))
-
+    def print_progress(self, imported):
+        print('Imported {}'.format(imported))
 
     @transaction.atomic
     def handle(self, *args, **options):
@@ -240,9 +132,18 @@ class Command(BaseCommand):
             }
         )
 
+        importer = BulkCandidacyImporter(
+            source="Added from initial import.",
+            party_set=party_set,
+            progress_callback=self.print_progress,
+        )
+
         for election in ELECTIONS:
             print('Importing candidates for election: {}'.format(election['CANDIDATES_FILE']))
-            self.import_candidates_for_election(election, party_set)
+            self.import_candidates_for_election(election, importer)
+            importer.flush()
+
+        importer.finish()
 
         errors = check_constraints()
         if errors:
@@ -12,7 +12,7 @@ from django.views.generic import TemplateView
 from django.utils.text import slugify
 from django.utils.translation import ugettext as _
 
-from candidates.models import AreaExtra, MembershipExtra
+from candidates.models import AreaExtra, CandidacyListing
 from candidates.models.auth import get_edits_allowed
 from candidates.forms import NewPersonForm
 from candidates.views.helpers import split_candidacies, group_candidates_by_party
@@ -55,15 +55,11 @@ class StPaulAreasView(TemplateView):
                 post_extra = post.extra
                 election = post_extra.elections.get(current=True)
                 locked = post_extra.candidates_locked
-                extra_qs = MembershipExtra.objects.select_related('election')
                 current_candidacies, created = split_candidacies(
                     election,
-                    post.memberships.prefetch_related(
-                        Prefetch('extra', queryset=extra_qs)
-                    ).select_related(
-                        'person', 'person__extra', 'on_behalf_of',
-                        'on_behalf_of__extra', 'organization'
-                    ).all()
+                    CandidacyListing.objects.filter(
+                        post=post, election=election
+                    )
                 )
                 current_candidacies = group_candidates_by_party(
                     election,
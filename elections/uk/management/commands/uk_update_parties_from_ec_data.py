@@ -1,7 +1,6 @@
 from __future__ import print_function, unicode_literals
 
 from datetime import datetime
-import hashlib
 from os.path import join
 import re
 from shutil import move
@@ -21,15 +20,12 @@ from popolo.models import Organization
 import requests
 import dateutil.parser
 
+from candidates.management.images import get_file_md5sum
 from candidates.models import OrganizationExtra, PartySet, ImageExtra
 
 emblem_directory = join(settings.BASE_DIR, 'data', 'party-emblems')
 base_emblem_url = 'http://search.electoralcommission.org.uk/Api/Registrations/Emblems/'
 
-def get_file_md5sum(filename):
-    with open(filename, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
-
 def find_index(l, predicate):
     for i, e in enumerate(l):
         if predicate(e):
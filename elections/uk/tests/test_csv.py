@@ -84,3 +84,32 @@ class CSVTests(UK2015ExamplesMixin, TestCase):
         self.assertEqual(person_dict['parlparse_id'], 'uk.org.publicwhip/person/10326')
         self.assertEqual(person_dict['theyworkforyou_url'], 'http://www.theyworkforyou.com/mp/10326')
         self.assertEqual(person_dict['party_ec_id'], 'PP53')
+
+    def test_csv_rows_with_extra_values(self):
+        other_person_extra = factories.PersonExtraFactory.create(
+            base__id=4322,
+            base__name='Helen Hayes',
+        )
+        factories.CandidacyExtraFactory.create(
+            election=self.election,
+            base__person=other_person_extra.base,
+            base__post=self.dulwich_post_extra.base,
+            base__on_behalf_of=self.labour_party_extra.base
+        )
+        # Make sure the settings and content types are already cached,
+        # so that the number of queries is predictable:
+        PersonExtra.objects.all().csv_rows(self.election)
+        # The number of queries shouldn't depend on the number of
+        # people, including those for the extra CSV fields:
+        with self.assertNumQueries(12):
+            PersonExtra.objects.filter(pk=self.gb_person_extra.id) \
+                .csv_rows(self.election)
+        with self.assertNumQueries(12):
+            rows = PersonExtra.objects.all().csv_rows(self.election)
+        rows.sort(key=lambda row: row['id'])
+        self.assertEqual(
+            [(row['id'], row['gss_code'], row['party_ec_id']) for row in rows],
+            [(2009, 'E14000615', 'PP53'), (4322, 'E14000673', 'PP53')]
+        )
+        self.assertEqual(rows[0]['parlparse_id'], 'uk.org.publicwhip/person/10326')
+        self.assertEqual(rows[1]['parlparse_id'], '')
@@ -1,7 +1,7 @@
 from __future__ import unicode_literals
 
 from django.contrib import admin
-from .models import QueuedImage
+from .models import QueuedImage, QueuedImageDecision
 
 class QueuedImageAdmin(admin.ModelAdmin):
     list_display = ('user', 'person', 'created', 'decision')
@@ -15,3 +15,11 @@ class QueuedImageAdmin(admin.ModelAdmin):
         return qs.select_related('person', 'user')
 
 admin.site.register(QueuedImage, QueuedImageAdmin)
+
+
+class QueuedImageDecisionAdmin(admin.ModelAdmin):
+    list_display = ('queued_image', 'decision', 'created', 'attempts')
+    readonly_fields = ('queued_image', 'logged_action', 'last_error')
+    ordering = ('created',)
+
+admin.site.register(QueuedImageDecision, QueuedImageDecisionAdmin)
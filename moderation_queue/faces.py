@@ -1,10 +1,13 @@
-from __future__ import unicode_literals
+from __future__ import division, unicode_literals
 
 # easy_thumbnails face cropping processor
 # Much of the below taken from http://stackoverflow.com/a/13243712/669631
 
-import cv
-faceCascade = cv.Load('/usr/share/opencv/haarcascades/haarcascade_frontalface_alt.xml')
+from PIL import Image
+
+# OpenCV is only imported (and the cascade loaded) when faces are first
+# looked for, so that face_crop_bounds can be tested without it:
+faceCascade = None
 
 # Select one of the haarcascade files:
 #   haarcascade_frontalface_alt.xml  <-- Best one?
@@ -17,6 +20,11 @@ faceCascade = cv.Load('/usr/share/opencv/haarcascades/haarcascade_frontalface_al
 def detectFaces(im):
     # This function takes a PIL image and finds the patterns defined in the
     # haarcascade function modified from: http://www.lucaamore.com/?p=638
+    global faceCascade
+    import cv
+    if faceCascade is None:
+        faceCascade = cv.Load(
+            '/usr/share/opencv/haarcascades/haarcascade_frontalface_alt.xml')
 
     # Convert a PIL image to a greyscale cv image
     # from: http://pythonpath.wordpress.com/2012/05/08/pil-to-opencv-image/
@@ -41,8 +49,18 @@ def detectFaces(im):
 
     return faces
 
-def face_crop_bounds(im):
+def face_crop_bounds(im, max_dimension=None):
+    # If 'max_dimension' is given, faces are looked for in a copy of the
+    # image scaled down to fit within it (which is much quicker for
+    # large photos), and the bounds returned are scaled back up again.
     source_x, source_y = [int(v) for v in im.size]
+    scale = 1
+    if max_dimension and max(source_x, source_y) > max_dimension:
+        scale = max(source_x, source_y) / max_dimension
+        im = im.convert('L').resize(
+            (int(round(source_x / scale)), int(round(source_y / scale))),
+            Image.BILINEAR
+        )
     faces = detectFaces(im)
     if not faces:
         return None
@@ -51,13 +69,14 @@ def face_crop_bounds(im):
         if face[2] > cropBox[2] or face[3] > cropBox[3]:
             cropBox = face
 
-    xDelta = int(max(cropBox[2] * 0.4, 0))
-    yDelta = int(max(cropBox[3] * 0.4, 0))
-
     # Convert cv box to PIL box [left, upper, right, lower]
     if cropBox == [0, 0, 0, 0]:
         return None
 
+    cropBox = [int(round(v * scale)) for v in cropBox]
+    xDelta = int(max(cropBox[2] * 0.4, 0))
+    yDelta = int(max(cropBox[3] * 0.4, 0))
+
     return [
             max(cropBox[0] - xDelta, 0),
             max(cropBox[1] - yDelta, 0),
@@ -1,30 +1,144 @@
-from __future__ import unicode_literals
+from __future__ import division, unicode_literals
+
+from multiprocessing import Pool
+from time import time
 
 from PIL import Image
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.six.moves import map
 
 from moderation_queue.models import QueuedImage
 from moderation_queue.faces import face_crop_bounds
 
+# Faces are looked for in a copy of each image scaled down to fit
+# within this many pixels:
+DEFAULT_MAX_DIMENSION = 1024
+
+
+def detect_face(args):
+    """Look for a face in a queued image
+
+    This returns the image's ID, the crop bounds of its face (or None if
+    there isn't one) and the error reading it (or None).  It's run in a
+    worker process when the --workers option is used."""
+    queued_image_id, path, max_dimension = args
+    try:
+        im = Image.open(path)
+        try:
+            return queued_image_id, face_crop_bounds(im, max_dimension), None
+        finally:
+            im.close()
+    except IOError as e:
+        return queued_image_id, None, '{0}'.format(e)
+
+
 class Command(BaseCommand):
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='The number of processes to detect faces with (default 1)'
+        )
+        parser.add_argument(
+            '--max-dimension',
+            type=int,
+            default=DEFAULT_MAX_DIMENSION,
+            help=(
+                'Scale images down to this size (in pixels) to look for '
+                'faces (default {0}; 0 for full size)'
+            ).format(DEFAULT_MAX_DIMENSION)
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='How many results to save at a time (default 100)'
+        )
+
     def handle(self, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+        verbosity = int(options['verbosity'])
+        queued_images = {
+            qi.id: qi for qi in QueuedImage.objects.filter(
+                decision='undecided',
+                face_detection_tried=False,
+            ).select_related('user', 'person')
+        }
+        tasks = [
+            (qi.id, qi.image.path, options['max_dimension'] or None)
+            for qi in sorted(queued_images.values(), key=lambda qi: qi.id)
+        ]
+        start = time()
+        pool = None
+        if options['workers'] > 1:
+            # The worker processes mustn't share the parent's database
+            # connection, so close it before they're forked:
+            connections.close_all()
+            pool = Pool(options['workers'])
+            results = pool.imap_unordered(detect_face, tasks, chunksize=4)
+        else:
+            results = map(detect_face, tasks)
+        try:
+            batch = []
+            for queued_image_id, guessed_crop_bounds, error in results:
+                qi = queued_images[queued_image_id]
+                if error:
+                    # Leave it to be tried again, in case the file
+                    # turns up:
+                    self.stderr.write(
+                        "Couldn't read the image {0}: {1}".format(qi, error)
+                    )
+                    continue
+                if guessed_crop_bounds:
+                    if verbosity > 1:
+                        self.stdout.write("Set bounds of {0} to {1}".format(
+                            qi, guessed_crop_bounds
+                        ))
+                else:
+                    self.stdout.write("Couldn't find a face in {0}".format(qi))
+                batch.append((queued_image_id, guessed_crop_bounds))
+                if len(batch) >= options['batch_size']:
+                    self.save_results(batch)
+                    batch = []
+            self.save_results(batch)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if verbosity > 0 and tasks:
+            elapsed = time() - start
+            self.stdout.write(
+                "Looked for faces in {0} images in {1:.1f} seconds "
+                "({2:.1f} images per second)".format(
+                    len(tasks), elapsed, len(tasks) / max(elapsed, 0.001)
+                )
+            )
 
-        for qi in QueuedImage.objects.filter(decision='undecided'):
-            if qi.face_detection_tried:
-                continue
-            im = Image.open(qi.image.path)
-            guessed_crop_bounds = face_crop_bounds(im)
-            im.close()
-            if guessed_crop_bounds:
-                qi.crop_min_x, qi.crop_min_y, qi.crop_max_x, qi.crop_max_y = \
-                                                                             guessed_crop_bounds
-                if int(options['verbosity']) > 1:
-                    self.stdout.write("Set bounds of {0} to {1}".format(
-                        qi, guessed_crop_bounds
-                    ))
-            else:
-                self.stdout.write("Couldn't find a face in {0}".format(qi))
-            qi.face_detection_tried = True
-            qi.save()
+    def save_results(self, results):
+        """Record the crop bounds found for some queued images
+
+        Those where no face was found are all updated at once."""
+        now = timezone.now()
+        with transaction.atomic():
+            QueuedImage.objects.filter(
+                pk__in=[
+                    queued_image_id
+                    for queued_image_id, bounds in results if not bounds
+                ]
+            ).update(face_detection_tried=True, updated=now)
+            for queued_image_id, bounds in results:
+                if bounds:
+                    QueuedImage.objects.filter(pk=queued_image_id).update(
+                        crop_min_x=bounds[0],
+                        crop_min_y=bounds[1],
+                        crop_max_x=bounds[2],
+                        crop_max_y=bounds[3],
+                        face_detection_tried=True,
+                        updated=now,
+                    )
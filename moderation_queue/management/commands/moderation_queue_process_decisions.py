@@ -0,0 +1,41 @@
+from __future__ import print_function, unicode_literals
+
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import override
+
+from moderation_queue.models import (
+    MAX_DECISION_ATTEMPTS, QueuedImageDecision
+)
+
+
+class Command(BaseCommand):
+
+    help = "Crop and store approved images, and email their uploaders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running, checking for new decisions every SECONDS'
+        )
+
+    def handle(self, *args, **options):
+        with override(settings.LANGUAGE_CODE):
+            while True:
+                done = QueuedImageDecision.objects.process()
+                if done and int(options['verbosity']) > 0:
+                    print("Carried out {0} moderation decisions".format(done))
+                if not options['watch']:
+                    break
+                sleep(options['watch'])
+        failed = QueuedImageDecision.objects \
+            .filter(attempts__gte=MAX_DECISION_ATTEMPTS).count()
+        if failed:
+            print(
+                "{0} moderation decisions have failed {1} times; see their "
+                "last errors in the admin".format(failed, MAX_DECISION_ATTEMPTS)
+            )
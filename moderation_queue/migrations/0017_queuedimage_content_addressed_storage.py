@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import candidates.models.image_store
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0045_storedimage'),
+        ('moderation_queue', '0016_remove_queuedimage_popit_person_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedimage',
+            name='image',
+            field=models.ImageField(storage=candidates.models.image_store.ContentAddressedStorage(), max_length=512, upload_to='queued-images/%Y/%m/%d'),
+        ),
+    ]
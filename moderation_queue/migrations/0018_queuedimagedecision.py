@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation_queue', '0017_queuedimage_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedImageDecision',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('decision', models.CharField(max_length=32, choices=[('approved', 'Approved'), ('rejected', 'Rejected'), ('undecided', 'Undecided'), ('ignore', 'Ignore')])),
+                ('moderator_why_allowed', models.CharField(max_length=64, blank=True)),
+                ('make_primary', models.BooleanField(default=False)),
+                ('email_subject', models.TextField()),
+                ('email_message', models.TextField()),
+                ('email_from', models.CharField(max_length=254)),
+                ('email_recipients', models.TextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('queued_image', models.ForeignKey(to='moderation_queue.QueuedImage')),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0046_loggedactionupdate'),
+        ('moderation_queue', '0018_queuedimagedecision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedimagedecision',
+            name='logged_action',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='candidates.LoggedAction', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('moderation_queue', '0019_queuedimagedecision_logged_action'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedimagedecision',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='queuedimagedecision',
+            name='image_stored',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='queuedimagedecision',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -1,16 +1,33 @@
 from __future__ import unicode_literals
 
+from io import BytesIO
+import traceback
+
 from django.contrib.auth.models import User
+from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.utils.translation import ugettext_lazy as _
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.utils.translation import ugettext, ugettext_lazy as _
+
+from PIL import Image as PillowImage
 
 from popolo.models import Person
 
+from candidates.models import ImageExtra, LoggedAction, LoggedActionUpdate
+from candidates.models.image_store import (
+    StoredImage, content_addressed_storage
+)
+
 from compat import python_2_unicode_compatible
 
 PHOTO_REVIEWERS_GROUP_NAME = 'Photo Reviewers'
 
+# How many times to try carrying out a moderation decision before
+# leaving it for someone to look at:
+MAX_DECISION_ATTEMPTS = 5
+
 
 class CopyrightOptions:
     PUBLIC_DOMAIN = 'public-domain'
@@ -63,6 +80,7 @@ class QueuedImage(models.Model):
     image = models.ImageField(
         upload_to='queued-images/%Y/%m/%d',
         max_length=512,
+        storage=content_addressed_storage,
     )
     person = models.ForeignKey(Person, blank=True, null=True)
     user = models.ForeignKey(User, blank=True, null=True)
@@ -91,3 +109,163 @@ class QueuedImage(models.Model):
     def has_crop_bounds(self):
         crop_fields = ['crop_min_x', 'crop_min_y', 'crop_max_x', 'crop_max_y']
         return not any(getattr(self, c) is None for c in crop_fields)
+
+    def crop_and_store(self, moderator_why_allowed, make_primary):
+        """Add this image, cropped to its crop bounds, to the person's images"""
+        original = PillowImage.open(self.image.path)
+        # Some uploaded images are CYMK, which gives you an error when
+        # you try to write them as PNG, so convert to RGBA (this is
+        # RGBA rather than RGB so that any alpha channel (transparency)
+        # is preserved).
+        original = original.convert('RGBA')
+        cropped = original.crop([
+            self.crop_min_x, self.crop_min_y, self.crop_max_x, self.crop_max_y
+        ])
+        # The cropped image is kept in memory; if exactly the same
+        # image has been stored before, it isn't written again:
+        cropped_file = BytesIO()
+        cropped.save(cropped_file, 'PNG')
+        source = ugettext(
+            'Uploaded by {uploaded_by}: Approved from photo moderation queue'
+        ).format(uploaded_by=self.user.username)
+        return ImageExtra.objects.create_from_content(
+            cropped_file,
+            '{0}.png'.format(self.person_id),
+            base_kwargs={
+                'source': source,
+                'is_primary': make_primary,
+                'content_object': self.person.extra,
+            },
+            extra_kwargs={
+                'uploading_user': self.user,
+                'user_notes': self.justification_for_use,
+                'copyright': moderator_why_allowed,
+                'user_copyright': self.why_allowed,
+                'notes': ugettext('Approved from photo moderation queue'),
+            },
+        )
+
+
+class QueuedImageDecisionQuerySet(models.QuerySet):
+
+    def process(self, max_attempts=MAX_DECISION_ATTEMPTS):
+        """Carry out the work left from moderators' decisions
+
+        Each decision is carried out in two steps: first an approved
+        image is cropped and stored, and once that's committed the
+        email is sent and the decision is removed.  Each step is done
+        in its own transaction, with the decision's row locked so that
+        two processes don't both do it.  If a step fails, the error is
+        recorded on the decision and it's retried on later runs (up to
+        max_attempts times in all), without holding up the others.
+        Returns the number of decisions carried out."""
+        done = 0
+        tried = set()
+        while True:
+            pk = self.filter(attempts__lt=max_attempts) \
+                .exclude(pk__in=tried) \
+                .order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                return done
+            tried.add(pk)
+            decision = self.attempt(pk, 'store_image')
+            if decision is None:
+                continue
+            # Now that the new image has been committed, update what
+            # depends on the person's data (if this fails, the
+            # candidates_process_logged_actions command will do it):
+            if decision.image_stored and decision.logged_action_id:
+                LoggedActionUpdate.objects.process(
+                    [decision.logged_action_id])
+            if self.attempt(pk, 'send_email') is not None:
+                done += 1
+
+    def attempt(self, pk, method_name):
+        """Call a method of a decision with its row locked
+
+        Returns the decision if that succeeded, or None if it failed
+        (in which case the error is recorded) or the decision has gone."""
+        with transaction.atomic():
+            decision = self.select_for_update().filter(pk=pk).first()
+            if decision is None:
+                return None
+            try:
+                with transaction.atomic():
+                    getattr(decision, method_name)()
+            except Exception:
+                self.filter(pk=pk).update(
+                    attempts=F('attempts') + 1,
+                    last_error=traceback.format_exc(),
+                )
+                return None
+        return decision
+
+
+class QueuedImageDecision(models.Model):
+    """Work left to do after a moderator's decision on a queued image
+
+    The decision itself is recorded straight away, but cropping and
+    storing an approved image and emailing the person who uploaded it
+    are done later (by moderation_queue_process_decisions), so that
+    moderators don't have to wait for them before the next image."""
+
+    queued_image = models.ForeignKey(QueuedImage)
+    # The action logged when the decision was made:
+    logged_action = models.ForeignKey(
+        LoggedAction, blank=True, null=True, on_delete=models.SET_NULL)
+    decision = models.CharField(
+        max_length=32,
+        choices=QueuedImage.DECISION_CHOICES,
+    )
+    moderator_why_allowed = models.CharField(max_length=64, blank=True)
+    make_primary = models.BooleanField(default=False)
+    email_subject = models.TextField()
+    email_message = models.TextField()
+    email_from = models.CharField(max_length=254)
+    # One address per line:
+    email_recipients = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    # Whether an approved image has been cropped and stored yet:
+    image_stored = models.BooleanField(default=False)
+    # How many times carrying out the decision has failed, and why it
+    # last did:
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = QueuedImageDecisionQuerySet.as_manager()
+
+    def store_image(self):
+        if self.decision != QueuedImage.APPROVED or self.image_stored:
+            return
+        self.queued_image.crop_and_store(
+            self.moderator_why_allowed, self.make_primary)
+        if self.logged_action_id:
+            # The person's CSV rows and last_changed time were updated
+            # for the approval before the image was there, so queue
+            # that to be done again:
+            LoggedActionUpdate.objects.create(
+                logged_action_id=self.logged_action_id)
+        self.image_stored = True
+        self.save(update_fields=['image_stored'])
+
+    def send_email(self):
+        """Email the uploader, and remove this decision
+
+        This is only done once any image has been stored, so that
+        failing to send the email doesn't lose it."""
+        send_mail(
+            self.email_subject,
+            self.email_message,
+            self.email_from,
+            self.email_recipients.splitlines(),
+            fail_silently=False,
+        )
+        self.delete()
+
+
+def release_stored_image(sender, instance, **kwargs):
+    if instance.image:
+        StoredImage.objects.release(instance.image.name)
+
+
+post_delete.connect(release_stored_image, sender=QueuedImage)
@@ -0,0 +1,181 @@
+from __future__ import unicode_literals
+
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from mock import patch
+from PIL import Image
+
+from candidates.tests.output import capture_output, split_output
+from mysite.helpers import mkdir_p
+
+from ..faces import face_crop_bounds
+from ..models import QueuedImage
+
+# detectFaces returns a sequence of ((x, y, width, height), neighbours)
+# for each face it finds.
+
+
+class TestFaceCropBounds(TestCase):
+
+    @patch('moderation_queue.faces.detectFaces')
+    def test_small_image_not_scaled(self, mock_detect_faces):
+        im = Image.new('RGB', (400, 300))
+        mock_detect_faces.return_value = [((100, 50, 100, 100), 3)]
+        self.assertEqual(face_crop_bounds(im, 1024), [60, 10, 240, 190])
+        mock_detect_faces.assert_called_once_with(im)
+
+    @patch('moderation_queue.faces.detectFaces')
+    def test_bounds_scaled_back_up(self, mock_detect_faces):
+        im = Image.new('RGB', (4096, 2048))
+        mock_detect_faces.return_value = [((100, 50, 200, 100), 3)]
+        # Found at a quarter of the size, so padded by 0.4 of each side
+        # at full size:
+        self.assertEqual(
+            face_crop_bounds(im, 1024), [80, 40, 1520, 760])
+        scaled_im = mock_detect_faces.call_args[0][0]
+        self.assertEqual(scaled_im.size, (1024, 512))
+
+    @patch('moderation_queue.faces.detectFaces')
+    def test_padding_clamped_to_image(self, mock_detect_faces):
+        im = Image.new('RGB', (4096, 2048))
+        mock_detect_faces.return_value = [((10, 10, 1000, 500), 3)]
+        self.assertEqual(face_crop_bounds(im, 1024), [0, 0, 4095, 2047])
+
+    @patch('moderation_queue.faces.detectFaces')
+    def test_largest_face_used(self, mock_detect_faces):
+        im = Image.new('RGB', (4096, 2048))
+        mock_detect_faces.return_value = [
+            ((10, 10, 20, 20), 3),
+            ((500, 200, 50, 50), 3),
+        ]
+        self.assertEqual(
+            face_crop_bounds(im, 1024), [1920, 720, 2280, 1080])
+
+    @patch('moderation_queue.faces.detectFaces')
+    def test_no_faces(self, mock_detect_faces):
+        mock_detect_faces.return_value = []
+        im = Image.new('RGB', (4096, 2048))
+        self.assertIsNone(face_crop_bounds(im, 1024))
+
+
+def fake_detect_faces(im):
+    # The images with a face in them are wider than they are tall:
+    if im.size[0] > im.size[1]:
+        return [((100, 50, 100, 100), 3)]
+    return []
+
+
+class DetectFacesCommandMixin(object):
+
+    def setUp(self):
+        super(DetectFacesCommandMixin, self).setUp()
+        self.media_root = mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root
+        )
+        self.settings_override.enable()
+        mkdir_p(join(self.media_root, 'queued-images'))
+        self.with_face = self.create_queued_image('face.png', (400, 300))
+        self.without_face = self.create_queued_image('no-face.png', (300, 300))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        rmtree(self.media_root)
+        super(DetectFacesCommandMixin, self).tearDown()
+
+    def create_queued_image(self, filename, size):
+        name = join('queued-images', filename)
+        Image.new('RGB', size).save(join(self.media_root, name))
+        return QueuedImage.objects.create(
+            why_allowed='public-domain',
+            justification_for_use='Just testing',
+            image=name,
+        )
+
+    def run_command(self, **options):
+        with capture_output() as (out, err):
+            call_command(
+                'moderation_queue_detect_faces_in_queued_images',
+                verbosity=0,
+                **options
+            )
+        return split_output(out), split_output(err)
+
+    def assert_faces_detected(self):
+        with_face = QueuedImage.objects.get(pk=self.with_face.pk)
+        self.assertTrue(with_face.face_detection_tried)
+        self.assertEqual(
+            [with_face.crop_min_x, with_face.crop_min_y,
+             with_face.crop_max_x, with_face.crop_max_y],
+            [60, 10, 240, 190]
+        )
+        without_face = QueuedImage.objects.get(pk=self.without_face.pk)
+        self.assertTrue(without_face.face_detection_tried)
+        self.assertIsNone(without_face.crop_min_x)
+
+
+@patch('moderation_queue.faces.detectFaces', side_effect=fake_detect_faces)
+class TestDetectFacesCommand(DetectFacesCommandMixin, TestCase):
+
+    def test_detect_faces(self, mock_detect_faces):
+        out, err = self.run_command()
+        self.assert_faces_detected()
+        self.assertEqual(
+            out, ["Couldn't find a face in {0}".format(self.without_face)])
+        self.assertEqual(err, [])
+        # They're not looked at again:
+        mock_detect_faces.reset_mock()
+        self.run_command()
+        self.assertFalse(mock_detect_faces.called)
+
+    def test_results_saved_in_batches(self, mock_detect_faces):
+        self.create_queued_image('another-face.png', (500, 300))
+        self.create_queued_image('another-no-face.png', (200, 300))
+        self.run_command(batch_size=1)
+        self.assert_faces_detected()
+        self.assertEqual(
+            QueuedImage.objects.filter(face_detection_tried=False).count(),
+            0
+        )
+
+    def test_decided_images_skipped(self, mock_detect_faces):
+        self.with_face.decision = 'approved'
+        self.with_face.save()
+        self.run_command()
+        self.assertEqual(mock_detect_faces.call_count, 1)
+        self.assertFalse(
+            QueuedImage.objects.get(pk=self.with_face.pk).face_detection_tried)
+
+    def test_unreadable_image(self, mock_detect_faces):
+        unreadable = QueuedImage.objects.create(
+            why_allowed='public-domain',
+            justification_for_use='Just testing',
+            image='queued-images/missing.png',
+        )
+        out, err = self.run_command()
+        self.assertEqual(len(err), 1)
+        self.assertTrue(err[0].startswith(
+            "Couldn't read the image {0}: ".format(unreadable)))
+        self.assertFalse(
+            QueuedImage.objects.get(pk=unreadable.pk).face_detection_tried)
+        # The others are still done:
+        self.assert_faces_detected()
+
+
+@patch('moderation_queue.faces.detectFaces', side_effect=fake_detect_faces)
+class TestDetectFacesCommandWorkers(
+        DetectFacesCommandMixin, TransactionTestCase):
+
+    # The worker processes are forked after the database connection is
+    # closed, which can't happen inside a TestCase's transaction:
+    serialized_rollback = True
+
+    def test_workers(self, mock_detect_faces):
+        self.run_command(workers=2)
+        self.assert_faces_detected()
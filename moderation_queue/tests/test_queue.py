@@ -10,9 +10,11 @@ from shutil import rmtree
 from django.contrib.auth.models import User, Group
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.storage import FileSystemStorage
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
+from django.utils import timezone
 from django.utils.six.moves.urllib_parse import urlsplit
 
 from usersettings.shortcuts import get_current_usersettings
@@ -24,8 +26,11 @@ from webtest import Upload
 from mock import patch
 
 from popolo.models import Person
-from ..models import QueuedImage, PHOTO_REVIEWERS_GROUP_NAME
-from candidates.models import LoggedAction, ImageExtra
+from ..models import (
+    MAX_DECISION_ATTEMPTS, QueuedImage, QueuedImageDecision,
+    PHOTO_REVIEWERS_GROUP_NAME
+)
+from candidates.models import LoggedAction, LoggedActionUpdate, ImageExtra
 from mysite.helpers import mkdir_p
 
 from candidates.tests.factories import (
@@ -209,6 +214,13 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
         link_url = a['href']
         self.assertEqual(link_text, 'Review')
         self.assertEqual(link_url, '/moderation/photo/review/{0}'.format(self.q1.id))
+        # The first images to review are prefetched:
+        prefetched = [
+            link['href'] for link in response.html.find_all('link')
+            if 'prefetch' in link.get('rel', [])
+        ]
+        self.assertIn(link_url, prefetched)
+        self.assertIn(self.q1.image.url, prefetched)
 
     def test_photo_review_view_unprivileged(self):
         review_url = reverse(
@@ -231,7 +243,7 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
         self.assertEqual(response.status_code, 200)
         # For the moment this is just a smoke test...
 
-    @patch('moderation_queue.views.send_mail')
+    @patch('moderation_queue.models.send_mail')
     def test_photo_review_upload_approved_privileged(
             self,
             mock_send_mail
@@ -258,6 +270,23 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
             split_location = urlsplit(response.location)
             self.assertEqual('/moderation/photo/review', split_location.path)
 
+            # The decision is recorded straight away, but the image is
+            # only cropped and stored, and the email sent, later:
+            self.assertEqual(
+                QueuedImage.objects.get(pk=self.q1.id).decision, 'approved')
+            self.assertEqual(mock_send_mail.call_count, 0)
+            self.assertFalse(
+                Person.objects.get(id=2009).extra.images.exists())
+            before_processing = timezone.now()
+            call_command('moderation_queue_process_decisions', verbosity=0)
+            self.assertFalse(QueuedImageDecision.objects.exists())
+            # The person is marked as changed once the image is there:
+            self.assertFalse(LoggedActionUpdate.objects.exists())
+            self.assertGreaterEqual(
+                Person.objects.get(id=2009).extra.last_changed,
+                before_processing
+            )
+
             mock_send_mail.assert_called_once_with(
                 'YNR image upload approved',
                 "Thank-you for submitting a photo to YNR; that's been uploaded\nnow for the candidate page here:\n\n  http://localhost:80/person/2009/tessa-jowell\n\nMany thanks from the YNR volunteers\n",
@@ -289,7 +318,7 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
 
             self.assertEqual(QueuedImage.objects.get(pk=self.q1.id).decision, 'approved')
 
-    @patch('moderation_queue.views.send_mail')
+    @patch('moderation_queue.models.send_mail')
     def test_photo_review_upload_rejected_privileged(
             self,
             mock_send_mail
@@ -325,6 +354,9 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
             self.assertEqual(la.source, 'Rejected a photo upload from john')
             self.assertEqual(la.note, 'There\'s no clear source or copyright statement')
 
+            self.assertEqual(mock_send_mail.call_count, 0)
+            call_command('moderation_queue_process_decisions', verbosity=0)
+
             mock_send_mail.assert_called_once_with(
                 'YNR image moderation results',
                 "Thank-you for uploading a photo of Tessa Jowell to YNR, but\nunfortunately we can't use that image because:\n\n  There\'s no clear source or copyright statement\n\nYou can just reply to this email if you want to discuss that\nfurther, or you can try uploading a photo with a different\nreason or justification for its use using this link:\n\n  http://localhost:80/moderation/photo/upload/2009\n\nMany thanks from the YNR volunteers\n\n-- \nFor administrators' use: http://localhost:80/moderation/photo/review/{0}\n".format(self.q1.id),
@@ -335,7 +367,57 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
 
             self.assertEqual(QueuedImage.objects.get(pk=self.q1.id).decision, 'rejected')
 
-    @patch('moderation_queue.views.send_mail')
+    def create_decision(self, queued_image):
+        return QueuedImageDecision.objects.create(
+            queued_image=queued_image,
+            decision=queued_image.decision,
+            make_primary=True,
+            email_subject='Your photo',
+            email_message='Thanks',
+            email_from='admins@example.com',
+            email_recipients='john@example.com',
+        )
+
+    @patch('moderation_queue.models.send_mail')
+    def test_failing_decision_doesnt_block_others(self, mock_send_mail):
+        # q2 was approved without crop bounds, so can't be cropped:
+        failing = self.create_decision(self.q2)
+        self.create_decision(self.q3)
+        self.assertEqual(QueuedImageDecision.objects.process(), 1)
+        self.assertEqual(mock_send_mail.call_count, 1)
+        failing.refresh_from_db()
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn('Traceback', failing.last_error)
+        # It's retried on later runs, but only so many times:
+        for i in range(MAX_DECISION_ATTEMPTS + 1):
+            QueuedImageDecision.objects.process()
+        failing.refresh_from_db()
+        self.assertEqual(failing.attempts, MAX_DECISION_ATTEMPTS)
+        self.assertEqual(mock_send_mail.call_count, 1)
+
+    @patch('moderation_queue.models.send_mail')
+    def test_failing_email_keeps_stored_image(self, mock_send_mail):
+        mock_send_mail.side_effect = [Exception('No mail server'), None]
+        self.q1.decision = 'approved'
+        self.q1.crop_min_x = 0
+        self.q1.crop_min_y = 0
+        self.q1.crop_max_x = 100
+        self.q1.crop_max_y = 100
+        self.q1.save()
+        decision = self.create_decision(self.q1)
+        self.assertEqual(QueuedImageDecision.objects.process(), 0)
+        decision.refresh_from_db()
+        self.assertTrue(decision.image_stored)
+        self.assertEqual(decision.attempts, 1)
+        person_extra = Person.objects.get(id=2009).extra
+        self.assertEqual(person_extra.images.count(), 1)
+        # Only the email is retried:
+        self.assertEqual(QueuedImageDecision.objects.process(), 1)
+        self.assertFalse(QueuedImageDecision.objects.exists())
+        self.assertEqual(person_extra.images.count(), 1)
+        self.assertEqual(mock_send_mail.call_count, 2)
+
+    @patch('moderation_queue.models.send_mail')
     def test_photo_review_upload_undecided_privileged(
             self,
             mock_send_mail
@@ -363,7 +445,7 @@ class PhotoReviewTests(SettingsMixin, UK2015ExamplesMixin, WebTest):
 
         self.assertEqual(QueuedImage.objects.get(pk=self.q1.id).decision, 'undecided')
 
-    @patch('moderation_queue.views.send_mail')
+    @patch('moderation_queue.models.send_mail')
     def test_photo_review_upload_ignore_privileged(
             self,
             mock_send_mail
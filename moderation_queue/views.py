@@ -2,14 +2,11 @@ from __future__ import unicode_literals
 
 import bleach
 import re
-from os.path import join
-from tempfile import NamedTemporaryFile
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.models import Site
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.core.urlresolvers import reverse
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
@@ -18,20 +15,22 @@ from django.utils.http import urlquote
 from django.utils.translation import ugettext as _
 from django.views.generic import ListView, TemplateView
 
-from PIL import Image as PillowImage
-
 from auth_helpers.views import GroupRequiredMixin
-from candidates.management.images import get_file_md5sum
 
 from .forms import UploadPersonPhotoForm, PhotoReviewForm
-from .models import QueuedImage, PHOTO_REVIEWERS_GROUP_NAME
+from .models import (
+    QueuedImage, QueuedImageDecision, PHOTO_REVIEWERS_GROUP_NAME
+)
 
-from candidates.models import LoggedAction, ImageExtra, PersonExtra
+from candidates.models import LoggedAction
 from candidates.views.version_data import get_client_ip, get_change_metadata
 
 from popolo.models import Person
 from images.models import Image
 
+# How many of the next images in the queue to prefetch when reviewing:
+NEXT_IMAGES_TO_PREFETCH = 3
+
 @login_required
 def upload_photo(request, person_id):
     person = get_object_or_404(Person, id=person_id)
@@ -93,6 +92,7 @@ class PhotoReviewList(GroupRequiredMixin, ListView):
     def get_queryset(self):
         return QueuedImage.objects. \
             filter(decision='undecided'). \
+            select_related('user', 'person'). \
             order_by('created')
 
 
@@ -174,6 +174,14 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
             }
         )
         context['guessed_crop_bounds'] = guessed_crop_bounds
+        # The browser fetches the next few images in the queue while the
+        # moderator looks at this one, so that they appear straight away:
+        context['next_queued_images'] = QueuedImage.objects.filter(
+            decision='undecided',
+            created__gte=self.queued_image.created,
+        ).exclude(
+            pk=self.queued_image.pk
+        ).order_by('created')[:NEXT_IMAGES_TO_PREFETCH]
         context['why_allowed'] = self.queued_image.why_allowed
         context['moderator_why_allowed'] = self.queued_image.why_allowed
         # There are often source links supplied in the justification,
@@ -198,52 +206,25 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
         context['person'] = person
         return context
 
-    def send_mail(self, subject, message, email_support_too=False):
+    def queue_decision(
+            self, subject, message, email_support_too=False, **kwargs
+    ):
+        """Leave the slower work for this decision to be done later
+
+        That's sending the email (subject, message) to the person who
+        uploaded the image, and for approved images cropping and
+        storing it."""
         recipients = [self.queued_image.user.email]
         if email_support_too:
             recipients.append(self.request.usersettings.SUPPORT_EMAIL)
-        return send_mail(
-            subject,
-            message,
-            self.request.usersettings.DEFAULT_FROM_EMAIL,
-            recipients,
-            fail_silently=False,
-        )
-
-    def crop_and_upload_image_to_popit(self, image_filename, crop_bounds, moderator_why_allowed, make_primary):
-        original = PillowImage.open(image_filename)
-        # Some uploaded images are CYMK, which gives you an error when
-        # you try to write them as PNG, so convert to RGBA (this is
-        # RGBA rather than RGB so that any alpha channel (transparency)
-        # is preserved).
-        person_id = self.queued_image.person.id
-        person_extra = PersonExtra.objects.get(base__id=person_id)
-        original = original.convert('RGBA')
-        cropped = original.crop(crop_bounds)
-        ntf = NamedTemporaryFile(delete=False)
-        cropped.save(ntf.name, 'PNG')
-        md5sum = get_file_md5sum(ntf.name)
-        filename = str(person_id) + '.png'
-        source = _(
-            'Uploaded by {uploaded_by}: Approved from photo moderation queue'
-        ).format(uploaded_by=self.queued_image.user.username)
-
-        ImageExtra.objects.create_from_file(
-            ntf.name,
-            join('images', filename),
-            base_kwargs={
-                'source': source,
-                'is_primary': make_primary,
-                'content_object': person_extra,
-            },
-            extra_kwargs={
-                'md5sum': md5sum,
-                'uploading_user': self.queued_image.user,
-                'user_notes': self.queued_image.justification_for_use,
-                'copyright': moderator_why_allowed,
-                'user_copyright': self.queued_image.why_allowed,
-                'notes': _('Approved from photo moderation queue'),
-            },
+        QueuedImageDecision.objects.create(
+            queued_image=self.queued_image,
+            decision=self.queued_image.decision,
+            email_subject=subject,
+            email_message=message,
+            email_from=self.request.usersettings.DEFAULT_FROM_EMAIL,
+            email_recipients='\n'.join(recipients),
+            **kwargs
         )
 
     def form_valid(self, form):
@@ -270,21 +251,15 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
                 extra_tags='safe photo-review'
             )
         if decision == 'approved':
-            # Crop the image...
-            crop_fields = ('x_min', 'y_min', 'x_max', 'y_max')
-            self.crop_and_upload_image_to_popit(
-                self.queued_image.image.path,
-                [form.cleaned_data[e] for e in crop_fields],
-                form.cleaned_data['moderator_why_allowed'],
-                form.cleaned_data['make_primary'],
-            )
+            # The image is cropped to these bounds later:
             self.queued_image.decision = 'approved'
-            for i, field in enumerate(crop_fields):
-                setattr(
-                    self.queued_image,
-                    'crop_' + field,
-                    form.cleaned_data[field]
-                )
+            for axis in ('x', 'y'):
+                for end in ('min', 'max'):
+                    setattr(
+                        self.queued_image,
+                        'crop_{0}_{1}'.format(end, axis),
+                        form.cleaned_data['{0}_{1}'.format(axis, end)]
+                    )
             self.queued_image.save()
             update_message = _('Approved a photo upload from '
                 '{uploading_user} who provided the message: '
@@ -299,7 +274,7 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
             person_extra.record_version(change_metadata)
             person_extra.save()
             person.save()
-            LoggedAction.objects.create(
+            logged_action = LoggedAction.objects.create(
                 user=self.request.user,
                 action_type='photo-approve',
                 ip_address=get_client_ip(self.request),
@@ -308,7 +283,7 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
                 source=update_message,
             )
             candidate_full_url = person_extra.get_absolute_url(self.request)
-            self.send_mail(
+            self.queue_decision(
                 _('{site_name} image upload approved').format(
                     site_name=site_name
                 ),
@@ -327,6 +302,9 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
                         ).format(site_name=site_name),
                     }
                 ),
+                logged_action=logged_action,
+                moderator_why_allowed=form.cleaned_data['moderator_why_allowed'],
+                make_primary=form.cleaned_data['make_primary'],
             )
             flash(
                 messages.SUCCESS,
@@ -354,7 +332,7 @@ class PhotoReview(GroupRequiredMixin, TemplateView):
                     kwargs={'person_id': self.queued_image.person.id}
                 )
             )
-            self.send_mail(
+            self.queue_decision(
                 _('{site_name} image moderation results').format(
                     site_name=Site.objects.get_current().name
                 ),
@@ -178,7 +178,9 @@ def get_settings(conf_file_leafname, election_app=None, tests=False):
             'KEY_PREFIX': databases['default']['NAME'],
         }
         cache_thumbnails = {
-            'TIMEOUT': 60 * 60 * 24 * 2, # expire after two days
+            # Thumbnails' names depend on their source files' contents,
+            # so what's cached about them never goes out of date:
+            'TIMEOUT': None,
             'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
             'LOCATION': '127.0.0.1:11211',
             'KEY_PREFIX': databases['default']['NAME'] + "-thumbnails",
@@ -190,6 +192,13 @@ def get_settings(conf_file_leafname, election_app=None, tests=False):
         'ALLOWED_HOSTS': conf.get('ALLOWED_HOSTS'),
         'DEBUG': debug,
         'RUNNING_TESTS': tests,
+        # Whether to keep CSV files of the candidates for each post and
+        # election in storage, updated whenever an edit is logged:
+        'PRECOMPUTED_CSV_ENABLED': not tests,
+        # How long ago logged actions must have been created to be
+        # listed in the API's changes feed; see ChangesViewSet:
+        'CHANGES_FEED_SETTLE_SECONDS': conf.get(
+            'CHANGES_FEED_SETTLE_SECONDS', 10),
 
         # Email addresses that error emails are sent to when DEBUG = False
         'ADMINS': conf['ADMINS'],
@@ -236,7 +245,6 @@ def get_settings(conf_file_leafname, election_app=None, tests=False):
             'rest_framework',
             'rest_framework.authtoken',
             'images',
-            'haystack',
             'elections',
             'popolo',
             election_app_fully_qualified,
@@ -280,6 +288,9 @@ def get_settings(conf_file_leafname, election_app=None, tests=False):
             'django.middleware.clickjacking.XFrameOptionsMiddleware',
             'usersettings.middleware.CurrentUserSettingsMiddleware',
             'candidates.middleware.DisableCachingForAuthenticatedUsers',
+            'candidates.middleware.PersonSearchUpdateMiddleware',
+            'candidates.middleware.LoggedActionUpdateMiddleware',
+            'candidates.middleware.PostCacheMiddleware',
         ),
 
         # django-allauth settings:
@@ -470,16 +481,6 @@ def get_settings(conf_file_leafname, election_app=None, tests=False):
         # allow attaching extra data to notifications:
         'NOTIFICATIONS_USE_JSONFIELD': True,
 
-        'HAYSTACK_SIGNAL_PROCESSOR': 'haystack.signals.RealtimeSignalProcessor',
-
-        'HAYSTACK_CONNECTIONS': {
-            'default': {
-                'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
-                'URL': 'http://127.0.0.1:9200/',
-                'INDEX_NAME': '{0}_{1}'.format(conf.get('YNMP_DB_NAME'), conf.get('YNMP_DB_HOST')),
-            },
-        },
-
         # CORS config
         'CORS_ORIGIN_ALLOW_ALL': True,
         'CORS_URLS_REGEX': r'^/(api|upcoming-elections)/.*$',
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 import os
 
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 
 from popolo.models import Post
@@ -53,3 +54,13 @@ class OfficialDocument(TimeStampedModel):
     @models.permalink
     def get_absolute_url(self):
         return ('uploaded_document_view', (), {'pk': self.pk})
+
+
+def mark_post_changed(sender, instance, **kwargs):
+    # The documents for a post are listed on its page:
+    from candidates.last_changed import mark_posts_changed
+    if instance.post_id:
+        mark_posts_changed([instance.post_id])
+
+post_save.connect(mark_post_changed, sender=OfficialDocument)
+post_delete.connect(mark_post_changed, sender=OfficialDocument)